@@ -1,2 +1,19 @@
-def main() -> None:
-    print("Hello from arucomarker!")
+from .calibrate import (
+    CharucoCollector,
+    calibrate,
+    generate_board,
+    iter_frames,
+    main,
+    make_board,
+    save_calibration,
+)
+
+__all__ = [
+    "CharucoCollector",
+    "calibrate",
+    "generate_board",
+    "iter_frames",
+    "main",
+    "make_board",
+    "save_calibration",
+]
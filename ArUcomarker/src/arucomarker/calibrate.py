@@ -0,0 +1,211 @@
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+aruco = cv2.aruco
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def make_board(squares=(7, 5), square_len=0.04, marker_len=0.03, dictionary_name=aruco.DICT_4X4_50):
+    """ChArUco ボード（squares=(横, 縦) のマス数、長さは m）"""
+    dictionary = aruco.getPredefinedDictionary(dictionary_name)
+    # OpenCVのバージョン差分対応
+    try:
+        return aruco.CharucoBoard(tuple(squares), square_len, marker_len, dictionary)
+    except AttributeError:
+        return aruco.CharucoBoard_create(squares[0], squares[1], square_len, marker_len, dictionary)
+
+
+def generate_board(path, board, px_per_square=120, margin_px=40):
+    """印刷用のボード画像を保存する（opcv_outputARmark01.py のボード版）"""
+    sx, sy = board.getChessboardSize()
+    size = (sx * px_per_square + 2 * margin_px, sy * px_per_square + 2 * margin_px)
+    try:
+        img = board.generateImage(size, marginSize=margin_px)
+    except AttributeError:
+        img = board.draw(size, marginSize=margin_px)
+    cv2.imwrite(path, img)
+    return img
+
+
+def iter_frames(source, step=1):
+    """動画ファイル or 画像ディレクトリから step 枚おきに BGR フレームを出す"""
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTS))
+        for i, name in enumerate(names):
+            if i % step:
+                continue
+            img = cv2.imread(os.path.join(source, name))
+            if img is not None:
+                yield img
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"cannot open {source}")
+    i = 0
+    try:
+        while True:
+            ok = cap.grab()
+            if not ok:
+                break
+            if i % step == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    yield frame
+            i += 1
+    finally:
+        cap.release()
+
+
+class CharucoCollector:
+    """フレームごとに ChArUco の角を検出して、キャリブレーション用の対応点をためる"""
+
+    def __init__(self, board, min_corners=8):
+        self.board = board
+        self.min_corners = min_corners
+        self.obj_points = []
+        self.img_points = []
+        self.image_size = None
+        self.seen = 0
+        # CharucoDetector / matchImagePoints は OpenCV 4.7 以降（pyproject で 4.12 以上）
+        self._detector = aruco.CharucoDetector(board)
+
+    def _detect(self, gray):
+        ch_corners, ch_ids, _, _ = self._detector.detectBoard(gray)
+        return ch_corners, ch_ids
+
+    def add(self, frame):
+        """使えたら True"""
+        self.seen += 1
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        size = (gray.shape[1], gray.shape[0])
+        if self.image_size is None:
+            self.image_size = size
+        elif size != self.image_size:
+            return False
+
+        ch_corners, ch_ids = self._detect(gray)
+        if ch_ids is None or len(ch_ids) < self.min_corners:
+            return False
+
+        obj, img = self.board.matchImagePoints(ch_corners, ch_ids)
+        if obj is None or len(obj) < self.min_corners:
+            return False
+        self.obj_points.append(obj.astype(np.float32))
+        self.img_points.append(img.astype(np.float32))
+        return True
+
+    def __len__(self):
+        return len(self.obj_points)
+
+
+def _pick_evenly(items, n):
+    if n is None or len(items) <= n:
+        return list(range(len(items)))
+    return np.linspace(0, len(items) - 1, n).round().astype(int).tolist()
+
+
+def calibrate(collector, max_views=60):
+    """
+    ためた対応点からカメラ行列と歪み係数を求める。
+    Returns: (rms, camera_matrix, dist_coeffs, per_view_errors)
+    """
+    if len(collector) < 4:
+        raise ValueError(f"need at least 4 usable views, got {len(collector)}")
+    idx = _pick_evenly(collector.obj_points, max_views)
+    obj = [collector.obj_points[i] for i in idx]
+    img = [collector.img_points[i] for i in idx]
+
+    rms, K, dist, rvecs, tvecs = cv2.calibrateCamera(obj, img, collector.image_size, None, None)
+
+    errors = []
+    for o, p, r, t in zip(obj, img, rvecs, tvecs):
+        proj, _ = cv2.projectPoints(o, r, t, K, dist)
+        errors.append(float(np.sqrt(np.mean(np.sum((proj.reshape(-1, 2) - p.reshape(-1, 2)) ** 2, axis=1)))))
+    return rms, K, dist, errors
+
+
+def save_calibration(path, camera_matrix, dist_coeffs, image_size, rms=None, board=None):
+    """
+    src/marker_pose.load_intrinsics で読める形で保存する。
+      .npz       : camera_matrix, dist_coeffs, image_size（, rms）
+      .yml/.yaml : 同じキーを cv2.FileStorage で
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".yml", ".yaml", ".xml"):
+        fs = cv2.FileStorage(path, cv2.FILE_STORAGE_WRITE)
+        try:
+            fs.write("camera_matrix", np.asarray(camera_matrix, dtype=np.float64))
+            fs.write("dist_coeffs", np.asarray(dist_coeffs, dtype=np.float64))
+            fs.write("image_size", np.asarray(image_size, dtype=np.int32))
+            if rms is not None:
+                fs.write("rms", float(rms))
+        finally:
+            fs.release()
+        return
+
+    extra = {}
+    if rms is not None:
+        extra["rms"] = np.float64(rms)
+    if board is not None:
+        extra["board_squares"] = np.asarray(board.getChessboardSize(), dtype=np.int32)
+        extra["board_square_len"] = np.float64(board.getSquareLength())
+        extra["board_marker_len"] = np.float64(board.getMarkerLength())
+    np.savez(path,
+             camera_matrix=np.asarray(camera_matrix, dtype=np.float64),
+             dist_coeffs=np.asarray(dist_coeffs, dtype=np.float64),
+             image_size=np.asarray(image_size, dtype=np.int32),
+             **extra)
+
+
+def _parse_squares(text):
+    x, y = text.lower().split("x")
+    return int(x), int(y)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="arucomarker", description="ChArUco board / camera calibration")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def board_args(p):
+        p.add_argument("--squares", default="7x5", help="マス数 横x縦")
+        p.add_argument("--square-mm", type=float, default=40.0, help="マスの一辺（印刷後の実寸 mm）")
+        p.add_argument("--marker-mm", type=float, default=30.0, help="マーカーの一辺（印刷後の実寸 mm）")
+
+    pb = sub.add_parser("board", help="印刷用の ChArUco ボード画像を作る")
+    board_args(pb)
+    pb.add_argument("--out", default="charuco.png")
+    pb.add_argument("--px", type=int, default=120, help="1マスのピクセル数")
+
+    pc = sub.add_parser("calibrate", help="動画 / 画像ディレクトリから内部パラメータを求める")
+    board_args(pc)
+    pc.add_argument("source", help="録画ファイル or 画像ディレクトリ")
+    pc.add_argument("--out", default="camera_calib.npz", help=".npz / .yml")
+    pc.add_argument("--step", type=int, default=5, help="何フレームおきに使うか")
+    pc.add_argument("--min-corners", type=int, default=8)
+    pc.add_argument("--max-views", type=int, default=60)
+
+    args = ap.parse_args(argv)
+    board = make_board(_parse_squares(args.squares), args.square_mm / 1000.0, args.marker_mm / 1000.0)
+
+    if args.cmd == "board":
+        generate_board(args.out, board, px_per_square=args.px)
+        print(f"saved {args.out}")
+        return 0
+
+    col = CharucoCollector(board, min_corners=args.min_corners)
+    for frame in iter_frames(args.source, step=max(1, args.step)):
+        col.add(frame)
+    print(f"frames={col.seen} usable={len(col)} size={col.image_size}")
+
+    rms, K, dist, errors = calibrate(col, max_views=args.max_views)
+    save_calibration(args.out, K, dist, col.image_size, rms=rms, board=board)
+    print(f"rms={rms:.3f}px  worst view={max(errors):.3f}px")
+    print(f"fx={K[0, 0]:.1f} fy={K[1, 1]:.1f} cx={K[0, 2]:.1f} cy={K[1, 2]:.1f}")
+    print(f"dist={np.round(dist.reshape(-1), 4).tolist()}")
+    print(f"saved {args.out}")
+    return 0
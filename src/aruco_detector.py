@@ -1,13 +1,32 @@
 # aruco_detector.py
+import time
 import cv2
 from cv2 import aruco
 import numpy as np
 
+import profiling
+
 
 class ArUcoDetector:
     """ArUcoマーカー検出クラス"""
 
-    def __init__(self, dictionary_name=aruco.DICT_4X4_50):
+    # 検出カスケードの段（name, 画像種別, パラメータ種別）
+    CASCADE_STAGES = (
+        ("gray_params", "gray", "params"),
+        ("gray_default", "gray", "default"),
+        ("up_params", "up", "params"),
+        ("up_default", "up", "default"),
+    )
+
+    def __init__(self, dictionary_name=aruco.DICT_4X4_50, mode="pyramid", budget_ms=None, track=True):
+        """
+        mode:
+            "cascade" : グレー化1回 + 事前生成した検出器をヒット率順に試す
+            "pyramid" : 縮小画像から探し、小さい候補だけ部分的に拡大して再検出
+            "legacy"  : 従来の最大6回検出
+        budget_ms: cascade で1フレームに使う時間の上限（None で無制限）
+        track: 直前のマーカー周辺（予測位置）だけを探す（cascade/pyramid）
+        """
         # 辞書を用意
         self.dictionary = aruco.getPredefinedDictionary(dictionary_name)
         # OpenCVのバージョン差分対応
@@ -32,6 +51,335 @@ class ArUcoDetector:
         except Exception:
             self.detector = None
 
+        # ---- cascade ----
+        self.mode = mode
+        self.budget_ms = budget_ms
+        self.up_scale = 1.6
+        self.reorder_every = 30
+        self._build_detectors()
+        self._stage_defs = {name: (img, prm) for name, img, prm in self.CASCADE_STAGES}
+        self._stage_order = [name for name, _, _ in self.CASCADE_STAGES]
+        self._stage_stats = {name: [0, 0, 0.0] for name in self._stage_order}  # tries, hits, ms合計
+        self._frames = 0
+        self.last_stage = None
+        self.budget_cut = 0
+
+        # ---- pyramid ----
+        self.pyr_min_px = 40          # 縮小後にこのくらいの辺長があれば十分読める
+        self.pyr_levels = (0.25, 0.5, 1.0)
+        self.pyr_max_crops = 4        # 部分拡大する候補の最大数
+        self.pyr_crop_pad = 2.0       # 候補の辺長に対する切り出し余白
+        self.last_size_px = None      # get_marker_info が返した直近の size_px
+        self.last_geometry = None     # get_marker_info で計算した全マーカー分の幾何量
+
+        # ---- 姿勢推定（marker_pose.MarkerPoseEstimator を入れると有効） ----
+        self.pose = None
+        self.last_poses = {}          # id -> 姿勢 dict
+
+        # ---- ROI追跡 ----
+        self.track = track
+        self.track_id = None          # 追う ID（None なら先頭の1枚）
+        self.track_max_misses = 5     # ROIでこの回数見失ったら全画面探索に戻す
+        self.track_pad = 0.6          # マーカーサイズに対する余白の割合
+        self.track_min_px = 48
+        self.track_full_every = 0     # 追跡中もこのフレーム数ごとに全画面探索（他の ID も拾う。0 で無効）
+        self._track_quad = None       # 最後に見えた4隅（全画面座標）
+        self._track_target = None     # ROI を合わせた時の track_id（変わったら全画面で探し直す）
+        self._track_vel = np.zeros(2, dtype=np.float32)  # 中心の移動量 px/frame
+        self._track_misses = 0
+        self._track_since_full = 0    # 最後に全画面探索してから ROI で探したフレーム数
+        self.last_roi = None          # 直近に探したROI (x0, y0, x1, y1)
+        self.roi_hits = 0
+        self.roi_misses = 0
+        self.full_searches = 0
+
+    def _build_detectors(self):
+        """パラメータセットごとに ArucoDetector を1回だけ作る"""
+        try:
+            default_params = aruco.DetectorParameters()
+        except AttributeError:
+            default_params = aruco.DetectorParameters_create()
+        self._param_sets = {"params": self.parameters, "default": default_params}
+        self._detectors = {}
+        if hasattr(aruco, "ArucoDetector"):
+            for key, params in self._param_sets.items():
+                try:
+                    self._detectors[key] = aruco.ArucoDetector(self.dictionary, params)
+                except Exception:
+                    pass
+
+    def _run_stage(self, img, param_key):
+        det = self._detectors.get(param_key)
+        if det is not None:
+            return det.detectMarkers(img)
+        return aruco.detectMarkers(img, self.dictionary, parameters=self._param_sets[param_key])
+
+    @staticmethod
+    def _to_gray(frame):
+        if frame.ndim == 3:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame
+
+    def _detect_cascade(self, gray):
+        """
+        グレー画像1枚に対して段を「ヒット率の高い順」に試す。
+        budget_ms を超えたら残りの段は打ち切る。
+        Returns: corners, ids（見つからなければ None, None）
+        """
+        t0 = time.perf_counter()
+        up = None
+        self.last_stage = None
+
+        for i, name in enumerate(self._stage_order):
+            if i > 0 and self.budget_ms is not None:
+                if (time.perf_counter() - t0) * 1000.0 > self.budget_ms:
+                    self.budget_cut += 1
+                    break
+
+            img_kind, param_key = self._stage_defs[name]
+            if img_kind == "up":
+                if up is None:
+                    up = cv2.resize(gray, None, fx=self.up_scale, fy=self.up_scale, interpolation=cv2.INTER_LINEAR)
+                img = up
+            else:
+                img = gray
+
+            ts = time.perf_counter()
+            try:
+                corners, ids, _ = self._run_stage(img, param_key)
+            except Exception:
+                corners = ids = None
+            st = self._stage_stats[name]
+            st[0] += 1
+            st[2] += (time.perf_counter() - ts) * 1000.0
+
+            if ids is not None and len(ids) > 0:
+                st[1] += 1
+                self.last_stage = name
+                if img_kind == "up":
+                    corners = [c / float(self.up_scale) for c in corners]
+                return corners, ids
+
+        return None, None
+
+    def _detect_frame(self, gray):
+        """全画面探索（mode に応じて cascade / pyramid）"""
+        if self.mode == "pyramid":
+            return self._detect_pyramid(gray)
+        return self._detect_cascade(gray)
+
+    # -----------------------
+    # pyramid
+    # -----------------------
+    def _count(self, name, t0, hit):
+        st = self._stage_stats.setdefault(name, [0, 0, 0.0])
+        st[0] += 1
+        st[1] += int(hit)
+        st[2] += (time.perf_counter() - t0) * 1000.0
+
+    def _pyramid_schedule(self):
+        """直近の size_px から最初に見る縮小率を決め、粗→細の順に並べる"""
+        if self.last_size_px is None:
+            start = 0.5
+        else:
+            want = self.pyr_min_px / max(1.0, float(self.last_size_px))
+            fits = [lv for lv in self.pyr_levels if lv >= want]
+            start = fits[0] if fits else 1.0
+        return [lv for lv in self.pyr_levels if lv >= start]
+
+    def _refine(self, gray, corners, scale):
+        """縮小画像で得た4隅をフル解像度で cornerSubPix して戻す"""
+        win = max(2, int(round(1.0 / scale)) + 1)
+        crit = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.01)
+        out = []
+        for c in corners:
+            pts = np.ascontiguousarray((c / float(scale)).reshape(-1, 1, 2), dtype=np.float32)
+            try:
+                cv2.cornerSubPix(gray, pts, (win, win), (-1, -1), crit)
+            except cv2.error:
+                pass
+            out.append(pts.reshape(1, 4, 2))
+        return out
+
+    def _detect_candidates(self, gray, rejected):
+        """
+        読めなかった候補（rejected）の周りだけを切り出して拡大し、再検出する。
+        全画面を up_scale 倍する代わりに、数十px四方の拡大で済ませる。
+        """
+        if rejected is None or len(rejected) == 0:
+            return None, None
+        h, w = gray.shape[:2]
+        quads = [np.asarray(r, dtype=np.float32).reshape(4, 2) for r in rejected]
+        quads.sort(key=lambda q: float(np.ptp(q[:, 0]) + np.ptp(q[:, 1])), reverse=True)
+
+        all_c, all_ids = [], []
+        for q in quads[: self.pyr_max_crops]:
+            side = max(4.0, float(max(np.ptp(q[:, 0]), np.ptp(q[:, 1]))))
+            pad = side * self.pyr_crop_pad
+            x0 = int(max(0, q[:, 0].min() - pad))
+            y0 = int(max(0, q[:, 1].min() - pad))
+            x1 = int(min(w, q[:, 0].max() + pad + 1))
+            y1 = int(min(h, q[:, 1].max() + pad + 1))
+            if x1 - x0 < 4 or y1 - y0 < 4:
+                continue
+            # 拡大しすぎると補間でビットがぼけるので従来と同じ倍率に留める
+            f = self.up_scale
+            crop = cv2.resize(gray[y0:y1, x0:x1], None, fx=f, fy=f, interpolation=cv2.INTER_LINEAR)
+            try:
+                c, i, _ = self._run_stage(crop, "params")
+            except Exception:
+                continue
+            if i is None or len(i) == 0:
+                continue
+            off = np.array([x0, y0], dtype=np.float32)
+            for cc, ii in zip(c, i.flatten().tolist()):
+                if ii in all_ids:
+                    continue
+                all_c.append(cc / float(f) + off)
+                all_ids.append(ii)
+
+        if not all_ids:
+            return None, None
+        return all_c, np.array(all_ids, dtype=np.int32).reshape(-1, 1)
+
+    def _detect_pyramid(self, gray):
+        """
+        縮小画像（近い/大きいマーカー向け）→ フル解像度 → 候補だけ部分拡大、の順に探す。
+        最初の縮小率は直近の size_px で決める。
+        """
+        self.last_stage = None
+        rejected = None
+        for scale in self._pyramid_schedule():
+            t0 = time.perf_counter()
+            if scale < 1.0:
+                img = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            else:
+                img = gray
+            try:
+                corners, ids, rejected = self._run_stage(img, "params")
+            except Exception:
+                corners = ids = rejected = None
+            hit = ids is not None and len(ids) > 0
+            name = f"pyr@{scale:.2f}"
+            self._count(name, t0, hit)
+            if hit:
+                self.last_stage = name
+                if scale < 1.0:
+                    corners = self._refine(gray, corners, scale)
+                return corners, ids
+
+        # フル解像度でも読めなかった候補だけ拡大
+        t0 = time.perf_counter()
+        corners, ids = self._detect_candidates(gray, rejected)
+        self._count("pyr_crop", t0, ids is not None)
+        if ids is not None:
+            self.last_stage = "pyr_crop"
+        return corners, ids
+
+    def _reorder_stages(self):
+        def rate(name):
+            tries, hits, _ = self._stage_stats[name]
+            return (hits + 1.0) / (tries + 2.0)
+        # sorted は安定なので同率なら元の順序を保つ
+        self._stage_order = sorted(self._stage_order, key=rate, reverse=True)
+
+    def stage_report(self):
+        """段ごとの (試行数, ヒット数, 平均ms)"""
+        out = {}
+        for name, (tries, hits, ms) in self._stage_stats.items():
+            out[name] = (tries, hits, ms / tries if tries else 0.0)
+        return out
+
+    # -----------------------
+    # ROI tracking
+    # -----------------------
+    def _predict_roi(self, shape):
+        """前回の4隅 + 速度 から次フレームの探索窓を決める（見失うほど広げる）"""
+        h, w = shape[:2]
+        k = self._track_misses + 1
+        quad = self._track_quad + self._track_vel * k
+        x_min, y_min = quad.min(axis=0)
+        x_max, y_max = quad.max(axis=0)
+        size = max(float(x_max - x_min), float(y_max - y_min), float(self.track_min_px))
+        pad = size * self.track_pad * (1.0 + 0.5 * self._track_misses) + float(np.abs(self._track_vel).max()) * k
+        x0 = int(max(0, x_min - pad))
+        y0 = int(max(0, y_min - pad))
+        x1 = int(min(w, x_max + pad + 1))
+        y1 = int(min(h, y_max + pad + 1))
+        return x0, y0, x1, y1
+
+    def _has_target(self, ids):
+        return ids is not None and (self.track_id is None or self.track_id in ids.flatten().tolist())
+
+    def _update_track(self, ids, corners):
+        ids_flat = ids.flatten().tolist()
+        idx = ids_flat.index(self.track_id) if self.track_id is not None else 0
+        quad = np.asarray(corners[idx], dtype=np.float32).reshape(4, 2)
+
+        if self._track_quad is not None:
+            step = (quad.mean(axis=0) - self._track_quad.mean(axis=0)) / float(self._track_misses + 1)
+            self._track_vel = 0.5 * self._track_vel + 0.5 * step
+        else:
+            self._track_vel[:] = 0.0
+        self._track_quad = quad
+        self._track_misses = 0
+        self._track_target = self.track_id
+
+    def reset_track(self):
+        self._track_quad = None
+        self._track_target = None
+        self._track_vel[:] = 0.0
+        self._track_misses = 0
+
+    def _detect_tracked(self, gray):
+        """
+        追跡中は予測ROIだけをカスケード検出し、4隅を全画面座標に戻す。
+        track_max_misses 回続けて外したら全画面探索に戻る。
+        track_id が変わった時と、ROI に track_id が無かった時（別のマーカーだけ見えた）は
+        その場で全画面探索する。全画面にも track_id が無ければ ROI は張らない（先頭の1枚を追わない）。
+        track_full_every > 0 なら追跡中もその間隔で全画面探索する（ROI の外のマーカーも結果に入る）。
+        この時に track_id が見つからなければ ROI の見失い1回として数え、追跡は続ける。
+        """
+        self.last_roi = None
+        if self._track_quad is not None and self._track_target != self.track_id:
+            self.reset_track()
+        tracking = self._track_quad is not None and self._track_misses < self.track_max_misses
+        if tracking and self.track_full_every and self._track_since_full >= self.track_full_every:
+            self._track_since_full = 0
+            self.full_searches += 1
+            corners, ids = self._detect_frame(gray)
+            if self._has_target(ids):
+                self._update_track(ids, corners)
+            else:
+                self._track_misses += 1
+            return corners, ids
+        if tracking:
+            self._track_since_full += 1
+            x0, y0, x1, y1 = self._predict_roi(gray.shape)
+            self.last_roi = (x0, y0, x1, y1)
+            corners, ids = self._detect_cascade(gray[y0:y1, x0:x1])
+            if self._has_target(ids):
+                off = np.array([x0, y0], dtype=np.float32)
+                corners = [c + off for c in corners]
+                self.roi_hits += 1
+                self._update_track(ids, corners)
+                return corners, ids
+            self.roi_misses += 1
+            if ids is None:
+                self._track_misses += 1
+                return None, None
+            self.reset_track()
+
+        self.full_searches += 1
+        self._track_since_full = 0
+        corners, ids = self._detect_frame(gray)
+        if self._has_target(ids):
+            self._update_track(ids, corners)
+        else:
+            self.reset_track()
+        return corners, ids
+
+    @profiling.profiled("aruco.process")
     def process(self, frame, draw=True, draw_id=True):
         """
         フレームからマーカーを検出し、必要なら描画も行う。
@@ -41,6 +389,31 @@ class ArUcoDetector:
             ids: 検出されたID (Noneのこともある)
             corners: マーカーの頂点座標
         """
+        if self.mode == "legacy":
+            corners, ids = self._detect_legacy(frame)
+        else:
+            gray = self._to_gray(frame)
+            if self.track:
+                corners, ids = self._detect_tracked(gray)
+            else:
+                corners, ids = self._detect_frame(gray)
+            self._frames += 1
+            if self._frames % self.reorder_every == 0:
+                self._reorder_stages()
+
+        if ids is not None and len(ids) > 0 and draw:
+            # マーカー枠とIDを描画
+            aruco.drawDetectedMarkers(frame, corners, ids)
+
+            if draw_id:
+                text = f"ID: {int(ids[0])}"
+                cv2.putText(frame, text, (10, 40),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
+
+        return frame, ids, corners
+
+    def _detect_legacy(self, frame):
+        """従来の最大6回検出（BGR/GRAY × params有無 → 1.6倍拡大）"""
         corners = ids = rejected = None
 
         def _detect(img, use_params=True):
@@ -116,46 +489,96 @@ class ArUcoDetector:
             except Exception:
                 pass
 
-        if ids is not None and len(ids) > 0 and draw:
-            # マーカー枠とIDを描画
-            aruco.drawDetectedMarkers(frame, corners, ids)
-
-            if draw_id:
-                text = f"ID: {int(ids[0])}"
-                cv2.putText(frame, text, (10, 40),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
+        return corners, ids
 
-        return frame, ids, corners
-    
+    @profiling.profiled("aruco.marker_info")
     def get_marker_info(self, ids, corners, target_id=None):
         """
         ids/corners から「追従対象の1枚」を選んで
-        center(x,y), size_px を返す
+        center(x,y), size_px, 左右の辺長, skew, 面積 を返す
         size_px は「4辺の平均ピクセル長」
+        全マーカー分の値は self.last_geometry（marker_geometry の戻り値）に残る
+        target_id を指定してそれが写っていなければ None（別の ID で代用しない）
         """
-        if ids is None or corners is None or len(ids) == 0:
+        geo = marker_geometry(ids, corners)
+        self.last_geometry = geo
+        # 追うIDを指定してるならそれ、なければ最初の1枚
+        idx = None if geo is None else (0 if target_id is None else geo["index"].get(target_id))
+        if idx is None:
+            self.last_poses = {}
             return None
 
-        ids_flat = ids.flatten().tolist()
+        size_px = float(geo["size_px"][idx])
+        self.last_size_px = size_px
 
-        # 追うIDを指定してるならそれ、なければ最初の1枚
-        idx = 0
-        if target_id is not None and target_id in ids_flat:
-            idx = ids_flat.index(target_id)
+        cx, cy = geo["centers"][idx]
+        info = {
+            "id": int(geo["ids"][idx]),
+            "center": (float(cx), float(cy)),
+            "size_px": size_px,
+            "left_px": float(geo["left_px"][idx]),
+            "right_px": float(geo["right_px"][idx]),
+            "skew": float(geo["skew"][idx]),
+            "area": float(geo["area"][idx]),
+            "corners": geo["quads"][idx],
+        }
 
-        c = corners[idx][0]  # shape: (4,2)  [tl,tr,br,bl] の順が多い
-        cx = float(np.mean(c[:, 0]))
-        cy = float(np.mean(c[:, 1]))
+        # 姿勢（distance_m, yaw_err_deg など）を足す。解けなければ画素の値だけ
+        if self.pose is not None:
+            self.last_poses = self.pose.estimate_all(geo, first=idx)
+            p = self.last_poses.get(info["id"])
+            if p is not None:
+                info.update(p)
+        return info
 
-        # 4辺の平均長
-        def dist(a, b):
-            return float(np.linalg.norm(a - b))
 
-        size_px = (dist(c[0], c[1]) + dist(c[1], c[2]) + dist(c[2], c[3]) + dist(c[3], c[0])) / 4.0
+_NEXT_CORNER = np.array([1, 2, 3, 0])
 
-        return {
-            "id": int(ids_flat[idx]),
-            "center": (cx, cy),
-            "size_px": size_px,
-            "corners": c,
-        }
+
+def marker_geometry(ids, corners):
+    """
+    検出結果まとめての幾何量（全マーカーを (N,4,2) 配列1つで計算）。
+    corners の4隅は [tl, tr, br, bl] の順。
+
+    Returns: dict（マーカーが無ければ None）
+        ids      : (N,) int
+        quads    : (N,4,2) float32
+        centers  : (N,2)  4隅の平均
+        size_px  : (N,)   4辺の平均長
+        left_px  : (N,)   左辺 |bl - tl|
+        right_px : (N,)   右辺 |br - tr|
+        skew     : (N,)   (右 - 左) / (右 + 左)。+ なら右辺が手前
+        area     : (N,)   面積（px^2）
+        index    : {id: 最初に現れた行}
+    """
+    if ids is None or corners is None or len(ids) == 0:
+        return None
+
+    ids_flat = np.asarray(ids).reshape(-1).astype(np.int64)
+    q = np.asarray(corners, dtype=np.float32).reshape(-1, 4, 2)
+
+    # 辺ベクトル：tl→tr, tr→br, br→bl, bl→tl
+    qn = q[:, _NEXT_CORNER]
+    edges = qn - q
+    lens = np.sqrt(np.einsum("nij,nij->ni", edges, edges))
+    right = lens[:, 1]
+    left = lens[:, 3]
+
+    # 靴ひも公式
+    area = 0.5 * np.abs((q[:, :, 0] * qn[:, :, 1] - qn[:, :, 0] * q[:, :, 1]).sum(axis=1))
+
+    index = {}
+    for i, mid in enumerate(ids_flat.tolist()):
+        index.setdefault(mid, i)
+
+    return {
+        "ids": ids_flat,
+        "quads": q,
+        "centers": q.sum(axis=1) * 0.25,
+        "size_px": lens.sum(axis=1) * 0.25,
+        "left_px": left,
+        "right_px": right,
+        "skew": (right - left) / np.maximum(right + left, 1e-6),
+        "area": area,
+        "index": index,
+    }
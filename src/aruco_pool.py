@@ -0,0 +1,260 @@
+# aruco_pool.py
+import os
+import time
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from aruco_detector import ArUcoDetector, marker_geometry
+
+
+def _worker_main(shm_name, n_slots, slot_shape, tasks, results, det_kwargs):
+    """
+    ワーカープロセス本体。
+    共有メモリ上のスロットをそのまま ndarray として読むので、フレームは pickle されない。
+    返すのは ids / corners（数十バイト）だけ。
+    タスクに親の last_size_px（size_hint）が付いていれば、それで pyramid の最初の縮小率を決める。
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        slots = np.ndarray((n_slots,) + tuple(slot_shape), dtype=np.uint8, buffer=shm.buf)
+        det = ArUcoDetector(**det_kwargs)
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, seq, h, w, t_submit, size_hint = task
+            if size_hint is not None:
+                det.last_size_px = size_hint
+
+            t0 = time.perf_counter()
+            try:
+                _, ids, corners = det.process(slots[slot, :h, :w], draw=False)
+            except Exception:
+                ids = corners = None
+            t1 = time.perf_counter()
+
+            quads = None
+            if ids is not None and len(ids) > 0:
+                quads = np.stack([np.asarray(c, dtype=np.float32).reshape(4, 2) for c in corners])
+                # 親から hint が来ない間（detect_all など）は自分の直近の検出で決める
+                det.last_size_px = float(marker_geometry(ids, quads)["size_px"][0])
+            else:
+                ids = None
+            results.put((seq, slot, ids, quads, det.last_stage, t_submit, t0, t1, h, w))
+        del slots
+    finally:
+        shm.close()
+
+
+class ArUcoPool:
+    """
+    ArUcoDetector をプロセスプールで並列に回すバックエンド。
+
+    - フレームは共有メモリのスロット（n_slots 枚）に1回コピーするだけ
+    - 結果にはフレームの seq が付く
+    - poll() は「すでに返した seq より古い結果」を捨てて seq 順に返す（古い結果で制御しない）
+    - スロットが空いていなければ submit() はフレームを捨てる（ライブ用の遅延上限）
+    - 親の get_marker_info（self.local）が決めた last_size_px を毎タスクに載せる
+      （ワーカーの pyramid も直近のマーカーの大きさから探し始める）
+    - ワーカーが死んだら detect_all() は RuntimeError
+    """
+
+    def __init__(self, workers=None, slot_shape=(720, 960, 3), n_slots=None, max_age_ms=250.0, **det_kwargs):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.slot_shape = tuple(slot_shape)
+        self.n_slots = n_slots or (self.workers + 1)
+        self.max_age_ms = max_age_ms
+
+        # 追跡状態はプロセスをまたげないので切る
+        det_kwargs.setdefault("track", False)
+        self.det_kwargs = det_kwargs
+        # get_marker_info 用（検出はしない）
+        self.local = ArUcoDetector(**det_kwargs)
+
+        nbytes = int(np.prod(self.slot_shape)) * self.n_slots
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._slots = np.ndarray((self.n_slots,) + self.slot_shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._free = list(range(self.n_slots))
+
+        ctx = mp.get_context("spawn")
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._procs = [
+            ctx.Process(
+                target=_worker_main,
+                args=(self._shm.name, self.n_slots, self.slot_shape, self._tasks, self._results, det_kwargs),
+                daemon=True,
+            )
+            for _ in range(self.workers)
+        ]
+        for p in self._procs:
+            p.start()
+
+        self._seq = 0
+        self._last_out = 0
+        self._pending = []        # submit(block=True) 待ちの間に受け取った結果
+        self.submitted = 0
+        self.dropped_busy = 0     # スロット満杯で捨てたフレーム
+        self.dropped_stale = 0    # 新しい結果より後に届いた / 古すぎる結果
+        self.oversize = 0
+
+    # -----------------------
+    # submit / poll
+    # -----------------------
+    def submit(self, frame, block=False, timeout=None, size_hint=None):
+        """
+        フレームを空きスロットにコピーしてワーカーに渡す。
+        size_hint: pyramid の開始縮小率を決める size_px（None なら self.local.last_size_px）
+        Returns: seq（捨てた場合は None）
+        """
+        h, w = frame.shape[:2]
+        if h > self.slot_shape[0] or w > self.slot_shape[1] or frame.ndim != 3:
+            self.oversize += 1
+            return None
+
+        if not self._free:
+            if not block:
+                self.dropped_busy += 1
+                return None
+            self._wait_free(timeout)
+            if not self._free:
+                self.dropped_busy += 1
+                return None
+
+        slot = self._free.pop()
+        self._slots[slot, :h, :w] = frame   # 唯一のコピー（反転ビューもここで連続化される）
+        self._seq += 1
+        if size_hint is None:
+            size_hint = self.local.last_size_px
+        self._tasks.put((slot, self._seq, h, w, time.perf_counter(), size_hint))
+        self.submitted += 1
+        return self._seq
+
+    def _drain(self, timeout=None):
+        out = []
+        try:
+            item = self._results.get(timeout=timeout) if timeout else self._results.get_nowait()
+            while True:
+                out.append(item)
+                self._free.append(item[1])
+                item = self._results.get_nowait()
+        except queue.Empty:
+            pass
+        return out
+
+    def _wait_free(self, timeout):
+        self._pending.extend(self._drain(timeout=timeout or 1.0))
+
+    def _to_result(self, item):
+        seq, slot, ids, quads, stage, t_submit, t0, t1, h, w = item
+        corners = None if quads is None else [q.reshape(1, 4, 2) for q in quads]
+        return {
+            "seq": seq,
+            "frame_shape": (h, w, 3),
+            "ids": ids,
+            "corners": corners,
+            "stage": stage,
+            "t_frame": t_submit,
+            "t_start": t0,
+            "t_done": t1,
+        }
+
+    def poll(self, timeout=None):
+        """
+        届いた結果を seq 順に返す。
+        すでに返した seq より古いもの、max_age_ms より古いものは捨てる。
+        """
+        items = self._pending + self._drain(timeout=timeout)
+        self._pending = []
+        items.sort(key=lambda it: it[0])
+
+        now = time.perf_counter()
+        out = []
+        for it in items:
+            seq, t_submit = it[0], it[5]
+            if seq <= self._last_out:
+                self.dropped_stale += 1
+                continue
+            if self.max_age_ms is not None and (now - t_submit) * 1000.0 > self.max_age_ms:
+                self.dropped_stale += 1
+                continue
+            self._last_out = seq
+            out.append(self._to_result(it))
+        return out
+
+    def _check_workers(self):
+        dead = [p for p in self._procs if not p.is_alive()]
+        if dead:
+            raise RuntimeError(f"ArUcoPool: {len(dead)}/{len(self._procs)} worker(s) died "
+                               f"(exitcode={dead[0].exitcode})")
+
+    def detect_all(self, frames, result_timeout=30.0):
+        """
+        録画解析用：全フレームを（捨てずに）全コアで検出し、seq 順に yield する。
+        ワーカーが死んだら RuntimeError、result_timeout 秒結果が1つも来なければ TimeoutError。
+        """
+        max_age, self.max_age_ms = self.max_age_ms, None
+        reorder = {}
+        t_progress = [time.perf_counter()]
+
+        def collect(timeout=None):
+            items = self._pending + self._drain(timeout=timeout)
+            self._pending = []
+            for it in items:
+                reorder[it[0]] = it
+            now = time.perf_counter()
+            if items:
+                t_progress[0] = now
+                return
+            self._check_workers()
+            if result_timeout is not None and now - t_progress[0] > result_timeout:
+                raise TimeoutError(f"ArUcoPool: no result for {result_timeout:.0f}s")
+
+        def flush():
+            while self._last_out + 1 in reorder:
+                self._last_out += 1
+                yield self._to_result(reorder.pop(self._last_out))
+
+        try:
+            for frame in frames:
+                oversize = self.oversize
+                while self.submit(frame, block=True) is None:
+                    if self.oversize != oversize:
+                        raise ValueError("frame larger than slot_shape")
+                    collect()
+                collect()
+                yield from flush()
+
+            while self._last_out < self._seq:
+                collect(timeout=1.0)
+                yield from flush()
+        finally:
+            self.max_age_ms = max_age
+
+    def get_marker_info(self, ids, corners, target_id=None):
+        return self.local.get_marker_info(ids, corners, target_id=target_id)
+
+    def report(self):
+        return (f"pool workers={self.workers} submitted={self.submitted} busy_drop={self.dropped_busy} "
+                f"stale_drop={self.dropped_stale}")
+
+    def close(self):
+        for _ in self._procs:
+            try:
+                self._tasks.put(None)
+            except Exception:
+                pass
+        for p in self._procs:
+            p.join(timeout=1.0)
+            if p.is_alive():
+                p.terminate()
+        del self._slots
+        try:
+            self._shm.close()
+            self._shm.unlink()
+        except Exception:
+            pass
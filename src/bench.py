@@ -0,0 +1,290 @@
+# bench.py
+"""
+実機なしでメインループの各ステージを計測するベンチマーク。
+
+FakeTello（sim_tello.py）を TelloController に差し込み、main() と同じ FlightPipeline（pipeline.py）を回す：
+検出スレッド（VisionWorker / ArUcoPool / 直列）・追跡表・RCスケジューラ（on_tick=control_tick）と、
+UI ループ側の「フレーム取得 → 検出結果の読み出し → テレメトリ → HUD合成 → 制御」。
+cv2.imshow は呼ばない（ヘッドレス）。フレームは --fps の間隔で1枚ずつ進める（0 なら待たずに次へ）。
+
+    python bench.py
+    python bench.py --res 640x480 960x720 --frames 300 --mode pyramid cascade --backend thread serial
+    python bench.py --max-p95 loop=25 detect=12 lat_total=80 --json bench.json
+
+--max-p95 / --min-hz を超えたら終了コード 1（回帰チェック用）。
+lat_* はフレームがリングに入ってから RC を送るまでの区間（latency.py）。
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from aruco_detector import ArUcoDetector
+from latency import LatencyStats
+from marker_track import MarkerTracker
+from pipeline import FlightPipeline
+from sim_tello import FakeTello, NullKeyboard, SyntheticArUcoSource
+from tello_controller import TelloController
+from ui_overlay import DroneUI
+from vision_worker import StageTimes
+
+
+STAGES = ("frame", "detect", "vision_read", "telemetry", "ui", "control", "loop")
+
+# main.py / DisplayManager と同じ UI 幅の決め方
+UI_RATIO = 0.22
+UI_MIN = 260
+UI_MAX = 700
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def run_case(width, height, *, frames, warmup, mode, display_w, display_h, target_id=0, backend="thread",
+             tracker=True, rc_hz=30, fps=30.0):
+    """1解像度・1検出モード・1バックエンド分を回して結果の dict を返す"""
+    source = SyntheticArUcoSource(width, height, n_frames=min(frames, 240))
+    fake = FakeTello(source, fps=0)  # ループから step() で1枚ずつ進める（どのフレームの結果か分かるように）
+    controller = TelloController(NullKeyboard(), tello=fake)
+    detector = ArUcoDetector(mode=mode)
+    ui = DroneUI(panel_width=260, bottom_margin=60)
+
+    stats = StageTimes(window=frames)
+    pipe = FlightPipeline(
+        controller,
+        detector,
+        vision=backend != "serial",
+        backend=backend,
+        tracker=MarkerTracker() if tracker else None,
+        stats=stats,
+    )
+
+    controller.connect_and_start_stream()
+    controller.in_flight = True
+    controller.approach_enabled = True
+    controller.target_aruco_id = target_id
+    pipe.start(rc_rate_hz=rc_hz)
+
+    ui_w = max(UI_MIN, min(int(display_w * UI_RATIO), UI_MAX))
+    canvas = np.zeros((display_h, display_w, 3), dtype=np.uint8)
+    disp = np.zeros((height, width, 3), dtype=np.uint8)
+
+    ring = controller.frame_ring
+    period = 1.0 / fps if fps else 0.0
+    last_seq = 0
+    seq_index = {}       # ring の seq → ソースのフレーム番号
+    last_res_seq = 0
+    total_alt = 0.0
+    prev_height = None
+    last_snap_seq = 0
+    visible = hits = 0
+    rc_sent0 = 0
+
+    fake.step()
+    t_start = None
+    t_next = time.perf_counter()
+    try:
+        for i in range(warmup + frames):
+            if i == warmup:
+                stats = StageTimes(window=frames)
+                pipe.stats = stats
+                if pipe.vision is not None:
+                    pipe.vision.stats = stats
+                controller.latency = LatencyStats()
+                rc_sent0 = controller.rc_sent
+                visible = hits = 0
+                t_start = time.perf_counter()
+            now = time.perf_counter()
+
+            # ---- frame（ポンプがリングへ書くのを待って表示用に1回コピー） ----
+            ring.wait_newer(last_seq, 1.0)
+            last_seq, src = ring.latest()
+            seq_index[last_seq] = fake.index
+            frame_idx = fake.index
+            np.copyto(disp, src)
+            fake.step()  # 次のフレームはこの周回の処理中にポンプが書く（ライブ配信と同じ重なり）
+            t_now = time.perf_counter()
+            stats.add("frame", (t_now - now) * 1000.0)
+            t_stage = t_now
+
+            # ---- detect（main と同じ：検出スレッドの最新結果を読む / 直列ならここで検出） ----
+            frame = disp
+            det = pipe.detect_step(frame, t_stage, frame_seq=last_seq)
+            t_now = time.perf_counter()
+            stats.add("detect" if pipe.vision is None else "vision_read", (t_now - t_stage) * 1000.0)
+            t_stage = t_now
+
+            # 検出率：新しい検出結果ごとに、そのフレームに target が写っていたか
+            res_seq, res = pipe.latest_marker()
+            if res is not None and res_seq != last_res_seq:
+                last_res_seq = res_seq
+                idx = frame_idx if pipe.vision is None else seq_index.get(res.get("frame_seq"))
+                if idx is not None and target_id in source.visible_ids(idx):
+                    visible += 1
+                    hits += res["marker_info"] is not None
+
+            # ---- telemetry ----
+            snap = controller.telemetry.latest
+            if snap.seq != last_snap_seq and snap.height is not None:
+                if prev_height is not None:
+                    total_alt += abs(snap.height - prev_height)
+                prev_height = snap.height
+            last_snap_seq = snap.seq
+            t_now = time.perf_counter()
+            stats.add("telemetry", (t_now - t_stage) * 1000.0)
+            t_stage = t_now
+
+            # ---- ui ----
+            ui.compose_side(
+                frame,
+                display_w=display_w,
+                display_h=display_h,
+                ui_w=ui_w,
+                ui_bg=(0, 0, 0),
+                out=canvas,
+                battery=snap.battery,
+                roll=snap.roll,
+                pitch=snap.pitch,
+                yaw=None if snap.yaw is None else -snap.yaw,
+                height=snap.height,
+                total_alt=total_alt,
+                speed=snap.speed,
+                agx=snap.agx, agy=snap.agy, agz=snap.agz,
+                aruno=det["aruno"],
+                aruno_last=pipe.aruno_last,
+                temp=snap.temp,
+                flight_time=snap.flight_time,
+                pos_xy=np.zeros(2),
+                pos_range=(25.0, 35.0),
+                approach_enabled=controller.approach_enabled,
+                approach_state=controller.approach_state,
+                approach_yaw=controller.approach_yaw,
+                approach_err_x=controller.approach_err_x,
+                approach_size_px=controller.approach_size_px,
+                latency_text=controller.latency.hud_line(),
+            )
+            t_now = time.perf_counter()
+            stats.add("ui", (t_now - t_stage) * 1000.0)
+            t_stage = t_now
+
+            # ---- control（スケジューラ稼働中は何もしない＝送信は RC スレッド） ----
+            pipe.control_step()
+            t_now = time.perf_counter()
+            stats.add("control", (t_now - t_stage) * 1000.0)
+            stats.add("loop", (t_now - now) * 1000.0)
+
+            # カメラのフレーム間隔まで待つ
+            if period:
+                t_next += period
+                delay = t_next - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    t_next = time.perf_counter()
+        elapsed = time.perf_counter() - t_start
+        rc_sent = controller.rc_sent - rc_sent0
+        overrun = pipe.vision.overrun if pipe.vision is not None else 0
+    finally:
+        pipe.stop()
+        controller.cleanup()
+
+    pct = stats.percentiles((50, 95, 99))
+    lat = controller.latency.rolling.percentiles((50, 95, 99))
+    out_stages = {k: {"p50": pct[k][0], "p95": pct[k][1], "p99": pct[k][2]} for k in STAGES if k in pct}
+    for name, p in lat.items():
+        out_stages["lat_" + name] = {"p50": p[0], "p95": p[1], "p99": p[2]}
+    return {
+        "res": f"{width}x{height}",
+        "mode": mode,
+        "backend": backend,
+        "tracker": bool(tracker),
+        "frames": frames,
+        "hz": frames / elapsed if elapsed > 0 else 0.0,
+        "recall": hits / visible if visible else None,
+        "rc_hz": rc_sent / elapsed if elapsed > 0 else 0.0,
+        "rc_jitter_max_ms": controller.rc_jitter_max_ms,
+        "overrun": overrun,
+        "stages": out_stages,
+    }
+
+
+def print_result(r):
+    recall = "--" if r["recall"] is None else f"{r['recall'] * 100.0:.0f}%"
+    print(f"\n[BENCH] {r['res']} mode={r['mode']} backend={r['backend']} tracker={r['tracker']} "
+          f"frames={r['frames']}  {r['hz']:.1f}Hz  recall={recall}  rc={r['rc_hz']:.1f}Hz "
+          f"jitter_max={r['rc_jitter_max_ms']:.1f}ms  overrun={r['overrun']}")
+    print(f"  {'stage':<10}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    for name, p in r["stages"].items():
+        print(f"  {name:<10}{p['p50']:>9.2f}{p['p95']:>9.2f}{p['p99']:>9.2f}")
+
+
+def parse_limits(items):
+    out = {}
+    for it in items or ():
+        k, v = it.split("=")
+        out[k] = float(v)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless flight-loop benchmark (simulated Tello)")
+    ap.add_argument("--res", nargs="+", default=["640x480", "960x720", "1280x720"],
+                    help="カメラ解像度 WxH（複数可）")
+    ap.add_argument("--display", default="1600x900", help="合成先のウィンドウサイズ WxH")
+    ap.add_argument("--mode", nargs="+", default=["pyramid"], choices=["pyramid", "cascade", "legacy"])
+    ap.add_argument("--backend", nargs="+", default=["thread"], choices=["thread", "pool", "serial"],
+                    help="検出の実行場所（main.py の VISION_THREAD / VISION_BACKEND）")
+    ap.add_argument("--no-tracker", action="store_true", help="MarkerTracker を使わない（MARKER_TRACKER=False）")
+    ap.add_argument("--rc-hz", type=int, default=30, help="RCスケジューラの周期（0 で毎フレーム送信）")
+    ap.add_argument("--fps", type=float, default=30.0, help="フレームを進める間隔（0 で待たない）")
+    ap.add_argument("--frames", type=int, default=240)
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--max-p95", nargs="*", metavar="STAGE=MS", help="ステージの p95 上限（超えたら失敗）")
+    ap.add_argument("--min-hz", type=float, default=None, help="全体 Hz の下限（下回ったら失敗）")
+    ap.add_argument("--json", default=None, help="結果を JSON で保存するパス")
+    args = ap.parse_args(argv)
+
+    display_w, display_h = parse_size(args.display)
+    limits = parse_limits(args.max_p95)
+    print(f"[BENCH] python={platform.python_version()} opencv={cv2.__version__} threads={cv2.getNumThreads()}")
+
+    results = []
+    failures = []
+    for res in args.res:
+        w, h = parse_size(res)
+        for mode in args.mode:
+            for backend in args.backend:
+                r = run_case(w, h, frames=args.frames, warmup=args.warmup, mode=mode,
+                             display_w=display_w, display_h=display_h, backend=backend,
+                             tracker=not args.no_tracker, rc_hz=args.rc_hz, fps=args.fps)
+                print_result(r)
+                results.append(r)
+
+                name = f"{r['res']} {mode}/{backend}"
+                for stage, lim in limits.items():
+                    p = r["stages"].get(stage)
+                    if p is not None and p["p95"] > lim:
+                        failures.append(f"{name}: {stage} p95 {p['p95']:.2f}ms > {lim:.2f}ms")
+                if args.min_hz is not None and r["hz"] < args.min_hz:
+                    failures.append(f"{name}: {r['hz']:.1f}Hz < {args.min_hz:.1f}Hz")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"opencv": cv2.__version__, "display": args.display, "results": results}, f, indent=2)
+
+    if failures:
+        print("\n[BENCH] FAILED")
+        for msg in failures:
+            print("  " + msg)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# event_log.py
+"""
+構造化イベントログ。呼ぶ側はキューに積むだけで、ファイル（JSONL）と端末への出力は
+バックグラウンドのスレッドが行う（遅い端末でも制御 / UI ループを止めない）。
+
+    import event_log as events
+
+    events.configure("logs/events.jsonl", level="DEBUG", console_level="INFO", sample={"rc_cmd": 1})
+    events.debug("rc_cmd", lr=10, fb=0, ud=0, yaw=-5)          # ファイルだけ
+    events.warn("aruco", "detect failed", error="...")          # ファイル + 端末 "[WARN][ARUCO] detect failed error=..."
+    events.close()                                              # 残りを書いて終了
+
+1行 = {"t": perf_counter, "wall": time.time, "lvl", "tag", "msg"?, ...フィールド}。
+sample={tag: n} でその tag は n 件に1件だけ残す。キューが max_queue を超えたら捨てて数える。
+configure() 前でも使える（端末にだけ出す）。
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN", ERROR: "ERROR"}
+_LEVELS = {v: k for k, v in LEVEL_NAMES.items()}
+
+
+def _level(v):
+    return _LEVELS[v.upper()] if isinstance(v, str) else int(v)
+
+
+class EventLog:
+    def __init__(self, path=None, *, level=DEBUG, console_level=INFO, sample=None, max_queue=100000,
+                 flush_sec=0.1, console=sys.stdout):
+        self.path = path
+        self.console_level = _level(console_level)
+        # ファイルが無ければ端末に出す分だけ受け付ける
+        self.level = _level(level) if path else self.console_level
+        self.sample = dict(sample or {})
+        self._sample_n = {}
+        self.max_queue = max_queue
+        self.flush_sec = flush_sec
+        self.console = console
+
+        # deque の append / popleft はスレッド間でロック無しに使える
+        self._q = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._f = None
+        self._thread_names = {}
+
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+
+    def start(self):
+        if self.path:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            self._f = open(self.path, "a", encoding="utf-8", buffering=1 << 16)
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self, timeout=2.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return   # まだ書いている（ファイルは書き出しスレッドの終わりまで開けておく）
+            self._thread = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    # ---- 呼ぶ側（数 µs） ----
+    def emit(self, level, tag, msg=None, fields=None):
+        if level < self.level:
+            return False
+        n = self.sample.get(tag)
+        if n is not None and n > 1:
+            k = self._sample_n.get(tag, 0)
+            self._sample_n[tag] = k + 1
+            if k % n:
+                return False
+        if len(self._q) >= self.max_queue:
+            self.dropped += 1
+            return False
+        self._q.append((time.perf_counter(), time.time(), level, tag, msg, fields, threading.get_ident()))
+        self.emitted += 1
+        if level >= self.console_level:
+            self._wake.set()
+        return True
+
+    # ---- 書き出しスレッド ----
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_sec)
+            self._wake.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        q = self._q
+        lines = []
+        console = []
+        while q:
+            t, wall, level, tag, msg, fields, ident = q.popleft()
+            if self._f is not None:
+                rec = {"t": round(t, 6), "wall": round(wall, 3), "lvl": LEVEL_NAMES.get(level, level),
+                       "tag": tag, "thread": self._thread_name(ident)}
+                if msg is not None:
+                    rec["msg"] = msg
+                if fields:
+                    rec.update(fields)
+                lines.append(json.dumps(rec, default=str, separators=(",", ":")))
+            if level >= self.console_level:
+                console.append(_console_line(level, tag, msg, fields))
+        if lines:
+            self._f.write("\n".join(lines) + "\n")
+            self._f.flush()
+            self.written += len(lines)
+        if console and self.console is not None:
+            try:
+                self.console.write("\n".join(console) + "\n")
+                self.console.flush()
+            except (OSError, ValueError):
+                pass
+
+    def _thread_name(self, ident):
+        name = self._thread_names.get(ident)
+        if name is None:
+            self._thread_names = {th.ident: th.name for th in threading.enumerate()}
+            name = self._thread_names.setdefault(ident, str(ident))
+        return name
+
+    def report(self):
+        return f"events={self.emitted} written={self.written} dropped={self.dropped} queued={len(self._q)}"
+
+
+def _console_line(level, tag, msg, fields):
+    head = f"[{tag.upper()}]" if level < WARN else f"[{LEVEL_NAMES.get(level, level)}][{tag.upper()}]"
+    parts = [head]
+    if msg is not None:
+        parts.append(str(msg))
+    if fields:
+        parts.append(" ".join(f"{k}={v}" for k, v in fields.items()))
+    return " ".join(parts)
+
+
+# -----------------------
+# 既定のロガー（モジュール関数）
+# -----------------------
+_log = None
+_lock = threading.Lock()
+
+
+def configure(path=None, **kwargs):
+    """既定のロガーを作り直す（前のものは書き切ってから閉じる）"""
+    global _log
+    with _lock:
+        old, _log = _log, EventLog(path, **kwargs).start()
+    if old is not None:
+        old.close()
+    return _log
+
+
+def get():
+    global _log
+    if _log is None:
+        with _lock:
+            if _log is None:
+                _log = EventLog().start()
+    return _log
+
+
+def close():
+    global _log
+    with _lock:
+        old, _log = _log, None
+    if old is not None:
+        old.close()
+
+
+def emit(level, tag, msg=None, **fields):
+    return (_log or get()).emit(level, tag, msg, fields)
+
+
+def debug(tag, msg=None, **fields):
+    return (_log or get()).emit(DEBUG, tag, msg, fields)
+
+
+def info(tag, msg=None, **fields):
+    return (_log or get()).emit(INFO, tag, msg, fields)
+
+
+def warn(tag, msg=None, **fields):
+    return (_log or get()).emit(WARN, tag, msg, fields)
+
+
+def error(tag, msg=None, **fields):
+    return (_log or get()).emit(ERROR, tag, msg, fields)
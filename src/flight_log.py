@@ -0,0 +1,427 @@
+# flight_log.py
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+# ---------------------------------------------------------------
+# ファイル形式（リトルエンディアン）
+#
+#   [ヘッダ] magic "TELLOLOG", version, flags, 開始時刻(time.time), 開始時刻(perf_counter)
+#   [レコード]* ヘッダ20B（種別, codec, 予約, seq, t, 長さ）+ 本体
+#   [索引]    全レコードの (offset, 種別, seq, t)
+#   [トレーラ] 索引の offset, 件数, magic "TLOGIDX1"
+#
+# レコードは chunk_bytes ごとにまとめて書く。トレーラが無い（落ちた）ファイルでも
+# レコードを先頭から辿れば索引を作り直せる。t は開始からの秒。
+# ---------------------------------------------------------------
+MAGIC = b"TELLOLOG"
+INDEX_MAGIC = b"TLOGIDX1"
+VERSION = 1
+
+HEADER = struct.Struct("<8sHHdd")
+RECORD = struct.Struct("<BBHIdI")
+TRAILER = struct.Struct("<QI8s")
+FRAME_HEAD = struct.Struct("<HH")
+DETECT_HEAD = struct.Struct("<IH")
+RC_BODY = struct.Struct("<4h")
+DETECT_TAIL = struct.Struct("<d")   # 検出したフレームの時刻（開始からの秒。付いていない古いログもある）
+
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("type", "u1"), ("seq", "<u4"), ("t", "<f8")])
+
+# レコード種別
+REC_FRAME = 1
+REC_STATE = 2
+REC_DETECT = 3
+REC_RC = 4
+
+# フレームの codec
+CODEC_RAW = 0    # BGR そのまま
+CODEC_JPEG = 1
+
+# RC レコードのフラグ（codec 欄を使う）
+RC_SENT = 0
+RC_SKIPPED = 1   # 停止指令の連送を省いた周期（送ってはいないが指令は決まっていた）
+
+
+def encode_detection(ids, corners, frame_seq=0, t_frame=None):
+    """
+    ids/corners → DETECT 本体（frame_seq, n, ids int32[n], corners float32[n,4,2] [, t_frame float64]）
+    t_frame: 検出したフレームの時刻（開始からの秒）。レコードの t（制御が結果を取り込んだ時刻）と別に残す
+    """
+    tail = b"" if t_frame is None else DETECT_TAIL.pack(t_frame)
+    if ids is None or corners is None or len(ids) == 0:
+        return DETECT_HEAD.pack(frame_seq, 0) + tail
+    ids_a = np.asarray(ids, dtype=np.int32).reshape(-1)
+    quads = np.asarray(corners, dtype=np.float32).reshape(-1, 4, 2)
+    return DETECT_HEAD.pack(frame_seq, len(ids_a)) + ids_a.tobytes() + quads.tobytes() + tail
+
+
+class FlightRecorder:
+    """
+    フレーム / 状態パケット / 検出結果 / RC指令 を1本のログに追記するレコーダ。
+
+    - 書き込みとJPEG化は専用スレッド。呼び出し側は put_nowait するだけで待たない
+    - キューは有限。あふれたら捨てて数える（録画で制御ループを止めない）
+    - attach_ring(ring) するとフレームは FrameRing から直接拾う（呼び出し側のコピー無し）。
+      エンコード中にスロットが上書きされたらそのフレームは捨てる
+    """
+
+    def __init__(self, path, *, jpeg_quality=80, frame_fps=15.0, chunk_bytes=1 << 20, flush_sec=0.5,
+                 max_events=8192, max_frames=4):
+        self.path = path
+        self.jpeg_quality = jpeg_quality      # None なら無圧縮
+        self.frame_fps = frame_fps            # None / 0 なら間引かない
+        self.chunk_bytes = chunk_bytes
+        self.flush_sec = flush_sec
+
+        self._events = queue.Queue(maxsize=max_events)
+        self._frames = queue.Queue(maxsize=max_frames)
+        self._ring = None
+        self._ring_seq = 0
+        self._last_frame_t = 0.0
+
+        self._f = None
+        self._buf = bytearray()
+        self._pos = 0                         # ファイル上の書き込み位置（バッファ含む）
+        self._index = []
+        self._seq = 0
+        self.t0_wall = 0.0
+        self.t0 = 0.0
+
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.events_written = 0
+        self.events_dropped = 0
+        self.bytes_written = 0
+
+    # -----------------------
+    # start / stop
+    # -----------------------
+    def start(self):
+        if self._thread is not None:
+            return self
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.t0_wall = time.time()
+        self.t0 = time.perf_counter()
+        self._f = open(self.path, "wb")
+        self._f.write(HEADER.pack(MAGIC, VERSION, 0, self.t0_wall, self.t0))
+        self._pos = HEADER.size
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """残りを書き切って索引を付けて閉じる"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5.0)
+        self._thread = None
+        self._drain_events()
+        self._flush()
+        idx = np.array(self._index, dtype=INDEX_DTYPE)
+        self._f.write(idx.tobytes())
+        self._f.write(TRAILER.pack(self._pos, len(idx), INDEX_MAGIC))
+        self._f.close()
+        self._f = None
+
+    close = stop
+
+    def attach_ring(self, ring):
+        self._ring = ring
+        self._ring_seq = ring.head
+
+    # -----------------------
+    # 呼び出し側（どのスレッドからでも）
+    # -----------------------
+    def _put(self, item):
+        try:
+            self._events.put_nowait(item)
+        except queue.Full:
+            self.events_dropped += 1
+
+    def state(self, st, t=None):
+        """djitellopy の state dict（生の値を残す。再生時はそのまま流し直せる）"""
+        self._put((REC_STATE, time.perf_counter() if t is None else t, st))
+
+    def detection(self, ids, corners, t=None, frame_seq=0, t_frame=None):
+        """
+        t: 記録の時刻（再生はこの順で流す。制御が結果を取り込んだ時刻を渡す）
+        t_frame: 検出したフレームの時刻（perf_counter。追跡表の観測時刻）
+        """
+        if t_frame is not None:
+            t_frame -= self.t0
+        self._put((REC_DETECT, time.perf_counter() if t is None else t,
+                   encode_detection(ids, corners, frame_seq, t_frame)))
+
+    def rc(self, cmd, t=None, sent=True):
+        """RCスケジューラの1周期で決まった指令（送らなかった周期も sent=False で残す）"""
+        self._put((REC_RC, time.perf_counter() if t is None else t, (cmd, RC_SENT if sent else RC_SKIPPED)))
+
+    def frame(self, img, t=None, seq=0):
+        """ring を使わない時用。コピーしてキューへ（満杯なら捨てる）"""
+        if self._frames.full():
+            self.frames_dropped += 1
+            return
+        try:
+            self._frames.put_nowait((time.perf_counter() if t is None else t, seq, img.copy()))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    # -----------------------
+    # 書き込みスレッド
+    # -----------------------
+    def _append(self, rtype, t, body, codec=0, seq=None):
+        if seq is None:
+            self._seq += 1
+            seq = self._seq
+        self._index.append((self._pos, rtype, seq, t - self.t0))
+        rec = RECORD.pack(rtype, codec, 0, seq, t - self.t0, len(body))
+        self._buf += rec
+        self._buf += body
+        self._pos += len(rec) + len(body)
+
+    def _flush(self):
+        if self._buf:
+            self._f.write(self._buf)
+            self._f.flush()
+            self.bytes_written += len(self._buf)
+            self._buf = bytearray()
+
+    def _drain_events(self):
+        while True:
+            try:
+                rtype, t, payload = self._events.get_nowait()
+            except queue.Empty:
+                return
+            codec = 0
+            if rtype == REC_STATE:
+                body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+            elif rtype == REC_RC:
+                cmd, codec = payload
+                body = RC_BODY.pack(*(int(v) for v in cmd))
+            else:
+                body = payload
+            self._append(rtype, t, body, codec=codec)
+            self.events_written += 1
+
+    def _write_frame(self, img, t, seq, valid=None):
+        h, w = img.shape[:2]
+        if self.jpeg_quality:
+            ok, enc = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(self.jpeg_quality)])
+            if not ok:
+                self.frames_dropped += 1
+                return
+            data, codec = enc.tobytes(), CODEC_JPEG
+        else:
+            data, codec = np.ascontiguousarray(img).tobytes(), CODEC_RAW
+        # エンコード中にリングのスロットが上書きされていたら壊れている
+        if valid is not None and not valid():
+            self.frames_dropped += 1
+            return
+        self._append(REC_FRAME, t, FRAME_HEAD.pack(w, h) + data, codec=codec, seq=seq)
+        self.frames_written += 1
+
+    def _poll_ring(self):
+        ring = self._ring
+        head = ring.head
+        if head <= self._ring_seq:
+            return False
+        now = time.perf_counter()
+        if self.frame_fps and (now - self._last_frame_t) < 1.0 / self.frame_fps:
+            return False
+        seq, view = ring.latest()
+        if view is None:
+            return False
+        if self._ring_seq and seq - self._ring_seq > 1 and not self.frame_fps:
+            self.frames_dropped += seq - self._ring_seq - 1
+        self._ring_seq = seq
+        self._last_frame_t = now
+        self._write_frame(view, ring.stamp(seq), seq, valid=lambda: ring.is_valid(seq))
+        return True
+
+    def _run(self):
+        last_flush = time.perf_counter()
+        while not self._stop.is_set():
+            self._drain_events()
+
+            wrote = False
+            if self._ring is not None:
+                wrote = self._poll_ring()
+            try:
+                t, seq, img = self._frames.get_nowait()
+                self._write_frame(img, t, seq)
+                wrote = True
+            except queue.Empty:
+                pass
+
+            now = time.perf_counter()
+            if len(self._buf) >= self.chunk_bytes or (now - last_flush) >= self.flush_sec:
+                self._flush()
+                last_flush = now
+            if not wrote:
+                self._stop.wait(0.005)
+
+    def report(self):
+        return (f"rec frames={self.frames_written} drop={self.frames_dropped} events={self.events_written} "
+                f"drop={self.events_dropped} {self._pos / 1e6:.1f}MB")
+
+
+class FlightLogReader:
+    """
+    .tlog を mmap して読む（ファイル全体を読み込まない）。
+
+    - index: 全レコードの (offset, type, seq, t)。トレーラが無ければ先頭から辿って作る
+    - body(i) は mmap 上の memoryview（コピー無し）
+    - seek(t) で t 以降の最初のレコード番号（二分探索）
+    """
+
+    def __init__(self, path):
+        import mmap
+
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mv = memoryview(self._mm)
+
+        magic, version, _, self.t0_wall, self.t0 = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a flight log")
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported version {version}")
+
+        self.recovered = False
+        index = self._read_index()
+        if index is None:
+            index = self._scan_index()
+            self.recovered = True
+        # 記録順ではなく時刻順で再生する（フレームはリングに入った時刻で記録される）
+        self.index = index[np.argsort(index["t"], kind="stable")]
+        self.duration = float(self.index["t"][-1]) if len(self.index) else 0.0
+
+    def _read_index(self):
+        size = len(self._mm)
+        if size < HEADER.size + TRAILER.size:
+            return None
+        off, n, magic = TRAILER.unpack_from(self._mm, size - TRAILER.size)
+        if magic != INDEX_MAGIC or off + n * INDEX_DTYPE.itemsize != size - TRAILER.size:
+            return None
+        return np.frombuffer(self._mm, dtype=INDEX_DTYPE, count=n, offset=off).copy()
+
+    def _scan_index(self):
+        """トレーラが無い（途中で落ちた）ログ：書き切れているレコードまで辿る"""
+        out = []
+        pos = HEADER.size
+        size = len(self._mm)
+        while pos + RECORD.size <= size:
+            rtype, _, _, seq, t, n = RECORD.unpack_from(self._mm, pos)
+            if rtype not in (REC_FRAME, REC_STATE, REC_DETECT, REC_RC) or pos + RECORD.size + n > size:
+                break
+            out.append((pos, rtype, seq, t))
+            pos += RECORD.size + n
+        return np.array(out, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        # 無圧縮フレームは mmap のビューのまま返すので、まだ参照があれば閉じずに GC に任せる
+        try:
+            self._mv.release()
+            self._mm.close()
+        except BufferError:
+            pass
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -----------------------
+    # 取り出し
+    # -----------------------
+    def seek(self, t):
+        """時刻 t（開始からの秒）以降の最初のレコード番号"""
+        return int(np.searchsorted(self.index["t"], t, side="left"))
+
+    def count(self, rtype):
+        return int(np.count_nonzero(self.index["type"] == rtype))
+
+    def header(self, i):
+        """(type, codec, seq, t, body の memoryview)"""
+        pos = int(self.index["offset"][i])
+        rtype, codec, _, seq, t, n = RECORD.unpack_from(self._mm, pos)
+        start = pos + RECORD.size
+        return rtype, codec, seq, t, self._mv[start:start + n]
+
+    @staticmethod
+    def decode_frame(codec, body):
+        w, h = FRAME_HEAD.unpack_from(body, 0)
+        data = np.frombuffer(body, dtype=np.uint8, offset=FRAME_HEAD.size)
+        if codec == CODEC_JPEG:
+            return cv2.imdecode(data, cv2.IMREAD_COLOR)
+        return data.reshape(h, w, 3)
+
+    @staticmethod
+    def decode_state(body):
+        return json.loads(bytes(body).decode("utf-8"))
+
+    @staticmethod
+    def decode_detection(body):
+        """(frame_seq, ids (N,1) int32 or None, corners [(1,4,2)] or None)"""
+        frame_seq, n = DETECT_HEAD.unpack_from(body, 0)
+        if n == 0:
+            return frame_seq, None, None
+        ids = np.frombuffer(body, dtype=np.int32, count=n, offset=DETECT_HEAD.size)
+        quads = np.frombuffer(body, dtype=np.float32, count=n * 8, offset=DETECT_HEAD.size + 4 * n)
+        quads = quads.reshape(n, 1, 4, 2)
+        return frame_seq, ids.reshape(n, 1), [q for q in quads]
+
+    @staticmethod
+    def decode_detection_time(body):
+        """DETECT 本体の t_frame（開始からの秒）。付いていなければ None"""
+        _, n = DETECT_HEAD.unpack_from(body, 0)
+        off = DETECT_HEAD.size + 36 * n
+        if len(body) < off + DETECT_TAIL.size:
+            return None
+        return DETECT_TAIL.unpack_from(body, off)[0]
+
+    @staticmethod
+    def decode_rc(body):
+        return RC_BODY.unpack_from(body, 0)
+
+    def decode(self, i):
+        """(type, seq, t, 中身)。中身は種別ごとの decode_* の戻り値"""
+        rtype, codec, seq, t, body = self.header(i)
+        if rtype == REC_FRAME:
+            val = self.decode_frame(codec, body)
+        elif rtype == REC_STATE:
+            val = self.decode_state(body)
+        elif rtype == REC_DETECT:
+            val = self.decode_detection(body)
+        else:
+            val = self.decode_rc(body)
+        return rtype, seq, t, val
+
+    def records(self, start=0, stop=None, types=None):
+        """start..stop のレコードを時刻順に decode して出す（types で種別を絞れる）"""
+        stop = len(self.index) if stop is None else min(stop, len(self.index))
+        for i in range(start, stop):
+            if types is not None and int(self.index["type"][i]) not in types:
+                continue
+            yield self.decode(i)
@@ -0,0 +1,97 @@
+# frame_ring.py
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class FrameRing:
+    """
+    デコード済みフレームのリングバッファ（BGR・連続メモリ・事前確保）。
+
+    - 書き手（ストリーム読み出しスレッド）は1フレームにつき1回だけコピーする
+    - 読み手（検出 / 録画 / UI）はスロットのビューをそのまま受け取る（コピーなし）
+    - 各スロットには seq が付く。読み手は latest() か next_after(seq) で取り出す
+
+    スロットは n_slots 回書き込まれると上書きされる。
+    長く保持する読み手は is_valid(seq) で上書きされていないか確認すること。
+    """
+
+    def __init__(self, n_slots=4):
+        if n_slots < 2:
+            raise ValueError("n_slots must be >= 2")
+        self.n_slots = n_slots
+        self._buf = None                  # (n_slots, h, w, 3) uint8
+        self._seqs = [0] * n_slots        # 書き込み中は 0
+        self._stamps = [0.0] * n_slots
+        self.head = 0                     # 公開済みの最新 seq
+        self._cond = threading.Condition()
+
+    @property
+    def shape(self):
+        return None if self._buf is None else self._buf.shape[1:]
+
+    def _alloc(self, h, w):
+        # サイズが変わった時だけ確保し直す（古いビューは古い配列を参照し続けるので安全）
+        self._buf = np.zeros((self.n_slots, h, w, 3), dtype=np.uint8)
+        self._seqs = [0] * self.n_slots
+
+    def write(self, src, flip_rgb=False, stamp=None, remap=None):
+        """
+        src を次のスロットにコピーして公開する。flip_rgb=True なら RGB→BGR もこのコピーで済ませる。
+        remap（undistort.Undistorter）を渡すと、コピーの代わりに歪み補正をスロットへ直接書く。
+        Returns: 公開した seq
+        """
+        h, w = src.shape[:2]
+        if self._buf is None or self._buf.shape[1] != h or self._buf.shape[2] != w:
+            self._alloc(h, w)
+
+        seq = self.head + 1
+        i = seq % self.n_slots
+        self._seqs[i] = 0
+        slot = self._buf[i]
+        if remap is not None:
+            remap.apply(src, dst=slot)
+            if flip_rgb:
+                cv2.cvtColor(slot, cv2.COLOR_RGB2BGR, dst=slot)
+        else:
+            np.copyto(slot, src[:, :, ::-1] if flip_rgb else src)
+        self._stamps[i] = time.perf_counter() if stamp is None else stamp
+        self._seqs[i] = seq
+
+        with self._cond:
+            self.head = seq
+            self._cond.notify_all()
+        return seq
+
+    def latest(self):
+        """(seq, frame)。まだ1枚も無ければ (0, None)"""
+        seq = self.head
+        if seq == 0:
+            return 0, None
+        return seq, self._buf[seq % self.n_slots]
+
+    def next_after(self, seq, timeout=0.0):
+        """
+        seq より新しい最古の（まだ上書きされていない）フレーム。
+        遅れすぎた読み手は飛ばされる。無ければ (seq, None)。
+        """
+        if self.head <= seq and timeout:
+            self.wait_newer(seq, timeout)
+        head = self.head
+        if head <= seq:
+            return seq, None
+        # 次に書かれるスロットは避ける
+        nxt = max(seq + 1, head - self.n_slots + 2)
+        return nxt, self._buf[nxt % self.n_slots]
+
+    def wait_newer(self, seq, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: self.head > seq, timeout)
+
+    def stamp(self, seq):
+        return self._stamps[seq % self.n_slots]
+
+    def is_valid(self, seq):
+        return seq > 0 and self._seqs[seq % self.n_slots] == seq
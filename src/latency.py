@@ -0,0 +1,100 @@
+# latency.py
+import json
+import threading
+
+from vision_worker import StageTimes
+
+
+# 1フレームの時刻スタンプ（perf_counter 秒）。検出結果 → marker_info["stamps"] → TelloController と運ぶ
+#   decode    : デコード済みフレームが FrameRing に入った時刻（撮像〜デコードは測れない）
+#   det_start : 検出開始
+#   det_end   : 検出終了
+# TelloController が control（指令を計算した時刻）と send（send_rc_control が戻った時刻）を足す。
+STAMP_KEYS = ("decode", "det_start", "det_end")
+
+# 区間（名前, 始点, 終点）。total がフレーム到着 → RC送信（glass-to-command のうち測れる分）
+SPANS = (
+    ("wait", "decode", "det_start"),      # リング → 検出開始（検出スレッドの空き待ち）
+    ("detect", "det_start", "det_end"),
+    ("to_control", "det_end", "control"),  # 検出結果が制御に使われるまで（RC周期待ち）
+    ("to_send", "control", "send"),        # 指令計算 → 送信完了
+    ("total", "decode", "send"),
+)
+
+BIN_MS = 1.0
+N_BINS = 500   # 0..500ms（超えた分は最後のビン）
+
+
+class LatencyStats:
+    """
+    フレーム → 指令の区間ごとの遅延。
+    直近 window 件のパーセンタイル（HUD 用）と、飛行全体の 1ms 刻みヒストグラム（書き出し用）を持つ。
+    add() は RC スケジューラ、hud_line() は UI スレッドから呼ばれる。
+    """
+
+    def __init__(self, window=300):
+        self.rolling = StageTimes(window=window)
+        self._lock = threading.Lock()
+        self.bins = {name: [0] * N_BINS for name, _, _ in SPANS}
+        self.count = 0
+        self.unsent = 0   # 指令を計算したが送らなかった（停止指令の連送省略）
+
+    def add(self, stamps, t_control, t_send):
+        t = dict(stamps)
+        t["control"] = t_control
+        t["send"] = t_send
+        with self._lock:
+            for name, a, b in SPANS:
+                ms = (t[b] - t[a]) * 1000.0
+                self.rolling.add(name, ms)
+                self.bins[name][min(N_BINS - 1, max(0, int(ms / BIN_MS)))] += 1
+            self.count += 1
+
+    def hud_line(self):
+        p = self.rolling.percentiles((50, 95))
+        if "total" not in p:
+            return None
+        parts = [f"{name}:{p[name][0]:.0f}/{p[name][1]:.0f}" for name, _, _ in SPANS if name in p]
+        return "LAT p50/p95 ms  " + "  ".join(parts)
+
+    def report(self):
+        p = self.rolling.percentiles((50, 95, 99))
+        return "  ".join(f"{k}={v[0]:.1f}/{v[1]:.1f}/{v[2]:.1f}ms" for k, v in p.items()) + \
+            f"  n={self.count} unsent={self.unsent}"
+
+    def to_dict(self):
+        with self._lock:
+            bins = {k: list(v) for k, v in self.bins.items()}
+            count = self.count
+        out = {"bin_ms": BIN_MS, "count": count, "unsent": self.unsent, "spans": {}}
+        for name, a, b in SPANS:
+            counts = bins[name]
+            out["spans"][name] = {
+                "from": a,
+                "to": b,
+                "percentiles_ms": _bin_percentiles(counts, (50, 90, 95, 99)),
+                "counts": counts,
+            }
+        return out
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        return path
+
+
+def _bin_percentiles(counts, qs):
+    """ヒストグラムから（ビン上端の）パーセンタイル"""
+    n = sum(counts)
+    out = {}
+    if n == 0:
+        return out
+    for q in qs:
+        need = q / 100.0 * n
+        acc = 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= need:
+                out[str(q)] = (i + 1) * BIN_MS
+                break
+    return out
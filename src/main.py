@@ -1,19 +1,71 @@
 # main.py
+import os
 import time
 import cv2
 import numpy as np
 import threading
-from cv2 import aruco
 
 from tello_controller import TelloController
 from aruco_detector import ArUcoDetector
+from marker_track import MarkerTracker
+from pipeline import FlightPipeline
 from ui_overlay import DroneUI
 from keyboard_state import KeyboardState
 from ui_components.display_manager import DisplayManager
+from vision_worker import StageTimes
+import profiling
+import event_log as events
 
 import inspect
 
 
+# 検出を別スレッドに逃がす（False で従来の直列ループ）
+VISION_THREAD = True
+# 検出バックエンド："thread"（検出スレッド内で実行）/ "pool"（ArUcoPool で複数プロセス）
+VISION_BACKEND = "thread"
+VISION_POOL_WORKERS = 2
+# これより古い検出結果は「見失い」扱い（秒）
+VISION_STALE_SEC = 0.3
+# ステージ別レイテンシの表示間隔（秒）
+STATS_PRINT_SEC = 2.0
+# RC送信を固定レートのスレッドで行う（False で従来の毎フレーム送信）
+RC_SCHEDULER = True
+RC_RATE_HZ = 30
+# 映像の読み出し："pyav"（stream_reader.py：PyAV で直接 BGR にデコード、遅れたら非参照フレームを飛ばす）
+#               / "djitellopy"（get_frame_read() → RGB→BGR しながらリングへ）
+#               PyAV（av）が入っていなければ接続時に "djitellopy" に戻る
+VIDEO_READER = "pyav"
+VIDEO_DECODE_THREADS = 2
+VIDEO_THREAD_TYPE = "SLICE"   # "FRAME" は速いが (スレッド数 - 1) フレーム遅れる
+# 状態パケットを djitellopy の受信スレッドから直接受け取れない時（FakeTello など）のポーリング間隔（秒）
+TELEMETRY_POLL_SEC = 0.005
+# マーカーを ID ごとのカルマンフィルタで追い、RC周期ごとに予測した値で制御する
+# （短い見失いは予測でつなぐ。False で従来の「最新の検出＋EMA」）
+MARKER_TRACKER = True
+MARKER_FULL_SEARCH_EVERY = 10   # 追跡中もこのフレーム数ごとに全画面探索（見えている ID の一覧・"n" の切替用）
+# マーカーの姿勢推定（solvePnP）で距離/向きをメートル・度で制御する
+POSE_MODE = False
+CAMERA_CALIB_PATH = "camera_calib.npz"   # arucomarker calibrate で作る。無ければ Tello の概算値を使う
+# 歪み補正（事前計算したマップで remap。CAMERA_CALIB_PATH が必要）
+UNDISTORT = False
+# フライトレコーダ（フレーム / 状態 / 検出 / RC を logs/*.tlog に記録）
+RECORD = False
+RECORD_DIR = "logs"
+RECORD_FPS = 15
+RECORD_JPEG_QUALITY = 80   # None で無圧縮
+MARKER_LENGTH_M = 0.15                   # マーカー黒枠の一辺（m）
+# フレーム到着 → RC送信の遅延ヒストグラムを終了時に書き出す（latency.py）
+LATENCY_EXPORT_DIR = "logs"   # None で書き出さない
+# 計測 span（profiling.py）。o キーで集計の木を表示し Chrome trace を書き出す（無効なら o で開始）
+PROFILE = False
+PROFILE_DIR = "logs"
+# 構造化イベントログ（event_log.py）。RC指令などの DEBUG は毎周期ファイルへ、INFO 以上は端末にも
+EVENT_LOG_DIR = "logs"        # None でファイルに書かない（端末だけ）
+EVENT_LOG_LEVEL = "DEBUG"
+EVENT_CONSOLE_LEVEL = "INFO"
+EVENT_SAMPLE = {"detect_failed": 60}   # 検出失敗の警告は 60 件に1件
+
+
 def safe_call(fn, default=None):
     try:
         return fn()
@@ -22,39 +74,84 @@ def safe_call(fn, default=None):
 
 
 def main():
-    print("[USING CONTROLLER FILE]", inspect.getfile(TelloController))
-    print("[USING CONTROLLER SRC HEAD]", inspect.getsource(TelloController)[:200])
+    events.configure(
+        os.path.join(EVENT_LOG_DIR, time.strftime("events_%Y%m%d_%H%M%S.jsonl")) if EVENT_LOG_DIR else None,
+        level=EVENT_LOG_LEVEL, console_level=EVENT_CONSOLE_LEVEL, sample=EVENT_SAMPLE,
+    )
+    events.info("startup", controller_file=inspect.getfile(TelloController))
+
+    if PROFILE:
+        profiling.enable(trace=True)
 
     kb = KeyboardState()
     controller = TelloController(kb)
+    controller.telemetry.poll_sec = TELEMETRY_POLL_SEC
     detector = ArUcoDetector()
     ui = DroneUI(panel_width=260, bottom_margin=60)
 
-    # ArUco params
-    try:
-        aruco_params = aruco.DetectorParameters()
-    except AttributeError:
-        aruco_params = aruco.DetectorParameters_create()
-
-    aruco_params.adaptiveThreshWinSizeMin = 3
-    aruco_params.adaptiveThreshWinSizeMax = 53
-    aruco_params.adaptiveThreshWinSizeStep = 4
-    aruco_params.minMarkerPerimeterRate = 0.02
-    aruco_params.maxMarkerPerimeterRate = 5.0
-    try:
-        aruco_params.cornerRefinementMethod = aruco.CORNER_REFINE_SUBPIX
-    except Exception:
-        pass
-    aruco_dict = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
+    if UNDISTORT:
+        from undistort import Undistorter
+        try:
+            controller.undistort = Undistorter.from_file(CAMERA_CALIB_PATH, frame_size=(960, 720))
+        except Exception as e:
+            events.warn("undistort", f"undistort disabled: camera calibration not loaded ({e})")
+
+    if POSE_MODE:
+        from marker_pose import MarkerPoseEstimator
+        if controller.undistort is not None:
+            # 補正済みフレームなので歪みは 0
+            detector.pose = MarkerPoseEstimator(controller.undistort.new_K, np.zeros((1, 5)), MARKER_LENGTH_M)
+        else:
+            try:
+                detector.pose = MarkerPoseEstimator.from_file(CAMERA_CALIB_PATH, MARKER_LENGTH_M,
+                                                              frame_size=(960, 720))
+            except Exception as e:
+                events.warn("pose", f"camera calibration not loaded ({e}); using approximate Tello intrinsics")
+                detector.pose = MarkerPoseEstimator.approx_tello(MARKER_LENGTH_M)
+
+    if VIDEO_READER == "pyav":
+        from stream_reader import H264StreamReader
+        controller.video_reader = H264StreamReader(controller.frame_ring, threads=VIDEO_DECODE_THREADS,
+                                                   thread_type=VIDEO_THREAD_TYPE)
 
     threading.Thread(target=controller.connect_and_start_stream, daemon=True).start()
 
-    print("Controls: t=takeoff, g=land, p=approach ON/OFF, z=quit")
+    stats = StageTimes()
+    pipe = FlightPipeline(
+        controller,
+        detector,
+        vision=VISION_THREAD,
+        backend=VISION_BACKEND,
+        pool_workers=VISION_POOL_WORKERS,
+        tracker=MarkerTracker() if MARKER_TRACKER else None,
+        full_search_every=MARKER_FULL_SEARCH_EVERY,
+        stale_sec=VISION_STALE_SEC,
+        stats=stats,
+    )
+    vision = pipe.vision
+    last_stats_print = time.perf_counter()
+
+    recorder = None
+    if RECORD:
+        from flight_log import FlightRecorder
+        recorder = FlightRecorder(
+            os.path.join(RECORD_DIR, time.strftime("flight_%Y%m%d_%H%M%S.tlog")),
+            jpeg_quality=RECORD_JPEG_QUALITY,
+            frame_fps=RECORD_FPS,
+        ).start()
+        recorder.attach_ring(controller.frame_ring)
+        controller.telemetry.on_packet = recorder.state
+        controller.recorder = recorder
+        pipe.recorder = recorder
+        events.info("rec", f"recording to {recorder.path}")
+
+    pipe.start(rc_rate_hz=RC_RATE_HZ if RC_SCHEDULER else None)
+
+    print("Controls: t=takeoff, g=land, p=approach ON/OFF, n=next target ID, o=profile dump, z=quit")
 
     prev_height = None
+    last_snap_seq = 0
     total_alt = 0.0
-    aruno_id = None
-    aruno_last = None
 
     pos_xy = np.array([-1.8, 0.5], dtype=float)
     vel_xy = np.array([0.0, 0.0], dtype=float)
@@ -72,13 +169,13 @@ def main():
         ui_min=260,
         ui_max=700,
     )
+    dm.add_resize_listener(ui.invalidate_cache)
 
-    blank_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    # 表示用フレーム（リングのスロットには描かないよう、毎フレームここへ1回だけコピー）
+    disp = np.zeros((480, 640, 3), dtype=np.uint8)
     frame_count = 0
 
     while True:
-        marker_info = None
-
         frame_count += 1
         now = time.perf_counter()
         dt = max(1e-3, now - prev_time)
@@ -87,62 +184,31 @@ def main():
         DISPLAY_W, DISPLAY_H, UI_W = dm.update()
 
         left_w = max(1, DISPLAY_W - UI_W)
-        if blank_frame.shape[0] != DISPLAY_H or blank_frame.shape[1] != left_w:
-            blank_frame = np.zeros((DISPLAY_H, left_w, 3), dtype=np.uint8)
 
         connected = getattr(controller, "frame_read", None) is not None
 
-        frame = None
+        src = None
         if connected:
-            frame = safe_call(controller.get_frame, None)
-        if frame is None or frame.size == 0:
-            frame = blank_frame.copy()
-
-        # ---- ArUco detect ----
-        ids = None
-        corners = None
-        marker_info = None
-
-        try:
-            frame = np.ascontiguousarray(frame)
-
-            def _run_detect(src):
-                try:
-                    return aruco.detectMarkers(src, aruco_dict, parameters=aruco_params)
-                except AttributeError:
-                    if hasattr(aruco, "ArucoDetector"):
-                        ad = aruco.ArucoDetector(aruco_dict, aruco_params)
-                        return ad.detectMarkers(src)
-                    return (None, None, None)
-
-            c, i, _ = _run_detect(frame)
-            if i is None or len(i) == 0:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                c, i, _ = _run_detect(gray)
-
-            corners, ids = c, i
-
-            if ids is not None and len(ids) > 0:
-                aruco.drawDetectedMarkers(frame, corners, ids)
-                aruno_id = int(ids.flatten()[0])
-                aruno_last = aruno_id
+            src = safe_call(controller.get_frame, None)
+        if src is None or src.size == 0:
+            if disp.shape[0] != DISPLAY_H or disp.shape[1] != left_w:
+                disp = np.zeros((DISPLAY_H, left_w, 3), dtype=np.uint8)
             else:
-                aruno_id = None
-
-            marker_info = detector.get_marker_info(
-                ids, corners, target_id=getattr(controller, "target_aruco_id", None)
-            )
+                disp[:] = 0
+        else:
+            if disp.shape != src.shape:
+                disp = np.empty_like(src)
+            np.copyto(disp, src)
+        frame = disp
 
-            # ★目視デバッグ：マーカー中心に点＋誤差線
-            if marker_info is not None:
-                cx, cy = marker_info["center"]
-                cv2.circle(frame, (int(cx), int(cy)), 6, (0, 255, 255), -1, cv2.LINE_AA)  # 黄色点
-                midx = frame.shape[1] // 2
-                cv2.line(frame, (midx, int(cy)), (int(cx), int(cy)), (0, 255, 255), 2, cv2.LINE_AA)
+        # ---- ArUco detect ----
+        t_stage = time.perf_counter()
+        det = pipe.detect_step(frame, t_stage)
+        aruno_id = det["aruno"]
 
-        except Exception as e:
-            if frame_count % 60 == 0:
-                print(f"[WARN] ArUco detect failed: {e}")
+        t_now = time.perf_counter()
+        stats.add("detect" if vision is None else "vision_read", (t_now - t_stage) * 1000.0)
+        t_stage = t_now
 
         # ---- telemetry ----
         yaw = pitch = roll = None
@@ -153,57 +219,24 @@ def main():
         temp = None
         flight_time = None
 
-        if connected:
-            t = controller.tello
-
-            yaw = safe_call(t.get_yaw, None)
-            if yaw is not None:
-                try:
-                    yaw = -float(yaw)
-                except Exception:
-                    pass
-            pitch = safe_call(t.get_pitch, None)
-            roll = safe_call(t.get_roll, None)
-
-            height = safe_call(t.get_height, None)
-            battery = safe_call(t.get_battery, None)
-
-            if height is not None:
+        snap = controller.telemetry.latest
+        if connected and snap.seq > 0:
+            yaw = None if snap.yaw is None else -snap.yaw
+            pitch = snap.pitch
+            roll = snap.roll
+            height = snap.height
+            battery = snap.battery
+            agx, agy, agz = snap.agx, snap.agy, snap.agz
+            temp = snap.temp
+            flight_time = snap.flight_time
+            speed = snap.speed
+
+            # 高度の累積はパケットが変わった時だけ
+            if height is not None and snap.seq != last_snap_seq:
                 if prev_height is not None:
-                    try:
-                        total_alt += abs(float(height) - float(prev_height))
-                    except Exception:
-                        pass
+                    total_alt += abs(height - prev_height)
                 prev_height = height
-
-            st = safe_call(t.get_current_state, {})
-
-            try:
-                agx = int(float(st.get("agx", 0)))
-                agy = int(float(st.get("agy", 0)))
-                agz = int(float(st.get("agz", 0)))
-            except Exception:
-                agx = agy = agz = None
-
-            try:
-                templ = float(st.get("templ", 0))
-                temph = float(st.get("temph", 0))
-                temp = (templ + temph) / 2.0
-            except Exception:
-                temp = None
-
-            try:
-                flight_time = int(float(st.get("time", 0)))
-            except Exception:
-                flight_time = None
-
-            try:
-                vgx = float(st.get("vgx", 0))
-                vgy = float(st.get("vgy", 0))
-                vgz = float(st.get("vgz", 0))
-                speed = (vgx * vgx + vgy * vgy + vgz * vgz) ** 0.5
-            except Exception:
-                speed = None
+            last_snap_seq = snap.seq
 
             # 加速度積分（UI用）
             if agx is not None and agy is not None:
@@ -228,6 +261,10 @@ def main():
                 except Exception:
                     pass
 
+        t_now = time.perf_counter()
+        stats.add("telemetry", (t_now - t_stage) * 1000.0)
+        t_stage = t_now
+
         # ---- UI ----
         out = ui.compose_side(
             frame,
@@ -235,6 +272,7 @@ def main():
             display_h=DISPLAY_H,
             ui_w=UI_W,
             ui_bg=(0, 0, 0),
+            out=dm.canvas(),
             battery=battery,
             roll=roll,
             pitch=pitch,
@@ -244,7 +282,7 @@ def main():
             speed=speed,
             agx=agx, agy=agy, agz=agz,
             aruno=aruno_id,
-            aruno_last=aruno_last,
+            aruno_last=pipe.aruno_last,
             temp=temp,
             flight_time=flight_time,
             pos_xy=pos_xy,
@@ -257,12 +295,18 @@ def main():
             approach_yaw=getattr(controller, "approach_yaw", None),
             approach_err_x=getattr(controller, "approach_err_x", None),
             approach_size_px=getattr(controller, "approach_size_px", None),
+            latency_text=controller.latency.hud_line(),
         )
 
         out = dm.fit(out)
         cv2.imshow(dm.window_name, out)
 
         key = cv2.waitKey(1) & 0xFF
+
+        t_now = time.perf_counter()
+        stats.add("ui", (t_now - t_stage) * 1000.0)
+        t_stage = t_now
+
         if key == ord("z"):
             break
 
@@ -271,23 +315,73 @@ def main():
             if should_quit:
                 break
 
-        # ---- RC control ----
-        if controller.in_flight:
-            # 1) 手動入力反映
-            controller.update_motion_from_keyboard()
+        # o: 計測の表示と Chrome trace の書き出し
+        if key == ord("o"):
+            if not profiling.is_enabled():
+                profiling.enable(trace=True)
+                events.info("prof", "profiling started (press o again to dump)")
+            else:
+                events.info("prof", "\n" + profiling.summary())
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                path = profiling.export_chrome_trace(
+                    os.path.join(PROFILE_DIR, time.strftime("trace_%Y%m%d_%H%M%S.json")))
+                events.info("prof", f"chrome trace -> {path}")
 
-            # 2) セミオートがONなら上書き（manual_active() 内で手動なら無効化）
-            if getattr(controller, "approach_enabled", False):
-                controller.update_approach_from_aruco(marker_info, frame.shape)
+        # n: 追う ID を見えているマーカーの中で切り替える（一周すると自動選択に戻る）
+        if key == ord("n") and pipe.tracker is not None:
+            events.info("target", id=pipe.next_target())
 
-            # 3) 送信（毎フレーム）
-            controller.update_motion()
+        # ---- RC control ----
+        # スケジューラ稼働中は送信もそちらに任せる
+        pipe.control_step()
+
+        t_now = time.perf_counter()
+        stats.add("control", (t_now - t_stage) * 1000.0)
+        stats.add("loop", (t_now - now) * 1000.0)
+        if t_now - last_stats_print > STATS_PRINT_SEC:
+            last_stats_print = t_now
+            events.info("loop", f"{stats.report()}  ui_widgets={ui.widgets_redrawn}/{ui.widgets_total}")
+            if detector.mode != "legacy":
+                stages = "  ".join(f"{k}={h}/{n}({ms:.1f}ms)" for k, (n, h, ms) in detector.stage_report().items())
+                events.info("aruco", f"{stages}  budget_cut={detector.budget_cut}  "
+                                     f"roi={detector.roi_hits}/{detector.roi_hits + detector.roi_misses} full={detector.full_searches}")
+            events.info("telem", controller.telemetry.report())
+            if controller.video_reader is not None:
+                events.info("video", controller.video_reader.report())
+            if detector.pose is not None:
+                events.info("pose", f"{detector.pose.report()}  dist={controller.approach_distance_m}  "
+                                    f"yaw_err={controller.approach_yaw_err}")
+            if vision is not None and vision.pool is not None:
+                events.info("pool", vision.pool.report())
+            if vision is not None and vision.overrun:
+                events.warn("vision", "detection slower than the frame ring; results dropped", overrun=vision.overrun)
+            if controller.rc_scheduler_running:
+                events.info("rc", controller.rc_report())
+            if recorder is not None:
+                events.info("rec", recorder.report())
+            if controller.latency.count:
+                events.info("lat", controller.latency.report())
 
         time.sleep(0.02)
 
+    pipe.stop()
     controller.cleanup()
+    if recorder is not None:
+        recorder.stop()
+    if LATENCY_EXPORT_DIR and controller.latency.count:
+        os.makedirs(LATENCY_EXPORT_DIR, exist_ok=True)
+        path = controller.latency.export(
+            os.path.join(LATENCY_EXPORT_DIR, time.strftime("latency_%Y%m%d_%H%M%S.json")))
+        events.info("lat", f"{controller.latency.report()}  -> {path}")
+    events.info("events", events.get().report())
+    events.close()
     cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "--replay":
+        # python main.py --replay logs/xxx.tlog [replay.py のオプション]
+        from replay import main as replay_main
+        sys.exit(replay_main(sys.argv[2:]))
     main()
@@ -0,0 +1,194 @@
+# marker_pose.py
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+# Tello（960x720）の概算内部パラメータ。キャリブレーション結果が無い時だけ使う
+TELLO_APPROX_SIZE = (960, 720)
+TELLO_APPROX_K = np.array([[921.2, 0.0, 480.0],
+                           [0.0, 919.0, 360.0],
+                           [0.0, 0.0, 1.0]], dtype=np.float64)
+
+
+def load_intrinsics(path):
+    """
+    カメラ内部パラメータを読む。
+      .npz       : camera_matrix, dist_coeffs（, image_size）
+      .yml/.yaml : cv2.FileStorage の camera_matrix, dist_coeffs（, image_size）
+    Returns: (camera_matrix 3x3, dist_coeffs 1xN, image_size (w,h) or None)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npz":
+        with np.load(path) as z:
+            K = np.asarray(z["camera_matrix"], dtype=np.float64)
+            dist = np.asarray(z["dist_coeffs"], dtype=np.float64)
+            size = tuple(int(v) for v in z["image_size"]) if "image_size" in z else None
+    else:
+        fs = cv2.FileStorage(path, cv2.FILE_STORAGE_READ)
+        try:
+            K = fs.getNode("camera_matrix").mat()
+            dist = fs.getNode("dist_coeffs").mat()
+            node = fs.getNode("image_size")
+            size = None if node.empty() else tuple(int(v) for v in node.mat().reshape(-1))
+        finally:
+            fs.release()
+        if K is None or dist is None:
+            raise ValueError(f"camera_matrix / dist_coeffs not found in {path}")
+        K = K.astype(np.float64)
+        dist = dist.astype(np.float64)
+    return K, dist.reshape(1, -1), size
+
+
+def scale_intrinsics(K, from_size, to_size):
+    """解像度が違う時の内部パラメータ（fx, cx は幅、fy, cy は高さの比で伸縮）"""
+    sx = to_size[0] / float(from_size[0])
+    sy = to_size[1] / float(from_size[1])
+    K2 = K.copy()
+    K2[0, 0] *= sx
+    K2[0, 2] *= sx
+    K2[1, 1] *= sy
+    K2[1, 2] *= sy
+    return K2
+
+
+class MarkerPoseEstimator:
+    """
+    マーカー1枚ごとの solvePnP（IPPE_SQUARE）。
+
+    - 内部パラメータとマーカーの3D座標は最初に1回だけ用意する
+    - 4隅がほとんど動いていないフレームは PnP を省いて前回の結果を返す
+    - IPPE_SQUARE は閉形式なので初期値は取らない。代わりに2つの解のうち
+      再投影誤差が拮抗している時は前回の姿勢に近い方を選ぶ（正面付近の反転を防ぐ）
+    - 1フレームで解くのは max_markers 枚まで（コストの上限）
+
+    返す dict:
+        distance_m  : カメラ→マーカー中心の距離
+        x_m, y_m, z_m : カメラ座標（x:右 y:下 z:前）
+        bearing_deg : マーカー中心の方位（+ で右）
+        yaw_err_deg : マーカー面の向きのずれ（+ で右辺が手前＝skew と同じ符号）
+        reproj_px   : 再投影誤差
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, marker_len_m, *, move_eps_px=0.3, max_markers=4,
+                 ambiguity_ratio=1.5):
+        self.K = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist = np.asarray(dist_coeffs, dtype=np.float64).reshape(1, -1)
+        self.marker_len_m = float(marker_len_m)
+        self.move_eps_px = move_eps_px
+        self.max_markers = max_markers
+        self.ambiguity_ratio = ambiguity_ratio
+
+        h = self.marker_len_m / 2.0
+        # IPPE_SQUARE が要求する順（TL, TR, BR, BL。z=0 平面、y は上向き）
+        self.obj_pts = np.array([[-h, h, 0.0], [h, h, 0.0], [h, -h, 0.0], [-h, -h, 0.0]], dtype=np.float64)
+
+        self._cache = {}   # id -> (quad, rvec, tvec, result)
+        self.pnp_runs = 0
+        self.pnp_skipped = 0
+        self.pnp_failed = 0
+        self.last_ms = 0.0
+
+    @classmethod
+    def from_file(cls, path, marker_len_m, frame_size=None, **kwargs):
+        """キャリブレーションファイルから作る。frame_size が違えば内部パラメータを伸縮する"""
+        K, dist, size = load_intrinsics(path)
+        if frame_size is not None and size is not None and tuple(frame_size) != tuple(size):
+            K = scale_intrinsics(K, size, frame_size)
+        return cls(K, dist, marker_len_m, **kwargs)
+
+    @classmethod
+    def approx_tello(cls, marker_len_m, frame_size=TELLO_APPROX_SIZE, **kwargs):
+        """キャリブレーション無し用（歪み0の概算値）"""
+        K = scale_intrinsics(TELLO_APPROX_K, TELLO_APPROX_SIZE, frame_size)
+        return cls(K, np.zeros((1, 5)), marker_len_m, **kwargs)
+
+    def reset(self):
+        self._cache.clear()
+
+    def _solve(self, quad, prev):
+        img_pts = quad.reshape(4, 1, 2).astype(np.float64)
+        n, rvecs, tvecs, errs = cv2.solvePnPGeneric(
+            self.obj_pts, img_pts, self.K, self.dist, flags=cv2.SOLVEPNP_IPPE_SQUARE
+        )
+        if n == 0:
+            return None
+        errs = np.asarray(errs).reshape(-1)
+        best = int(np.argmin(errs))
+        if n > 1 and prev is not None:
+            other = 1 - best
+            if errs[other] <= errs[best] * self.ambiguity_ratio:
+                # 誤差が拮抗 → 前回の回転に近い方
+                d = [np.linalg.norm(rvecs[i].reshape(3) - prev.reshape(3)) for i in (best, other)]
+                if d[1] < d[0]:
+                    best = other
+        return rvecs[best].reshape(3), tvecs[best].reshape(3), float(errs[best])
+
+    @staticmethod
+    def _to_result(rvec, tvec, err):
+        x, y, z = (float(v) for v in tvec)
+        R, _ = cv2.Rodrigues(rvec)
+        # マーカー面の法線（カメラ座標）。正対していれば (0, 0, -1)
+        nx, nz = float(R[0, 2]), float(R[2, 2])
+        return {
+            "distance_m": math.sqrt(x * x + y * y + z * z),
+            "x_m": x,
+            "y_m": y,
+            "z_m": z,
+            "bearing_deg": math.degrees(math.atan2(x, z)),
+            "yaw_err_deg": math.degrees(math.atan2(-nx, -nz)),
+            "reproj_px": err,
+        }
+
+    def estimate(self, marker_id, quad):
+        """1枚分。quad は (4,2)。解けなければ None"""
+        quad = np.asarray(quad, dtype=np.float32).reshape(4, 2)
+        cached = self._cache.get(marker_id)
+        if cached is not None:
+            moved = float(np.abs(quad - cached[0]).max())
+            if moved < self.move_eps_px:
+                self.pnp_skipped += 1
+                return cached[3]
+
+        t0 = time.perf_counter()
+        sol = self._solve(quad, None if cached is None else cached[1])
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        if sol is None:
+            self.pnp_failed += 1
+            self._cache.pop(marker_id, None)
+            return None
+        self.pnp_runs += 1
+        rvec, tvec, err = sol
+        result = self._to_result(rvec, tvec, err)
+        self._cache[marker_id] = (quad.copy(), rvec, tvec, result)
+        return result
+
+    def estimate_all(self, geo, first=None):
+        """
+        marker_geometry() の結果から最大 max_markers 枚を解く（first の行を最優先）。
+        Returns: {id: result}
+        """
+        if geo is None:
+            return {}
+        rows = list(range(len(geo["ids"])))
+        if first is not None and first in rows:
+            rows.remove(first)
+            rows.insert(0, first)
+        out = {}
+        for i in rows:
+            if len(out) >= self.max_markers:
+                break
+            mid = int(geo["ids"][i])
+            if mid in out:
+                continue
+            res = self.estimate(mid, geo["quads"][i])
+            if res is not None:
+                out[mid] = res
+        return out
+
+    def report(self):
+        return (f"pnp runs={self.pnp_runs} skipped={self.pnp_skipped} failed={self.pnp_failed} "
+                f"last={self.last_ms:.2f}ms")
@@ -0,0 +1,196 @@
+# marker_track.py
+import math
+import threading
+
+import numpy as np
+
+
+class KalmanTrack:
+    """
+    マーカー1枚分の等速カルマンフィルタ（中心 x, 中心 y, size_px, skew）。
+
+    4つの量は互いに独立として、2状態（値, 速度）のフィルタ4本を配列でまとめて回す。
+    時刻は秒（perf_counter）。観測の間隔がばらついても dt ごとに正しく予測する。
+    """
+
+    __slots__ = ("x", "P", "t", "t_obs", "t_first", "hits", "extra")
+
+    def __init__(self, z, t, r, init_vel_var):
+        self.x = np.zeros((4, 2), dtype=np.float64)
+        self.x[:, 0] = z
+        self.P = np.zeros((4, 2, 2), dtype=np.float64)
+        self.P[:, 0, 0] = r
+        self.P[:, 1, 1] = init_vel_var
+        self.t = t          # x, P の時刻
+        self.t_obs = t      # 最後に観測した時刻
+        self.t_first = t    # トラックを作った時刻
+        self.hits = 1
+        self.extra = {}     # 姿勢推定などフィルタしない値（最後の観測のまま）
+
+    def predict(self, t, q):
+        dt = t - self.t
+        if dt <= 0:
+            return
+        P = self.P
+        p00, p01, p11 = P[:, 0, 0].copy(), P[:, 0, 1].copy(), P[:, 1, 1]
+        dt2 = dt * dt
+        P[:, 0, 0] = p00 + 2.0 * dt * p01 + dt2 * p11 + q * (dt2 * dt2 / 4.0)
+        P[:, 0, 1] = P[:, 1, 0] = p01 + dt * p11 + q * (dt2 * dt / 2.0)
+        P[:, 1, 1] = p11 + q * dt2
+        self.x[:, 0] += dt * self.x[:, 1]
+        self.t = t
+
+    def innovation(self, z, r):
+        """観測とのマハラノビス距離²（4次元の合計）"""
+        y = z - self.x[:, 0]
+        return float(np.sum(y * y / (self.P[:, 0, 0] + r)))
+
+    def update(self, z, r):
+        P = self.P
+        S = P[:, 0, 0] + r
+        k0 = P[:, 0, 0] / S
+        k1 = P[:, 0, 1] / S
+        y = z - self.x[:, 0]
+        self.x[:, 0] += k0 * y
+        self.x[:, 1] += k1 * y
+        p01 = P[:, 0, 1].copy()
+        P[:, 1, 1] -= k1 * p01
+        P[:, 0, 1] = P[:, 1, 0] = (1.0 - k0) * p01
+        P[:, 0, 0] *= (1.0 - k0)
+        self.t_obs = self.t
+        self.hits += 1
+
+
+class MarkerTracker:
+    """
+    ID ごとの KalmanTrack の表（見えている全マーカー）。検出が来たら observe()、制御周期ごとに estimate()。
+
+    - 検出が途切れても max_coast_sec までは等速で予測を続ける（予測は max_predict_sec で頭打ち）
+    - confidence は「観測回数」と「最後の観測からの経過」から 0..1 で出す
+      （coast_after_sec を過ぎるまでは下げない。検出が制御より遅いだけなら 1 のまま）
+    - 観測が予測から大きく外れたら（gate）作り直す（ID の付け替わり・誤検出対策）
+    - estimate() の戻り値は get_marker_info と同じキー（center, size_px, skew, id）に
+      confidence / coasting / age / velocity を足したもの
+    - 更新は1フレームあたり O(マーカー数)、ID の引き当ては dict 1回。追う ID を途中で
+      切り替えても（cycle_target）そのトラックは既に温まっている
+    - observe()（RCスケジューラ）と table()（UI）が別スレッドから呼ばれてもよい
+    """
+
+    def __init__(self, *, accel=(1500.0, 1500.0, 600.0, 2.0), meas_std=(2.0, 2.0, 3.0, 0.02),
+                 init_vel_std=(300.0, 300.0, 150.0, 0.5), max_coast_sec=0.6, max_predict_sec=0.3,
+                 coast_after_sec=0.12, visible_sec=0.5, conf_tau=0.25, min_hits=3, gate=50.0):
+        self.q = np.asarray(accel, dtype=np.float64) ** 2
+        self.r = np.asarray(meas_std, dtype=np.float64) ** 2
+        self.init_vel_var = np.asarray(init_vel_std, dtype=np.float64) ** 2
+        self.max_coast_sec = max_coast_sec
+        self.max_predict_sec = max_predict_sec
+        self.coast_after_sec = coast_after_sec   # 検出の遅れ・間引きの範囲は「見えている」扱い
+        # visible_ids / cycle_target で「見えている」とみなす間隔（追跡中の ROI 外のマーカーは
+        # 全画面探索の周期でしか観測されないので coast_after_sec より長くとる。max_coast_sec 以下）
+        self.visible_sec = min(visible_sec, max_coast_sec)
+        self.conf_tau = conf_tau
+        self.min_hits = min_hits
+        self.gate = gate
+        self.tracks = {}
+        self.resets = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.tracks.clear()
+
+    def observe(self, geo, t, info=None):
+        """
+        geo: aruco_detector.marker_geometry() の戻り値（None なら何もしない＝予測を続ける）
+        info: get_marker_info() の戻り値。姿勢推定の値などはその ID の extra に残す
+        """
+        with self._lock:
+            self._observe(geo, t, info)
+
+    def _observe(self, geo, t, info):
+        self._expire(t)
+        if geo is None:
+            return
+        z_all = np.column_stack((geo["centers"], geo["size_px"], geo["skew"])).astype(np.float64)
+        for mid, row in geo["index"].items():
+            z = z_all[row]
+            tr = self.tracks.get(mid)
+            if tr is None or t < tr.t_obs:
+                self.tracks[mid] = tr = KalmanTrack(z, t, self.r, self.init_vel_var)
+            else:
+                tr.predict(t, self.q)
+                if tr.innovation(z, self.r) > self.gate:
+                    self.resets += 1
+                    self.tracks[mid] = tr = KalmanTrack(z, t, self.r, self.init_vel_var)
+                else:
+                    tr.update(z, self.r)
+            if info is not None and info.get("id") == mid:
+                tr.extra = {k: v for k, v in info.items() if k not in ("center", "size_px", "skew", "corners", "id")}
+
+    def _expire(self, t):
+        dead = [mid for mid, tr in self.tracks.items() if t - tr.t_obs > self.max_coast_sec]
+        for mid in dead:
+            del self.tracks[mid]
+
+    def confidence(self, tr, t):
+        coast = max(0.0, t - tr.t_obs - self.coast_after_sec)
+        return min(1.0, tr.hits / float(self.min_hits)) * math.exp(-coast / self.conf_tau)
+
+    def estimate(self, marker_id, t):
+        """
+        時刻 t の推定（状態は書き換えない）。marker_id=None なら一番確かなトラック。
+        トラックが無い / 見失いすぎなら None。
+        """
+        with self._lock:
+            return self._estimate(marker_id, t)
+
+    def _estimate(self, marker_id, t):
+        self._expire(t)
+        if marker_id is None:
+            if not self.tracks:
+                return None
+            marker_id = max(self.tracks, key=lambda m: self.confidence(self.tracks[m], t))
+        tr = self.tracks.get(marker_id)
+        if tr is None:
+            return None
+
+        dt = min(max(0.0, t - tr.t), self.max_predict_sec)
+        x = tr.x[:, 0] + dt * tr.x[:, 1]
+        age = max(0.0, t - tr.t_obs)
+        out = dict(tr.extra)
+        out.update({
+            "id": int(marker_id),
+            "center": (float(x[0]), float(x[1])),
+            "size_px": float(max(1.0, x[2])),
+            "skew": float(x[3]),
+            "velocity": (float(tr.x[0, 1]), float(tr.x[1, 1])),
+            "confidence": self.confidence(tr, t),
+            "coasting": age > self.coast_after_sec,
+            "age": age,
+            "hits": tr.hits,
+        })
+        return out
+
+    def visible_ids(self, t):
+        """今見えている（visible_sec 以内に観測した）ID を昇順で"""
+        with self._lock:
+            return sorted(m for m, tr in self.tracks.items() if t - tr.t_obs <= self.visible_sec)
+
+    def table(self, t):
+        """全トラックの時刻 t の推定（ID 昇順）。UI / ログ用"""
+        with self._lock:
+            self._expire(t)
+            return [self._estimate(m, t) for m in sorted(self.tracks)]
+
+    def cycle_target(self, current, t):
+        """
+        見えている ID の中で current の次（昇順で一周したら None＝自動選択）。
+        見えている ID が無ければ None。
+        """
+        ids = self.visible_ids(t)
+        if not ids:
+            return None
+        if current is None:
+            return ids[0]
+        later = [m for m in ids if m > current]
+        return later[0] if later else None
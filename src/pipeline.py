@@ -0,0 +1,249 @@
+# pipeline.py
+import time
+
+import cv2
+from cv2 import aruco
+
+from aruco_detector import marker_geometry
+from vision_worker import LatestSlot, StageTimes, VisionWorker
+import event_log as events
+
+
+class FlightPipeline:
+    """
+    main.py の「検出 → 追跡表 → 制御」の配線。bench.py も同じものを回す。
+
+        pipe = FlightPipeline(controller, detector, tracker=MarkerTracker())
+        pipe.start(rc_rate_hz=30)          # 検出スレッド + RCスケジューラ（on_tick=control_tick）
+        while ...:
+            det = pipe.detect_step(frame)  # 最新の検出結果（直列モードならここで検出）＋表示フレームへの描画
+            ...
+            pipe.control_step()            # スケジューラが無い時だけ：毎フレーム指令を計算して送る
+        pipe.stop()
+
+    - vision=True なら VisionWorker（backend="pool" なら ArUcoPool）が検出し、detect_step() は読むだけ
+    - tracker（marker_track.MarkerTracker）があれば RC 周期ごとにその時刻の予測で制御する
+      （検出器は full_search_every フレームごとに全画面探索して、ROI の外の ID も追跡表に入れる）
+    - recorder（flight_log.FlightRecorder）を入れると検出結果を記録する。制御が新しい結果を取り込む時に
+      1回だけ、取り込んだ時刻と追跡表に入れる t_frame を付けて（replay.py が同じ順・同じ時刻で流し直せるように）
+    """
+
+    def __init__(self, controller, detector, *, vision=True, backend="thread", pool_workers=2,
+                 tracker=None, full_search_every=10, stale_sec=0.3, stats=None, recorder=None):
+        self.controller = controller
+        self.detector = detector
+        self.tracker = tracker
+        self.stale_sec = stale_sec   # これより古い検出結果は「見失い」扱い（秒）
+        self.stats = stats if stats is not None else StageTimes()
+        self.recorder = recorder
+        if tracker is not None:
+            # ROI 追跡中も時々全画面で探して、追跡表に他の ID も入れる（表示・ターゲット切替用）
+            detector.track_full_every = full_search_every
+
+        # 直列モードの検出結果（RCスケジューラから読む）
+        self.marker_slot = LatestSlot()
+        self._track_seq = 0
+        self.aruno_last = None
+
+        self.vision = None
+        if vision:
+            pool = None
+            if backend == "pool":
+                from aruco_pool import ArUcoPool
+                pool = ArUcoPool(workers=pool_workers)
+                pool.local.pose = detector.pose
+            self.vision = VisionWorker(
+                controller.get_frame,
+                detector,
+                target_id_fn=self.target_id,
+                ready_fn=lambda: getattr(controller, "frame_read", None) is not None,
+                stats=self.stats,
+                pool=pool,
+                ring=controller.frame_ring,
+            )
+
+    def target_id(self):
+        return getattr(self.controller, "target_aruco_id", None)
+
+    # -----------------------
+    # 起動 / 停止
+    # -----------------------
+    def start(self, rc_rate_hz=None):
+        if self.vision is not None:
+            self.vision.start()
+            if self.controller.video_reader is not None:
+                # 検出が追いつかない間はデコーダも非参照フレームを飛ばす
+                self.controller.video_reader.consumer_seq = lambda: self.vision.last_seq
+        if rc_rate_hz:
+            self.controller.start_rc_scheduler(rc_rate_hz, on_tick=self.control_tick)
+        return self
+
+    def stop(self):
+        if self.vision is not None:
+            self.vision.stop()
+
+    # -----------------------
+    # RC スケジューラ側
+    # -----------------------
+    def latest_marker(self):
+        """(seq, 検出結果 dict)。結果は ids / corners / marker_info / shape / t_frame / t_done"""
+        if self.vision is not None:
+            return self.vision.slot.get()
+        return self.marker_slot.get()
+
+    def _take_latest(self):
+        """
+        最新の検出結果。新しい結果なら1回だけ 記録 → 追跡表へ入れる（飛んでいない時も：UI の ID 表示と
+        ターゲット切替用）。観測の時刻は t_frame
+        """
+        seq, res = self.latest_marker()
+        if res is not None and seq != self._track_seq:
+            self._track_seq = seq
+            if self.recorder is not None:
+                self.recorder.detection(res["ids"], res["corners"], t=time.perf_counter(),
+                                        frame_seq=res.get("frame_seq", 0), t_frame=res["t_frame"])
+            if self.tracker is not None:
+                self.tracker.observe(marker_geometry(res["ids"], res["corners"]), res["t_frame"], res["marker_info"])
+        return res
+
+    def control_tick(self):
+        """RCスケジューラの1周期：（記録・追跡表の更新）→ 手動入力 → セミオート上書き（送信は controller 側）"""
+        controller = self.controller
+        res = self._take_latest()
+        if not controller.in_flight:
+            return
+        self._update_command(res)
+
+    def _update_command(self, res):
+        """手動入力 → セミオート上書き（追跡表があればその時刻の予測、無ければ最新の検出＋見失い判定）"""
+        controller = self.controller
+        now = time.perf_counter()
+        controller.rc_tick_t = now   # この周期の指令を決めた時刻（記録する RC の時刻。replay はこの時刻で予測する）
+        controller.update_motion_from_keyboard()
+        if getattr(controller, "approach_enabled", False):
+            if self.tracker is not None:
+                # 毎周期その時刻の予測で制御する
+                info = self.tracker.estimate(self.target_id(), now)
+            else:
+                info = None
+                if res is not None and (now - res["t_frame"]) <= self.stale_sec:
+                    info = res["marker_info"]
+            controller.update_approach_from_aruco(info, res["shape"] if res is not None else None)
+
+    # -----------------------
+    # UI ループ側
+    # -----------------------
+    def detect_step(self, frame, t_stage=None, frame_seq=None):
+        """
+        表示フレーム1枚分の検出結果を返し、マーカー枠・中心・ROI を frame に描く。
+        frame_seq: frame をコピーした ring の seq（直列モードの遅延計測用。None なら ring.head）
+        Returns: {"ids", "corners", "marker_info", "shape", "roi", "aruno"}
+          shape : 検出したフレームの shape（描画はこれが frame と同じ時だけ）
+          aruno : HUD の ID 表示（追跡表があれば "0,[7]" のように見えている全 ID）
+        """
+        if t_stage is None:
+            t_stage = time.perf_counter()
+        controller = self.controller
+        ids = corners = marker_info = roi = None
+        aruno = None
+        detect_shape = frame.shape
+
+        if self.vision is not None:
+            # ワーカーの最新結果を読むだけ（待たない）
+            res = self.vision.latest()
+            if res is not None and (t_stage - res["t_done"]) <= self.stale_sec:
+                ids, corners = res["ids"], res["corners"]
+                marker_info = res["marker_info"]
+                detect_shape = res["shape"]
+                roi = res.get("roi")
+            if ids is not None and len(ids) > 0:
+                aruno = int(ids.flatten()[0])
+                self.aruno_last = aruno
+                if detect_shape[:2] == frame.shape[:2]:
+                    aruco.drawDetectedMarkers(frame, corners, ids)
+            if marker_info is not None and detect_shape[:2] == frame.shape[:2]:
+                _draw_center(frame, marker_info)
+
+        else:
+            try:
+                self.detector.track_id = self.target_id()
+                _, ids, corners = self.detector.process(frame, draw=False)
+                roi = self.detector.last_roi
+
+                if ids is not None and len(ids) > 0:
+                    aruco.drawDetectedMarkers(frame, corners, ids)
+                    aruno = int(ids.flatten()[0])
+                    self.aruno_last = aruno
+
+                marker_info = self.detector.get_marker_info(ids, corners, target_id=self.target_id())
+                if marker_info is not None:
+                    ring = controller.frame_ring
+                    seq = ring.head if frame_seq is None else frame_seq
+                    marker_info["stamps"] = {"decode": ring.stamp(seq) if seq else t_stage,
+                                             "det_start": t_stage, "det_end": time.perf_counter()}
+                    # ★目視デバッグ：マーカー中心に点＋誤差線
+                    _draw_center(frame, marker_info)
+
+            except Exception as e:
+                events.warn("detect_failed", "ArUco detect failed", error=str(e))
+            detect_shape = frame.shape
+            self.marker_slot.put({
+                "ids": ids,
+                "corners": corners,
+                "marker_info": marker_info,
+                "shape": detect_shape,
+                "frame_seq": controller.frame_ring.head if frame_seq is None else frame_seq,
+                "t_frame": t_stage,
+                "t_done": time.perf_counter(),
+            })
+
+        # 追跡表があれば ID 表示は見えている全マーカー（[ ] が追う ID。未指定なら一番確かなもの）
+        if self.tracker is not None:
+            target = self.target_id()
+            visible = self.tracker.visible_ids(t_stage)
+            if visible:
+                if target is None:
+                    best = self.tracker.estimate(None, t_stage)
+                    target_shown = best["id"] if best is not None else None
+                else:
+                    target_shown = target
+                aruno = ",".join(f"[{m}]" if m == target_shown else str(m) for m in visible)
+                self.aruno_last = target_shown
+            else:
+                aruno = None
+
+        # 追跡ROI（探索窓）を薄く表示
+        if roi is not None and detect_shape[:2] == frame.shape[:2]:
+            cv2.rectangle(frame, (roi[0], roi[1]), (roi[2], roi[3]), (120, 120, 120), 1, cv2.LINE_AA)
+
+        return {"ids": ids, "corners": corners, "marker_info": marker_info, "shape": detect_shape,
+                "roi": roi, "aruno": aruno}
+
+    def control_step(self):
+        """
+        スケジューラが動いていない時の毎フレーム送信（動いていれば何もしない）。
+        指令の決め方は control_tick と同じ（追跡表があれば予測で制御する）
+        """
+        controller = self.controller
+        if controller.rc_scheduler_running:
+            return
+        res = self._take_latest()
+        if not controller.in_flight:
+            return
+        self._update_command(res)
+        controller.update_motion()
+
+    def next_target(self, t=None):
+        """追う ID を見えているマーカーの中で切り替える（一周すると自動選択＝None に戻る）"""
+        if self.tracker is None:
+            return self.target_id()
+        t = time.perf_counter() if t is None else t
+        self.controller.target_aruco_id = self.tracker.cycle_target(self.target_id(), t)
+        return self.controller.target_aruco_id
+
+
+def _draw_center(frame, marker_info):
+    cx, cy = marker_info["center"]
+    cv2.circle(frame, (int(cx), int(cy)), 6, (0, 255, 255), -1, cv2.LINE_AA)  # 黄色点
+    midx = frame.shape[1] // 2
+    cv2.line(frame, (midx, int(cy)), (int(cx), int(cy)), (0, 255, 255), 2, cv2.LINE_AA)
@@ -0,0 +1,268 @@
+# profiling.py
+"""
+軽い計測フック（span）。無効の間は「フラグを1回見るだけ」でほぼタダ。
+
+    import profiling
+
+    @profiling.profiled("aruco.process")
+    def process(...): ...
+
+    with profiling.span("ui.hud"):
+        ...
+
+    profiling.enable(trace=True)        # 集計開始（trace=True なら Chrome trace 用のイベントも残す）
+    print(profiling.summary())          # 親子ごとの木（flame 風）：合計 / 自分だけ / 回数
+    profiling.export_chrome_trace("trace.json")   # chrome://tracing / Perfetto で開く
+
+集計は span ID ×（親 span ID）の事前確保した配列に足すだけ（呼び出しごとの dict は作らない）。
+親子はスレッドごとのスタックで決める。同じ span が別スレッドで同時に走ると回数を取りこぼすことがある
+（計測用なので許容）。ArUcoPool のワーカープロセス内は集計されない。
+"""
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from array import array
+
+
+MAX_SPANS = 64
+TRACE_CAPACITY = 1 << 16   # Chrome trace のイベント数（古いものから上書き）
+
+_ROOT = MAX_SPANS          # 親が無い span の「親」行
+
+_enabled = False
+_tracing = False
+
+_names = []
+_ids = {}
+_register_lock = threading.Lock()
+
+# [親 * MAX_SPANS + 子]（親は 0..MAX_SPANS、_ROOT が最後の行）
+_N = (MAX_SPANS + 1) * MAX_SPANS
+_count = array("q", bytes(8 * _N))
+_total_ns = array("q", bytes(8 * _N))
+_self_ns = array("q", bytes(8 * _N))
+_max_ns = array("q", bytes(8 * _N))
+
+# trace（リングバッファ）
+_ev_sid = array("h", bytes(2 * TRACE_CAPACITY))
+_ev_tid = array("h", bytes(2 * TRACE_CAPACITY))
+_ev_t0 = array("q", bytes(8 * TRACE_CAPACITY))
+_ev_dur = array("q", bytes(8 * TRACE_CAPACITY))
+_ev_n = 0
+_thread_names = {}
+_tid_seq = itertools.count(1)
+
+_local = threading.local()
+_t_origin = time.perf_counter_ns()
+_clock = time.perf_counter_ns
+
+
+def register(name):
+    """span 名 → ID（同じ名前は同じ ID）。MAX_SPANS を超えたら ValueError"""
+    sid = _ids.get(name)
+    if sid is not None:
+        return sid
+    with _register_lock:
+        sid = _ids.get(name)
+        if sid is None:
+            if len(_names) >= MAX_SPANS:
+                raise ValueError(f"too many profiling spans (max {MAX_SPANS})")
+            sid = len(_names)
+            _names.append(name)
+            _ids[name] = sid
+    return sid
+
+
+def enable(on=True, trace=False):
+    global _enabled, _tracing
+    _enabled = bool(on)
+    _tracing = bool(on and trace)
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    global _ev_n
+    for arr in (_count, _total_ns, _self_ns, _max_ns):
+        arr[:] = array("q", bytes(8 * len(arr)))
+    _ev_n = 0
+
+
+# -----------------------
+# 計測
+# -----------------------
+def _stack():
+    st = getattr(_local, "stack", None)
+    if st is None:
+        st = _local.stack = []
+        _local.tid = next(_tid_seq)
+        _thread_names[_local.tid] = threading.current_thread().name
+    return st
+
+
+def _enter(sid):
+    # [sid, 開始ns, 子の合計ns]
+    _stack().append([sid, _clock(), 0])
+
+
+def _exit():
+    global _ev_n
+    t1 = _clock()
+    st = _local.stack
+    sid, t0, child = st.pop()
+    dur = t1 - t0
+    parent = st[-1][0] if st else _ROOT
+    if st:
+        st[-1][2] += dur
+    k = parent * MAX_SPANS + sid
+    _count[k] += 1
+    _total_ns[k] += dur
+    _self_ns[k] += dur - child
+    if dur > _max_ns[k]:
+        _max_ns[k] = dur
+    if _tracing:
+        i = _ev_n % TRACE_CAPACITY
+        _ev_sid[i] = sid
+        _ev_tid[i] = _local.tid
+        _ev_t0[i] = t0 - _t_origin
+        _ev_dur[i] = dur
+        _ev_n += 1
+
+
+class _Span:
+    __slots__ = ("sid", "active")
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.active = False
+
+    def __enter__(self):
+        if _enabled:
+            _enter(self.sid)
+            self.active = True
+        return self
+
+    def __exit__(self, *exc):
+        # __enter__ で計測を始めた時だけ閉じる（途中で enable が切り替わっても崩れない）
+        if self.active:
+            self.active = False
+            _exit()
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+def span(name_or_id):
+    """with span("name"): ... 。無効なら共有の何もしないオブジェクトを返す"""
+    if not _enabled:
+        return _NULL
+    sid = name_or_id if isinstance(name_or_id, int) else register(name_or_id)
+    return _Span(sid)
+
+
+def profiled(name=None):
+    """関数 / メソッド用。無効の間は元の関数をそのまま呼ぶだけ"""
+    def deco(fn):
+        sid = register(name or fn.__qualname__)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            _enter(sid)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _exit()
+        return wrapper
+    return deco
+
+
+# -----------------------
+# 出力
+# -----------------------
+def stats():
+    """{(親名 or None, 名前): (回数, 合計ms, 自分だけms, 最大ms)}"""
+    out = {}
+    n = len(_names)
+    for p in list(range(n)) + [_ROOT]:
+        for s in range(n):
+            k = p * MAX_SPANS + s
+            c = _count[k]
+            if c:
+                out[(None if p == _ROOT else _names[p], _names[s])] = (
+                    c, _total_ns[k] / 1e6, _self_ns[k] / 1e6, _max_ns[k] / 1e6)
+    return out
+
+
+def summary(min_pct=0.5):
+    """
+    flame 風の木（根 → 子）。各行：合計ms / 自分だけms / 回数 / 平均 / 最大 / 根の合計に対する%
+    親の min_pct% に満たない子は省く
+    """
+    n = len(_names)
+    roots = [s for s in range(n) if _count[_ROOT * MAX_SPANS + s]]
+    if not roots:
+        return "(no spans recorded)"
+    grand = sum(_total_ns[_ROOT * MAX_SPANS + s] for s in roots) or 1
+    lines = [f"{'span':<40} {'total ms':>10} {'self ms':>10} {'calls':>8} {'avg ms':>8} {'max ms':>8} {'%':>6}"]
+
+    def walk(parent, sid, depth, seen, parent_tot):
+        k = parent * MAX_SPANS + sid
+        tot = _total_ns[k]
+        pct = 100.0 * tot / grand
+        if depth > 0 and 100.0 * tot / max(1, parent_tot) < min_pct:
+            return
+        c = _count[k]
+        label = ("  " * depth + _names[sid])[:40]
+        lines.append(f"{label:<40} {tot / 1e6:10.1f} {_self_ns[k] / 1e6:10.1f} {c:8d} "
+                     f"{tot / 1e6 / c:8.3f} {_max_ns[k] / 1e6:8.2f} {pct:6.1f}")
+        if sid in seen:
+            return
+        kids = [s for s in range(n) if _count[sid * MAX_SPANS + s]]
+        kids.sort(key=lambda s: -_total_ns[sid * MAX_SPANS + s])
+        for s in kids:
+            walk(sid, s, depth + 1, seen | {sid}, tot)
+
+    for s in sorted(roots, key=lambda s: -_total_ns[_ROOT * MAX_SPANS + s]):
+        walk(_ROOT, s, 0, frozenset(), grand)
+    return "\n".join(lines)
+
+
+def export_chrome_trace(path):
+    """直近 TRACE_CAPACITY 件の span を Chrome trace（JSON, "X" イベント）で書く"""
+    n = min(_ev_n, TRACE_CAPACITY)
+    start = _ev_n - n
+    events = [{"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "tello"}}]
+    for tid, tname in list(_thread_names.items()):
+        events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": tname}})
+    for j in range(start, _ev_n):
+        i = j % TRACE_CAPACITY
+        events.append({
+            "name": _names[_ev_sid[i]],
+            "cat": _names[_ev_sid[i]].split(".", 1)[0],
+            "ph": "X",
+            "pid": os.getpid(),
+            "tid": int(_ev_tid[i]),
+            "ts": _ev_t0[i] / 1000.0,
+            "dur": _ev_dur[i] / 1000.0,
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return path
@@ -0,0 +1,271 @@
+# replay.py
+"""
+フライトログ（flight_log.py の .tlog）を、実機の代わりに同じ検出・制御コードへ流し直す。
+
+記録された RC 指令1つ（＝RCスケジューラの1周期。連送を省いた周期も記録される）ごとに、同じ処理をする：
+（手動入力 → update_approach_from_aruco）。そうして出した指令を記録された指令と比べる。
+時刻は記録上の時刻を使う（見失い判定なども再現される）。
+既定では main.py（MARKER_TRACKER=True）と同じく MarkerTracker を通して制御する。
+
+    python replay.py logs/flight_xxx.tlog                       # 記録フレームで検出し直す
+    python replay.py logs/flight_xxx.tlog --workers 4           # 検出し直しを ArUcoPool で全コアに分ける
+    python replay.py logs/flight_xxx.tlog --detections recorded # 記録された検出結果を使う（制御だけ）
+    python replay.py logs/flight_xxx.tlog --set k_err_to_lr=0.22 k_skew_to_yaw=180
+    python replay.py logs/flight_xxx.tlog --start 12.5 --end 30 --realtime
+    python replay.py logs/flight_xxx.tlog --detections recorded --no-tracker   # EMA 平滑（MARKER_TRACKER=False）で
+    python main.py --replay logs/flight_xxx.tlog ...            # 同じ
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from aruco_detector import ArUcoDetector, marker_geometry
+from flight_log import (
+    FRAME_HEAD, REC_DETECT, REC_FRAME, REC_RC, REC_STATE, FlightLogReader,
+)
+from marker_track import MarkerTracker
+from sim_tello import FakeTello, NullKeyboard
+from tello_controller import TelloController, clamp_int
+from vision_worker import StageTimes
+
+
+class Replayer:
+    """
+    detections:
+        "live"     : 記録フレームを ArUcoDetector で検出し直す（検出の変更も確かめられる）
+        "recorded" : 記録された検出結果をそのまま使う（フレームはデコードしない。制御だけなら最速）
+    pool:
+        aruco_pool.ArUcoPool を渡すと "live" の検出を detect_all で先に全コアで済ませる
+        （ワーカーは ROI 追跡をしないので、直列の検出し直しとは結果が少し違うことがある）
+    tracker:
+        True（既定）なら main.py（MARKER_TRACKER=True）と同じく MarkerTracker に検出を観測として入れ
+        RC周期ごとの予測で制御する。MarkerTracker を渡せばそれを使う。None / False なら最新の検出＋見失い判定
+    """
+
+    def __init__(self, log, controller=None, detector=None, *, detections="live", approach=True,
+                 target_id=None, stale_sec=0.3, tol=0, tracker=True, pool=None):
+        self.log = log
+        if controller is None:
+            controller = TelloController(NullKeyboard(), tello=FakeTello(None, fps=0))
+        self.controller = controller
+        self.detector = detector if detector is not None else ArUcoDetector()
+        self.detections = detections
+        self.pool = pool
+        self.stale_sec = stale_sec
+        self.tol = tol
+        if tracker is True:
+            tracker = MarkerTracker()
+        self.tracker = tracker or None
+
+        controller.in_flight = True
+        controller.approach_enabled = approach
+        controller.target_aruco_id = target_id
+        self._now = 0.0
+        controller.clock = lambda: self._now
+
+        self.stats = StageTimes(window=100000)
+        self.state = None
+
+    def _tick(self, latest):
+        """RCスケジューラの on_tick と同じ処理 → 送るはずの指令"""
+        c = self.controller
+        c.update_motion_from_keyboard()
+        if c.approach_enabled:
+            info, shape, t_frame = latest
+            if self.tracker is not None:
+                info = self.tracker.estimate(c.target_aruco_id, self._now)
+            elif info is not None and (self._now - t_frame) > self.stale_sec:
+                info = None
+            c.update_approach_from_aruco(info, shape)
+        return (clamp_int(c.lr, -100, 100), clamp_int(c.fb, -100, 100),
+                clamp_int(c.ud, -100, 100), clamp_int(c.yaw, -100, 100))
+
+    def _observe(self, ids, corners, info, t):
+        if self.tracker is not None:
+            self.tracker.observe(marker_geometry(ids, corners), t, info)
+
+    def _detect_pooled(self, i0, i1):
+        """i0..i1 の記録フレームを pool.detect_all で検出 → {レコード番号: (ids, corners, 検出ms)}"""
+        log = self.log
+        rows = [i for i in range(i0, i1) if int(log.index["type"][i]) == REC_FRAME]
+
+        def frames():
+            for i in rows:
+                _, codec, _, _, body = log.header(i)
+                yield log.decode_frame(codec, body)
+
+        out = {}
+        for i, res in zip(rows, self.pool.detect_all(frames())):
+            out[i] = (res["ids"], res["corners"], (res["t_done"] - res["t_start"]) * 1000.0)
+        return out
+
+    def run(self, start_t=0.0, end_t=None, realtime=False, on_frame=None, series=False):
+        """
+        series=True なら結果に周期ごとの時系列（t, 再生した指令, マーカーが見えていたか）も付ける
+        """
+        log = self.log
+        det = self.detector
+        target = self.controller.target_aruco_id
+        i0 = log.seek(start_t)
+        i1 = len(log) if end_t is None else log.seek(end_t)
+        pooled = self._detect_pooled(i0, i1) if self.detections == "live" and self.pool is not None else None
+
+        latest = (None, None, -1e9)
+        shape = None
+        recorded = []
+        replayed = []
+        times = []
+        seen = []
+        frames = 0
+
+        t_wall0 = time.perf_counter()
+        t_log0 = None
+        for i in range(i0, i1):
+            rtype, codec, _, t, body = log.header(i)
+            if realtime:
+                if t_log0 is None:
+                    t_log0 = t
+                delay = (t - t_log0) - (time.perf_counter() - t_wall0)
+                if delay > 0:
+                    time.sleep(delay)
+            self._now = t
+
+            if rtype == REC_FRAME:
+                frames += 1
+                if self.detections == "live":
+                    if pooled is not None:
+                        frame = log.decode_frame(codec, body) if on_frame is not None else None
+                        w, h = FRAME_HEAD.unpack_from(body, 0)
+                        shape = (h, w, 3)
+                        ids, corners, ms = pooled[i]
+                        info = det.get_marker_info(ids, corners, target_id=target)
+                        self.stats.add("detect", ms)
+                    else:
+                        frame = log.decode_frame(codec, body)
+                        shape = frame.shape
+                        t0 = time.perf_counter()
+                        det.track_id = target
+                        _, ids, corners = det.process(frame, draw=False)
+                        info = det.get_marker_info(ids, corners, target_id=target)
+                        self.stats.add("detect", (time.perf_counter() - t0) * 1000.0)
+                    latest = (info, shape, t)
+                    self._observe(ids, corners, info, t)
+                    if on_frame is not None:
+                        on_frame(t, frame, ids, corners, info)
+                else:
+                    w, h = FRAME_HEAD.unpack_from(body, 0)
+                    shape = (h, w, 3)
+
+            elif rtype == REC_DETECT and self.detections == "recorded":
+                # レコードの t は制御が取り込んだ時刻（この順で流す）。観測の時刻は検出したフレームの時刻
+                _, ids, corners = log.decode_detection(body)
+                t_frame = log.decode_detection_time(body)
+                t_frame = t if t_frame is None else t_frame
+                info = det.get_marker_info(ids, corners, target_id=target)
+                latest = (info, shape or (720, 960, 3), t_frame)
+                self._observe(ids, corners, info, t_frame)
+
+            elif rtype == REC_STATE:
+                self.state = log.decode_state(body)
+
+            elif rtype == REC_RC:
+                t0 = time.perf_counter()
+                cmd = self._tick(latest)
+                self.stats.add("control", (time.perf_counter() - t0) * 1000.0)
+                recorded.append(log.decode_rc(body))
+                replayed.append(cmd)
+                times.append(t)
+                seen.append(self.controller.approach_err_x is not None)
+
+        new = np.array(replayed, dtype=np.int32).reshape(-1, 4)
+        times = np.array(times)
+        out = self._diff(np.array(recorded, dtype=np.int32).reshape(-1, 4), new,
+                         times, frames, time.perf_counter() - t_wall0)
+        if series:
+            out["series"] = {"t": times, "cmd": new, "seen": np.array(seen, dtype=bool)}
+        return out
+
+    def _diff(self, rec, new, times, frames, elapsed):
+        d = np.abs(rec - new)
+        bad = np.flatnonzero((d > self.tol).any(axis=1)) if len(d) else np.zeros(0, dtype=int)
+        return {
+            "rc": len(rec),
+            "frames": frames,
+            "elapsed_s": elapsed,
+            "mismatches": int(len(bad)),
+            "max_abs": d.max(axis=0).tolist() if len(d) else [0, 0, 0, 0],
+            "mean_abs": d.mean(axis=0).round(3).tolist() if len(d) else [0.0, 0.0, 0.0, 0.0],
+            "first": [(float(times[i]), tuple(int(v) for v in rec[i]), tuple(int(v) for v in new[i]))
+                      for i in bad[:10]],
+        }
+
+
+def _parse_sets(items):
+    out = {}
+    for it in items or ():
+        k, v = it.split("=", 1)
+        v = v.strip()
+        if v.lower() in ("true", "false"):
+            out[k] = v.lower() == "true"
+        else:
+            out[k] = float(v) if any(ch in v for ch in ".eE") else int(v)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay a flight log through detection + approach control")
+    ap.add_argument("log")
+    ap.add_argument("--detections", choices=["live", "recorded"], default="live")
+    ap.add_argument("--mode", default="pyramid", choices=["pyramid", "cascade", "legacy"], help="検出モード（live時）")
+    ap.add_argument("--target-id", type=int, default=None)
+    ap.add_argument("--workers", type=int, default=0,
+                    help="live 時に検出し直しを ArUcoPool のこのプロセス数で並列にする（0 で直列）")
+    ap.add_argument("--no-approach", action="store_true", help="セミオート OFF として再生")
+    ap.add_argument("--tracker", action=argparse.BooleanOptionalAction, default=True,
+                    help="MarkerTracker（カルマン追跡）を通して制御する（main.py の MARKER_TRACKER に合わせる）")
+    ap.add_argument("--set", nargs="*", metavar="NAME=VALUE", help="TelloController の属性（ゲインなど）を上書き")
+    ap.add_argument("--start", type=float, default=0.0, help="開始時刻（秒）")
+    ap.add_argument("--end", type=float, default=None, help="終了時刻（秒）")
+    ap.add_argument("--realtime", action="store_true", help="記録と同じ速さで再生")
+    ap.add_argument("--tol", type=int, default=0, help="各軸この差までは一致とみなす")
+    ap.add_argument("--max-mismatch", type=int, default=None, help="不一致がこれを超えたら終了コード 1")
+    args = ap.parse_args(argv)
+
+    with FlightLogReader(args.log) as log:
+        print(f"[REPLAY] {args.log}  {log.duration:.1f}s  frames={log.count(REC_FRAME)} "
+              f"rc={log.count(REC_RC)} state={log.count(REC_STATE)} detect={log.count(REC_DETECT)}"
+              f"{'  (index recovered)' if log.recovered else ''}")
+
+        pool = None
+        if args.workers and args.detections == "live":
+            from aruco_pool import ArUcoPool
+            pool = ArUcoPool(workers=args.workers, mode=args.mode)
+        try:
+            rp = Replayer(log, detector=ArUcoDetector(mode=args.mode), detections=args.detections,
+                          approach=not args.no_approach, target_id=args.target_id, tol=args.tol,
+                          tracker=MarkerTracker() if args.tracker else None, pool=pool)
+            for k, v in _parse_sets(args.set).items():
+                if not hasattr(rp.controller, k):
+                    print(f"[WARN] TelloController has no attribute {k!r}")
+                setattr(rp.controller, k, v)
+
+            r = rp.run(args.start, args.end, realtime=args.realtime)
+        finally:
+            if pool is not None:
+                pool.close()
+
+    print(f"[REPLAY] rc={r['rc']} frames={r['frames']} in {r['elapsed_s']:.2f}s  "
+          f"mismatches={r['mismatches']}  max|d|(lr,fb,ud,yaw)={r['max_abs']}  mean={r['mean_abs']}")
+    for t, rec, new in r["first"]:
+        print(f"  t={t:8.3f}  recorded={rec}  replayed={new}")
+    print(f"[REPLAY] {rp.stats.report()}")
+
+    if args.max_mismatch is not None and r["mismatches"] > args.max_mismatch:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+# sim_tello.py
+import math
+import threading
+import time
+
+import cv2
+from cv2 import aruco
+import numpy as np
+
+
+class MarkerPose:
+    """
+    合成フレーム上のマーカー1枚の姿勢（解像度に依存しないよう正規化した値）。
+      cx, cy : 中心（画像幅 / 高さに対する割合）
+      size   : 一辺の長さ（画像高さに対する割合）
+      yaw    : 左右の傾き（度）。+ で右辺が手前（大きく見える）
+      roll   : 画面内の回転（度）
+    """
+
+    __slots__ = ("marker_id", "cx", "cy", "size", "yaw", "roll")
+
+    def __init__(self, marker_id=0, cx=0.5, cy=0.5, size=0.2, yaw=0.0, roll=0.0):
+        self.marker_id = marker_id
+        self.cx = cx
+        self.cy = cy
+        self.size = size
+        self.yaw = yaw
+        self.roll = roll
+
+    def quad(self, w, h):
+        """画素座標の4隅（TL, TR, BR, BL）"""
+        s = self.size * h
+        half = s / 2.0
+        t = math.sin(math.radians(self.yaw))
+        sx = half * math.cos(math.radians(self.yaw))
+        # 手前の辺ほど長く見える（簡易な透視）
+        hl = half * (1.0 - 0.35 * t)
+        hr = half * (1.0 + 0.35 * t)
+        pts = np.array([[-sx, -hl], [sx, -hr], [sx, hr], [-sx, hl]], dtype=np.float32)
+        c, sn = math.cos(math.radians(self.roll)), math.sin(math.radians(self.roll))
+        rot = np.array([[c, -sn], [sn, c]], dtype=np.float32)
+        return pts @ rot.T + np.array([self.cx * w, self.cy * h], dtype=np.float32)
+
+
+def _lerp(a, b, u):
+    return a + (b - a) * u
+
+
+def default_script(n_frames):
+    """
+    ベンチ用の既定シナリオ（フレーム番号 → MarkerPose のリスト）。
+      0-40%   : 遠く（小さい）から正面へ寄りながら左→中央
+      40-50%  : 見失い（マーカー無し）
+      50-100% : 斜めから近づき、yaw を振る。脇に別 ID を1枚置く
+    """
+    def poses(i):
+        u = i / max(1, n_frames - 1)
+        if u < 0.4:
+            v = u / 0.4
+            return [MarkerPose(0, _lerp(0.25, 0.5, v), 0.5, _lerp(0.03, 0.25, v), _lerp(-30, 0, v), 5.0 * v)]
+        if u < 0.5:
+            return []
+        v = (u - 0.5) / 0.5
+        return [
+            MarkerPose(0, _lerp(0.6, 0.45, v), _lerp(0.45, 0.55, v), _lerp(0.12, 0.5, v),
+                       35.0 * math.sin(v * 2.0 * math.pi), -8.0 * v),
+            MarkerPose(7, 0.85, 0.2, 0.08, 0.0, 15.0),
+        ]
+
+    return poses
+
+
+class SyntheticArUcoSource:
+    """
+    DICT_4X4_50 のマーカーを台本どおりの姿勢で背景に貼った RGB フレームを作る。
+    描画は前計算しておき、取り出しはコピー無しで巡回する（ソース側のコストを計測に混ぜない）。
+    """
+
+    def __init__(self, width, height, n_frames=120, script=None, dictionary_name=aruco.DICT_4X4_50, seed=0):
+        self.width = width
+        self.height = height
+        self.dictionary = aruco.getPredefinedDictionary(dictionary_name)
+        self.script = script or default_script(n_frames)
+        self._marker_imgs = {}
+
+        rng = np.random.default_rng(seed)
+        yy, xx = np.mgrid[0:height, 0:width]
+        bg = 90 + 60 * (xx / max(1, width - 1)) + 30 * (yy / max(1, height - 1))
+        bg = bg[:, :, None] + rng.normal(0.0, 6.0, (height, width, 3))
+        self._bg = np.clip(bg, 0, 255).astype(np.uint8)
+
+        self.poses = [self.script(i) for i in range(n_frames)]
+        self.frames = [self._render(p) for p in self.poses]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _marker(self, marker_id):
+        img = self._marker_imgs.get(marker_id)
+        if img is None:
+            side = 120
+            try:
+                m = aruco.generateImageMarker(self.dictionary, marker_id, side)
+            except AttributeError:
+                m = aruco.drawMarker(self.dictionary, marker_id, side)
+            # 1セル分の白枠（quiet zone）を付ける
+            q = side // 6
+            m = cv2.copyMakeBorder(m, q, q, q, q, cv2.BORDER_CONSTANT, value=255)
+            img = self._marker_imgs[marker_id] = cv2.cvtColor(m, cv2.COLOR_GRAY2RGB)
+        return img
+
+    def _render(self, poses):
+        frame = self._bg.copy()
+        w, h = self.width, self.height
+        for p in poses:
+            m = self._marker(p.marker_id)
+            ms = m.shape[0]
+            q = (ms - ms * 6 // 8) / 2.0  # 白枠の幅
+            # 白枠込みの4隅を貼る（内側の黒枠がポーズの quad に一致する）
+            quad = p.quad(w, h)
+            center = quad.mean(axis=0)
+            grow = ms / (ms - 2.0 * q)
+            outer = (quad - center) * grow + center
+            src = np.array([[0, 0], [ms, 0], [ms, ms], [0, ms]], dtype=np.float32)
+
+            x0 = max(0, int(np.floor(outer[:, 0].min())))
+            y0 = max(0, int(np.floor(outer[:, 1].min())))
+            x1 = min(w, int(np.ceil(outer[:, 0].max())) + 1)
+            y1 = min(h, int(np.ceil(outer[:, 1].max())) + 1)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            M = cv2.getPerspectiveTransform(src, outer - np.array([x0, y0], dtype=np.float32))
+            roi = frame[y0:y1, x0:x1]
+            cv2.warpPerspective(m, M, (x1 - x0, y1 - y0), dst=roi, flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_TRANSPARENT)
+        return frame
+
+    def visible_ids(self, i):
+        return [p.marker_id for p in self.poses[i % len(self.poses)]]
+
+    def frame(self, i):
+        return self.frames[i % len(self.frames)]
+
+
+class _FakeFrameRead:
+    """djitellopy の BackgroundFrameRead 相当（.frame に RGB の最新フレーム）"""
+
+    def __init__(self):
+        self.frame = None
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeTello:
+    """
+    djitellopy.Tello の代わり（TelloController(kb, tello=FakeTello(...)) で差し込む）。
+
+    - フレーム：SyntheticArUcoSource を fps で巡回（fps=0 なら step() で1枚ずつ進める。
+      source=None なら映像無し＝制御だけ回す再生用）
+    - 状態：パケットごとに新しい dict を作る（実機の djitellopy と同じく identity が変わる）
+    - send_rc_control：送信回数と直近の指令を記録するだけ
+    """
+
+    def __init__(self, source, fps=30.0, state_every=3, battery=87):
+        self.source = source
+        self.fps = fps
+        self.state_every = max(1, int(state_every))
+        self.battery = battery
+        self.frame_read = _FakeFrameRead()
+        self.state = {}
+        self.index = -1
+        self.rc_count = 0
+        self.last_rc = (0, 0, 0, 0)
+        self.is_flying = False
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ---- 台本を進める ----
+    def _state_for(self, i):
+        n = max(1, len(self.source)) if self.source is not None else 1
+        u = (i % n) / n
+        return {
+            "pitch": str(int(round(4 * math.sin(2 * math.pi * u)))),
+            "roll": str(int(round(3 * math.cos(2 * math.pi * u)))),
+            "yaw": str(int(round(-170 + 340 * u))),
+            "vgx": str(int(round(20 * math.sin(2 * math.pi * u)))),
+            "vgy": "0",
+            "vgz": "0",
+            "templ": "58",
+            "temph": "61",
+            "tof": "80",
+            "h": str(int(round(100 + 50 * math.sin(2 * math.pi * u)))),
+            "bat": str(self.battery),
+            "baro": "12.34",
+            "time": str(i // 30),
+            "agx": str(int(round(15 * math.cos(2 * math.pi * u)))),
+            "agy": str(int(round(-10 * math.sin(2 * math.pi * u)))),
+            "agz": "-998",
+        }
+
+    def step(self):
+        """1フレーム進める（state_every フレームごとに状態パケットも1つ）"""
+        self.index += 1
+        if self.source is not None:
+            self.frame_read.frame = self.source.frame(self.index)
+        if self.index % self.state_every == 0:
+            self.state = self._state_for(self.index)
+        return self.index
+
+    def _run(self):
+        period = 1.0 / float(self.fps)
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            self.step()
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                deadline = time.monotonic()
+
+    # ---- djitellopy.Tello 互換の口 ----
+    def connect(self):
+        self.step()
+
+    def get_battery(self):
+        return self.battery
+
+    def get_current_state(self):
+        return self.state
+
+    def streamon(self):
+        if self.fps and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def streamoff(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def get_frame_read(self):
+        return self.frame_read
+
+    def send_rc_control(self, lr, fb, ud, yaw):
+        self.rc_count += 1
+        self.last_rc = (lr, fb, ud, yaw)
+
+    def takeoff(self):
+        self.is_flying = True
+
+    def land(self):
+        self.is_flying = False
+
+    def end(self):
+        self.streamoff()
+        self.frame_read.stop()
+
+
+class NullKeyboard:
+    """キー入力なし（KeyboardState の代わり。pynput もディスプレイも要らない）"""
+
+    def __init__(self):
+        self.pressed = set()
+
+    def is_pressed(self, name: str) -> bool:
+        return name in self.pressed
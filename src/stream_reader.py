@@ -0,0 +1,287 @@
+# stream_reader.py
+"""
+Tello の映像（UDP 11111, H.264 Annex-B）を PyAV で直接読む。djitellopy の get_frame_read() の代わり。
+
+- 専用スレッドで demux → decode → BGR 変換（sws_scale が直接 bgr24 を出す）→ FrameRing へ1回コピー
+  （RGB→BGR の反転コピーが無くなる）
+- デコーダのスレッド数は threads。thread_type="SLICE" は遅延を足さない。
+  "FRAME" は速いが (threads - 1) フレーム分遅れる
+- 遅れたら非参照フレームのデコードを飛ばす（skip_frame="NONREF"）。
+  それでも遅れが続いたら次のキーフレームまで飛ばして（"NONKEY"）追いつき、キーフレームから通常に戻す。
+  「遅れ」は次のどちらか（キーフレームまで飛ばすのは前者が resync_packets 回続いた時だけ）：
+    * 入力が溜まっている：demux が待たずに返ったパケットが backlog_packets 回続いた
+    * 読み手が追いついていない：ring.head - consumer_seq() > max_lag
+- 接続が切れたら（read_timeout 無受信）開き直す
+- PyAV が無ければ start() が ImportError（TelloController は djitellopy の読み出しに戻る）。
+  読み出しスレッドの中で ImportError になったら開き直さずに止まる（failed に理由）
+
+    reader = H264StreamReader(controller.frame_ring, threads=2)
+    reader.start()
+    ...
+    print(reader.report())   # decoded=... skipped=... decode=2.1/5.3ms ...
+    reader.stop()
+
+単体で：python stream_reader.py --seconds 10   （tello_emu.py か実機の streamon 後）
+"""
+import argparse
+import importlib.util
+import threading
+import time
+
+from vision_worker import StageTimes
+import event_log as events
+
+
+VIDEO_URL = "udp://@0.0.0.0:11111"
+
+# 低遅延（FFmpeg 側でバッファしない）。overrun_nonfatal は UDP の受信 FIFO があふれても止めない
+OPEN_OPTIONS = {
+    "fflags": "nobuffer",
+    "flags": "low_delay",
+    "overrun_nonfatal": "1",
+    "fifo_size": "50000",      # 188 byte 単位（約 9MB）
+    "probesize": "65536",
+}
+
+
+class H264StreamReader:
+    # TelloController.get_frame() は frame_read.frame を見るが、このリーダーはリング経由だけで渡す
+    frame = None
+
+    def __init__(self, ring, url=VIDEO_URL, *, threads=2, thread_type="SLICE", remap=None, consumer_seq=None,
+                 max_lag=2, backlog_packets=3, backlog_wait_ms=1.0, resync_packets=15, open_timeout=10.0,
+                 read_timeout=2.0, options=None):
+        self.ring = ring
+        self.url = url
+        self.threads = threads
+        self.thread_type = thread_type
+        self.remap = remap                  # undistort.Undistorter（リングへ書く時に歪み補正）
+        self.consumer_seq = consumer_seq    # () -> 読み手が最後に取った ring の seq
+        self.max_lag = max_lag
+        self.backlog_packets = backlog_packets
+        self.backlog_wait_ms = backlog_wait_ms
+        self.resync_packets = resync_packets
+        self.open_timeout = open_timeout
+        self.read_timeout = read_timeout
+        self.options = dict(OPEN_OPTIONS if options is None else options)
+
+        self.stats = StageTimes(window=300)   # decode / convert / write（ms）
+        self.decoded = 0       # リングに書いたフレーム
+        self.packets = 0
+        self.skipped = 0       # 飛ばしている間にデコードしなかったパケット
+        self.resyncs = 0       # キーフレームまで飛ばした回数
+        self.behind = 0        # 遅れと判定したパケット
+        self.corrupt = 0
+        self.bad_packets = 0   # デコーダが受け付けなかったパケット
+        self.errors = 0
+        self.opens = 0
+        self.skip_mode = "DEFAULT"
+        self.size = None
+        self.failed = None     # 止まった理由（開き直しても直らないエラー）
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._container = None
+        self._t_fps = time.perf_counter()
+        self._n_fps = 0
+        self.fps = 0.0
+
+    def start(self):
+        # PyAV が無ければスレッドを立てずに ImportError
+        if importlib.util.find_spec("av") is None:
+            raise ImportError("PyAV is not installed (pip install av)")
+        self._stop.clear()
+        self.failed = None
+        self._thread = threading.Thread(target=self._run, name="h264-reader", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # -----------------------
+    # 読み出しスレッド
+    # -----------------------
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._read_stream()
+            except ImportError as e:
+                # 開き直しても直らない
+                self.failed = str(e)
+                events.error("video", "PyAV not available; stream reader stopped", error=str(e))
+                break
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.errors += 1
+                events.warn("video", "stream read failed; reopening", error=str(e), url=self.url)
+                self._stop.wait(0.5)
+
+    def _open(self):
+        import av
+
+        container = av.open(self.url, format="h264", options=self.options,
+                            timeout=(self.open_timeout, self.read_timeout))
+        stream = container.streams.video[0]
+        cc = stream.codec_context
+        cc.thread_type = self.thread_type
+        cc.thread_count = self.threads
+        self.opens += 1
+        events.info("video", "stream opened", url=self.url, threads=self.threads, thread_type=self.thread_type)
+        return container, stream
+
+    def _read_stream(self):
+        import av
+
+        container, stream = self._open()
+        self._container = container
+        cc = stream.codec_context
+        self.skip_mode = cc.skip_frame
+        self._set_skip(cc, "DEFAULT")
+        quick = 0          # 待たずに返ったパケットの連続数
+        behind_run = 0     # 入力が溜まっている判定の連続数
+        try:
+            demux = container.demux(stream)
+            t_req = time.perf_counter()
+            for packet in demux:
+                if self._stop.is_set():
+                    break
+                t_pkt = time.perf_counter()
+                if packet.size == 0:
+                    continue
+                self.packets += 1
+                if packet.is_corrupt:
+                    self.corrupt += 1
+
+                # ---- 遅れの判定 ----
+                quick = quick + 1 if (t_pkt - t_req) * 1000.0 < self.backlog_wait_ms else 0
+                backlog = quick >= self.backlog_packets
+                behind = backlog or self._consumer_lag() > self.max_lag
+                if behind:
+                    self.behind += 1
+                # キーフレームまで飛ばすのは入力が溜まり続けた時だけ（読み手が遅いだけならリングが最新を渡す）
+                behind_run = behind_run + 1 if backlog else 0
+
+                # ---- 飛ばし方を決める ----
+                if self.skip_mode == "NONKEY":
+                    if packet.is_keyframe:
+                        self._set_skip(cc, "NONREF" if behind else "DEFAULT")
+                elif behind_run >= self.resync_packets:
+                    self.resyncs += 1
+                    behind_run = 0
+                    self._set_skip(cc, "NONKEY")
+                    events.warn("video", "decoder behind; skipping to next keyframe", resyncs=self.resyncs)
+                else:
+                    self._set_skip(cc, "NONREF" if behind else "DEFAULT")
+
+                # ---- デコード → BGR → リング ----
+                try:
+                    frames = cc.decode(packet)
+                except av.error.InvalidDataError:
+                    # 途中から受け始めた / 欠けたパケット。次のキーフレームで戻るので開き直さない
+                    self.bad_packets += 1
+                    t_req = time.perf_counter()
+                    continue
+                n_out = 0
+                for frame in frames:
+                    t_dec = time.perf_counter()
+                    bgr = frame.to_ndarray(format="bgr24")
+                    t_cvt = time.perf_counter()
+                    self.ring.write(bgr, remap=self.remap)
+                    t_wr = time.perf_counter()
+                    self.stats.add("decode", (t_dec - t_pkt) * 1000.0)
+                    self.stats.add("convert", (t_cvt - t_dec) * 1000.0)
+                    self.stats.add("write", (t_wr - t_cvt) * 1000.0)
+                    self.size = (frame.width, frame.height)
+                    self.decoded += 1
+                    self._n_fps += 1
+                    n_out += 1
+                    t_pkt = t_wr
+                if n_out == 0 and self.skip_mode != "DEFAULT":
+                    self.skipped += 1
+                self._tick_fps()
+                t_req = time.perf_counter()
+        finally:
+            self._container = None
+            container.close()
+
+    def _set_skip(self, cc, mode):
+        if mode != self.skip_mode:
+            cc.skip_frame = mode
+            self.skip_mode = mode
+
+    def _consumer_lag(self):
+        if self.consumer_seq is None:
+            return 0
+        seq = self.consumer_seq()
+        return 0 if not seq else self.ring.head - seq
+
+    def _tick_fps(self):
+        now = time.perf_counter()
+        dt = now - self._t_fps
+        if dt >= 1.0:
+            self.fps = self._n_fps / dt
+            self._n_fps = 0
+            self._t_fps = now
+
+    # -----------------------
+    # 集計
+    # -----------------------
+    def report(self):
+        size = "-" if self.size is None else f"{self.size[0]}x{self.size[1]}"
+        behind_pct = 100.0 * self.behind / max(1, self.packets)
+        return (f"{size} fps={self.fps:.1f} decoded={self.decoded} packets={self.packets} "
+                f"skipped={self.skipped} resyncs={self.resyncs} behind={behind_pct:.0f}% "
+                f"corrupt={self.corrupt} bad={self.bad_packets} errors={self.errors} opens={self.opens} mode={self.skip_mode}  "
+                f"{self.stats.report()}{'  FAILED: ' + self.failed if self.failed else ''}")
+
+
+def main(argv=None):
+    from frame_ring import FrameRing
+
+    ap = argparse.ArgumentParser(description="Tello の H.264 映像を読んでデコード時間・取りこぼしを表示する")
+    ap.add_argument("--url", default=VIDEO_URL)
+    ap.add_argument("--threads", type=int, default=2)
+    ap.add_argument("--thread-type", default="SLICE", choices=("SLICE", "FRAME", "AUTO"))
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--consumer-ms", type=float, default=0.0,
+                    help="読み手の1フレームあたりの処理時間（遅い検出を真似て遅れ時の飛ばしを試す）")
+    ap.add_argument("--report-sec", type=float, default=2.0)
+    args = ap.parse_args(argv)
+
+    ring = FrameRing(n_slots=4)
+    consumed = [0]
+    reader = H264StreamReader(ring, args.url, threads=args.threads, thread_type=args.thread_type,
+                              consumer_seq=lambda: consumed[0])
+    reader.start()
+    t_end = time.perf_counter() + args.seconds
+    t_report = time.perf_counter() + args.report_sec
+    try:
+        while time.perf_counter() < t_end:
+            seq, frame = ring.latest()
+            if frame is None or seq == consumed[0]:
+                ring.wait_newer(consumed[0], 0.05)
+            else:
+                consumed[0] = seq
+                if args.consumer_ms > 0:
+                    time.sleep(args.consumer_ms / 1000.0)
+            if time.perf_counter() >= t_report:
+                t_report += args.report_sec
+                print(reader.report(), flush=True)
+    except KeyboardInterrupt:
+        pass
+    reader.stop()
+    print(reader.report())
+    events.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# sweep.py
+"""
+録画済みフライト（.tlog）を使った、セミオートのゲイン探索。
+
+各設定ごとに replay.Replayer（記録された検出結果を使う制御だけの再生）で
+update_approach_from_aruco を回し、出てきた指令の時系列を採点する。
+設定 × ログ はプロセスプールで並列に評価し、結果は (ログ, パラメータのハッシュ) ごとに
+キャッシュするので、やり直しは増えた分だけ計算する。
+
+    python sweep.py logs/*.tlog --grid k_err_to_lr=0.12,0.18,0.24 smooth=0.2,0.35,0.5
+    python sweep.py logs/*.tlog --random 200 --range k_skew_to_yaw=100:300 --workers 8
+    python sweep.py logs/*.tlog --random 200 --top 10 --json sweep.json
+    python sweep.py logs/*.tlog --no-tracker --grid smooth=0.2,0.35,0.5   # EMA 平滑（MARKER_TRACKER=False）の調整
+
+再生は main.py の既定（MARKER_TRACKER=True）と同じく MarkerTracker を通す。その時は確からしさで
+指令を弱めるので EMA の smooth は効かない（探索から外す）。
+
+採点（小さいほど良い）:
+    settle : マーカーを捉えてから指令の変化が band 以内に収まるまでの秒（捕捉区間の平均）
+    osc    : 指令の変化の向きが反転した回数 / 秒（lr, fb, yaw の合計）
+    effort : 指令の大きさ（|cmd|/100 の二乗平均）
+    score  = w_settle * settle + w_osc * osc + w_effort * effort（ログの平均）
+※ 再生は開ループ（指令で映像は変わらない）なので、機体の整定ではなく指令側の整定を見ている。
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# 探索するゲインと既定の範囲（--range で上書き）
+DEFAULT_RANGES = {
+    "center_dead_px": (6, 30),
+    "k_err_to_lr": (0.08, 0.30),
+    "k_err_to_yaw": (0.10, 0.40),
+    "k_skew_to_yaw": (100.0, 300.0),
+    "k_size_to_fb": (0.10, 0.40),
+    "smooth": (0.0, 0.7),
+}
+INT_PARAMS = ("center_dead_px",)
+
+# MarkerTracker を通す時は使われないパラメータ
+TRACKER_UNUSED = ("smooth",)
+
+SCORE_VERSION = 1
+CACHE_DIR = ".sweep_cache"
+
+
+# -----------------------
+# 採点
+# -----------------------
+def score_series(t, cmd, seen, band=3):
+    """
+    t: (N,) 秒, cmd: (N,4) 指令, seen: (N,) マーカーが見えていたか
+    Returns: dict(settle, osc, effort)
+    """
+    if len(t) < 2:
+        return {"settle": 0.0, "osc": 0.0, "effort": 0.0}
+    axes = cmd[:, [0, 1, 3]].astype(np.float64)   # lr, fb, yaw（ud はセミオートでは 0）
+
+    # 捕捉区間（見えている連続区間）ごとの整定時間
+    settles = []
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], seen.astype(np.int8), [0]))))
+    for a, b in zip(edges[::2], edges[1::2]):
+        if b - a < 2:
+            continue
+        d = np.abs(np.diff(axes[a:b], axis=0)).max(axis=1)
+        moving = np.flatnonzero(d > band)
+        settled_at = a + (moving[-1] + 1 if len(moving) else 0)
+        settles.append(t[min(settled_at, b - 1)] - t[a])
+    settle = float(np.mean(settles)) if settles else 0.0
+
+    # 変化の向きの反転（0 をまたぐ振動）
+    dv = np.diff(axes, axis=0)
+    sgn = np.sign(dv)
+    flips = 0
+    for k in range(sgn.shape[1]):
+        s = sgn[:, k][sgn[:, k] != 0]
+        flips += int(np.count_nonzero(s[1:] != s[:-1]))
+    duration = max(1e-6, float(t[-1] - t[0]))
+    osc = flips / duration
+
+    effort = float(np.mean((axes / 100.0) ** 2))
+    return {"settle": settle, "osc": osc, "effort": effort}
+
+
+def total_score(m, weights):
+    return weights[0] * m["settle"] + weights[1] * m["osc"] + weights[2] * m["effort"]
+
+
+# -----------------------
+# 評価（ワーカープロセスで実行）
+# -----------------------
+def log_fingerprint(path):
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_size}:{int(st.st_mtime)}"
+
+
+def param_hash(params):
+    text = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(f"v{SCORE_VERSION}:{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def _cache_path(cache_dir, log_path, params, tracker=True):
+    key = hashlib.sha1(log_fingerprint(log_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, key, "tracker" if tracker else "ema", param_hash(params) + ".json")
+
+
+def evaluate(log_path, params, band=3, cache_dir=CACHE_DIR, tracker=True):
+    """1ログ × 1設定。キャッシュがあればそれを返す（tracker=True なら MarkerTracker を通して再生）"""
+    cpath = _cache_path(cache_dir, log_path, params, tracker) if cache_dir else None
+    if cpath and os.path.exists(cpath):
+        with open(cpath, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    from flight_log import FlightLogReader
+    from marker_track import MarkerTracker
+    from replay import Replayer
+
+    with FlightLogReader(log_path) as log:
+        rp = Replayer(log, detections="recorded", tracker=MarkerTracker() if tracker else None)
+        for k, v in params.items():
+            setattr(rp.controller, k, v)
+        r = rp.run(series=True)
+    s = r.pop("series")
+    metrics = score_series(s["t"], s["cmd"], s["seen"], band=band)
+    metrics["ticks"] = int(len(s["t"]))
+
+    if cpath:
+        os.makedirs(os.path.dirname(cpath), exist_ok=True)
+        tmp = cpath + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(metrics, f)
+        os.replace(tmp, cpath)
+    return metrics
+
+
+def _evaluate_task(args):
+    log_path, params, band, cache_dir, tracker = args
+    try:
+        return log_path, params, evaluate(log_path, params, band=band, cache_dir=cache_dir, tracker=tracker), None
+    except Exception as e:
+        return log_path, params, None, f"{type(e).__name__}: {e}"
+
+
+# -----------------------
+# 設定の生成
+# -----------------------
+def _num(text):
+    return float(text) if any(ch in text for ch in ".eE") else int(text)
+
+
+def parse_grid(items):
+    grid = {}
+    for it in items or ():
+        k, vals = it.split("=", 1)
+        grid[k] = [_num(v) for v in vals.split(",") if v]
+    return grid
+
+
+def parse_ranges(items, tracker=True):
+    ranges = dict(DEFAULT_RANGES)
+    if tracker:
+        for k in TRACKER_UNUSED:
+            ranges.pop(k, None)
+    for it in items or ():
+        k, rng = it.split("=", 1)
+        lo, hi = rng.split(":")
+        ranges[k] = (_num(lo), _num(hi))
+    return ranges
+
+
+def grid_settings(grid):
+    keys = sorted(grid)
+    for combo in itertools.product(*(grid[k] for k in keys)):
+        yield dict(zip(keys, combo))
+
+
+def random_settings(ranges, n, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = sorted(ranges)
+    for _ in range(n):
+        p = {}
+        for k in keys:
+            lo, hi = ranges[k]
+            if k in INT_PARAMS:
+                p[k] = int(rng.integers(int(lo), int(hi) + 1))
+            else:
+                p[k] = round(float(rng.uniform(lo, hi)), 4)
+        yield p
+
+
+# -----------------------
+# 実行
+# -----------------------
+def run_sweep(logs, settings, *, workers=None, band=3, weights=(1.0, 0.5, 2.0), cache_dir=CACHE_DIR, tracker=True):
+    """
+    Returns: [(score, params, {log: metrics})]（score 昇順）と失敗の一覧
+    """
+    settings = list(settings)
+    tasks = [(lg, p, band, cache_dir, tracker) for p in settings for lg in logs]
+    per = {param_hash(p): (p, {}) for p in settings}
+    errors = []
+
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    if workers == 1:
+        results = map(_evaluate_task, tasks)
+        for lg, p, m, err in results:
+            _collect(per, errors, lg, p, m, err)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as ex:
+            for lg, p, m, err in ex.map(_evaluate_task, tasks, chunksize=max(1, len(tasks) // (workers * 8))):
+                _collect(per, errors, lg, p, m, err)
+
+    ranked = []
+    for p, by_log in per.values():
+        if len(by_log) != len(logs):
+            continue
+        score = float(np.mean([total_score(m, weights) for m in by_log.values()]))
+        ranked.append((score, p, by_log))
+    ranked.sort(key=lambda r: r[0])
+    return ranked, errors
+
+
+def _collect(per, errors, log_path, params, metrics, err):
+    if err is not None:
+        errors.append((log_path, params, err))
+        return
+    per[param_hash(params)][1][log_path] = metrics
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Sweep approach-controller gains over recorded flights")
+    ap.add_argument("logs", nargs="+", help=".tlog ファイル")
+    ap.add_argument("--grid", nargs="*", metavar="NAME=V1,V2,...", help="格子探索")
+    ap.add_argument("--random", type=int, default=0, help="ランダムに N 個（--range の範囲）")
+    ap.add_argument("--range", nargs="*", metavar="NAME=LO:HI", help="ランダム探索の範囲")
+    ap.add_argument("--tracker", action=argparse.BooleanOptionalAction, default=True,
+                    help="MarkerTracker を通して再生する（main.py の MARKER_TRACKER に合わせる）")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--band", type=int, default=3, help="整定とみなす指令変化の幅")
+    ap.add_argument("--weights", default="1.0,0.5,2.0", help="settle,osc,effort の重み")
+    ap.add_argument("--cache", default=CACHE_DIR, help="キャッシュのディレクトリ（空文字で無効）")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--json", default=None, help="全結果を JSON で保存")
+    args = ap.parse_args(argv)
+
+    if args.grid:
+        settings = list(grid_settings(parse_grid(args.grid)))
+    elif args.random:
+        settings = list(random_settings(parse_ranges(args.range, tracker=args.tracker), args.random, seed=args.seed))
+    else:
+        print("give --grid or --random")
+        return 2
+    if args.tracker:
+        unused = sorted({k for p in settings for k in p if k in TRACKER_UNUSED})
+        if unused:
+            print(f"[WARN] {', '.join(unused)} has no effect with the tracker (use --no-tracker); dropped")
+            settings = [{k: v for k, v in p.items() if k not in TRACKER_UNUSED} for p in settings]
+            settings = list({param_hash(p): p for p in settings}.values())
+    # 現在の設定（基準）も必ず評価する
+    settings.insert(0, {})
+
+    weights = tuple(float(w) for w in args.weights.split(","))
+    print(f"[SWEEP] logs={len(args.logs)} settings={len(settings)} workers={args.workers or 'auto'} "
+          f"tracker={'on' if args.tracker else 'off'}")
+    ranked, errors = run_sweep(args.logs, settings, workers=args.workers, band=args.band,
+                               weights=weights, cache_dir=args.cache or None, tracker=args.tracker)
+
+    for lg, p, err in errors[:5]:
+        print(f"[WARN] {lg} {p}: {err}")
+    base = next((r for r in ranked if not r[1]), None)
+    if base is not None:
+        print(f"[SWEEP] baseline score={base[0]:.3f}")
+    for score, p, by_log in ranked[:args.top]:
+        m = {k: float(np.mean([v[k] for v in by_log.values()])) for k in ("settle", "osc", "effort")}
+        txt = " ".join(f"{k}={v}" for k, v in sorted(p.items())) or "(baseline)"
+        print(f"  {score:8.3f}  settle={m['settle']:.2f}s osc={m['osc']:.2f}/s effort={m['effort']:.3f}  {txt}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([{"score": s, "params": p, "logs": bl} for s, p, bl in ranked], f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+# telemetry.py
+import threading
+import time
+
+
+class TelemetrySnapshot:
+    """
+    状態パケット1つ分を数値に直したもの（読み取り専用として扱う）。
+    t はパケットを受け取った時刻（perf_counter）。
+    """
+
+    __slots__ = (
+        "t", "seq",
+        "yaw", "pitch", "roll",
+        "height", "battery",
+        "agx", "agy", "agz",
+        "vgx", "vgy", "vgz", "speed",
+        "temp", "flight_time",
+    )
+
+    def __init__(self, t=0.0, seq=0):
+        self.t = t
+        self.seq = seq
+        self.yaw = self.pitch = self.roll = None
+        self.height = self.battery = None
+        self.agx = self.agy = self.agz = None
+        self.vgx = self.vgy = self.vgz = self.speed = None
+        self.temp = None
+        self.flight_time = None
+
+
+def _num(st, key, conv=float):
+    v = st.get(key)
+    if v is None:
+        return None
+    try:
+        return conv(float(v))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_state(st, t, seq):
+    """djitellopy の state dict → TelemetrySnapshot"""
+    snap = TelemetrySnapshot(t, seq)
+    snap.yaw = _num(st, "yaw")
+    snap.pitch = _num(st, "pitch")
+    snap.roll = _num(st, "roll")
+    snap.height = _num(st, "h", int)
+    snap.battery = _num(st, "bat", int)
+    snap.agx = _num(st, "agx", int)
+    snap.agy = _num(st, "agy", int)
+    snap.agz = _num(st, "agz", int)
+    snap.vgx = _num(st, "vgx")
+    snap.vgy = _num(st, "vgy")
+    snap.vgz = _num(st, "vgz")
+    if snap.vgx is not None and snap.vgy is not None and snap.vgz is not None:
+        snap.speed = (snap.vgx * snap.vgx + snap.vgy * snap.vgy + snap.vgz * snap.vgz) ** 0.5
+    templ = _num(st, "templ")
+    temph = _num(st, "temph")
+    if templ is not None and temph is not None:
+        snap.temp = (templ + temph) / 2.0
+    snap.flight_time = _num(st, "time", int)
+    return snap
+
+
+class _StateHook(dict):
+    """djitellopy の drones[host] の代わり。"state" が代入されたら（受信スレッドで）callback を呼ぶ"""
+
+    def __init__(self, src, callback):
+        super().__init__(src)
+        self._callback = callback
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        if key == "state":
+            try:
+                self._callback(value)
+            except Exception:
+                # 受信ループは例外で抜けてしまうので外に出さない
+                pass
+
+
+def djitellopy_state_hook(tello):
+    """
+    TelemetryCache(subscribe=...) 用。djitellopy の状態受信スレッドからパケットごとに呼ばせる。
+
+    djitellopy（2.4 / 2.5）は受信スレッドで drones[host]["state"] = parse_state(...) と代入するだけで
+    コールバックを持たないので、drones[host] をその代入を横取りする dict に差し替える。
+    内部が違う（FakeTello・別の版）なら subscribe は None を返し、TelemetryCache はポーリングに戻る。
+    """
+    def subscribe(callback):
+        try:
+            import djitellopy.tello as dj
+            drones = dj.drones
+            host = tello.address[0]
+            entry = drones[host]
+        except (ImportError, AttributeError, KeyError, TypeError, IndexError):
+            return None
+        if type(entry) is not dict or "state" not in entry:
+            return None
+        hook = _StateHook(entry, callback)
+        drones[host] = hook
+
+        def unsubscribe():
+            if drones.get(host) is hook:
+                drones[host] = dict(hook)
+        return unsubscribe
+    return subscribe
+
+
+class TelemetryCache:
+    """
+    状態パケットを1回だけ解釈して最新スナップショットを置いておく。
+    読み手は latest を読むだけ（属性1回の参照、ロック無し）。
+
+    - subscribe（djitellopy_state_hook(tello) など）が使えれば、パケットの受信スレッドから feed() が
+      直接呼ばれる（スレッド無し・遅れ無し）。mode == "push"
+    - 使えなければ（FakeTello・djitellopy の内部が違う版）get_state() を poll_sec ごとに見る。
+      djitellopy はパケットごとに state dict を作り直すので、dict の入れ替わり（identity）で新着が分かる。
+      遅れは最大 poll_sec。mode == "poll"
+    """
+
+    def __init__(self, get_state, poll_sec=0.005, subscribe=None):
+        self.get_state = get_state
+        self.poll_sec = poll_sec
+        self.subscribe = subscribe   # subscribe(callback) -> unsubscribe() / None（使えない）
+        self.mode = None
+        self.latest = TelemetrySnapshot()
+        self.packets = 0
+        self.packet_hz = 0.0
+        self.errors = 0
+        self.on_packet = None   # on_packet(state_dict, t)：新しいパケットごとに呼ぶ（記録用）
+        self._thread = None
+        self._stop = threading.Event()
+        self._unsubscribe = None
+        self._last = None
+
+    def start(self):
+        if self._unsubscribe is not None or (self._thread is not None and self._thread.is_alive()):
+            return
+        if self.subscribe is not None:
+            self._unsubscribe = self.subscribe(self.feed)
+            if self._unsubscribe is not None:
+                self.mode = "push"
+                return
+        self.mode = "poll"
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def age(self):
+        """最新スナップショットの経過秒（まだ無ければ None）"""
+        if self.latest.seq == 0:
+            return None
+        return time.perf_counter() - self.latest.t
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                st = self.get_state()
+            except Exception:
+                st = None
+                self.errors += 1
+            if not self.feed(st):
+                self._stop.wait(self.poll_sec)
+
+    def feed(self, st):
+        """状態 dict を1つ受け取る（新しいパケットなら True）"""
+        if not st or st is self._last:
+            return False
+        self._last = st
+
+        now = time.perf_counter()
+        prev = self.latest
+        if prev.seq > 0:
+            dt = now - prev.t
+            if dt > 0:
+                hz = 1.0 / dt
+                self.packet_hz = hz if self.packet_hz == 0.0 else 0.9 * self.packet_hz + 0.1 * hz
+        self.packets += 1
+        self.latest = parse_state(st, now, self.packets)
+        if self.on_packet is not None:
+            self.on_packet(st, now)
+        return True
+
+    def report(self):
+        age = self.age()
+        age_txt = "--" if age is None else f"{age * 1000.0:.0f}ms"
+        return f"telemetry {self.mode or '-'} packets={self.packets} rate={self.packet_hz:.1f}Hz age={age_txt}"
@@ -1,8 +1,14 @@
 # tello_controller.py
 import time
+import threading
 import numpy as np
 from djitellopy import Tello
 from keyboard_state import KeyboardState
+from frame_ring import FrameRing
+from latency import LatencyStats
+import profiling
+import event_log as events
+from telemetry import TelemetryCache, djitellopy_state_hook
 
 
 def clamp_int(x, lo, hi):
@@ -18,12 +24,32 @@ class TelloController:
       yaw: +時計回り
     """
 
-    def __init__(self, keyboard_state: KeyboardState):
-        self.tello = Tello()
+    def __init__(self, keyboard_state: KeyboardState, tello=None):
+        # tello を渡すとそれを使う（sim_tello.FakeTello でのベンチ / 試験用）
+        self.tello = Tello() if tello is None else tello
         self.in_flight = False
         self.frame_read = None
         self.kb = keyboard_state
 
+        # デコード済みフレーム（BGR）を1回だけコピーして置くリング
+        self.frame_ring = FrameRing(n_slots=4)
+        self._pump_thread = None
+        self._pump_stop = threading.Event()
+        self.undistort = None   # undistort.Undistorter を入れるとリングへ書く時に歪み補正する
+        self.recorder = None    # flight_log.FlightRecorder を入れるとRC指令（省いた周期も）を記録する
+        self.rc_tick_t = None   # 指令を決めた時刻（perf_counter。on_tick が入れる）。記録する RC の時刻に使う
+        # stream_reader.H264StreamReader を入れると djitellopy の get_frame_read() の代わりに使う
+        #（リングへ BGR で直接書く。pump スレッドは使わない）
+        self.video_reader = None
+
+        # フレーム到着 → RC送信の遅延（marker_info["stamps"] の検出1回につき、次に送った指令で1件）
+        self.latency = LatencyStats()
+        self._lat_last = None
+        self._lat_pending = None
+
+        # 状態パケットをパケット到着時に1回だけ解釈して置く（djitellopy の受信スレッドから。できなければポーリング）
+        self.telemetry = TelemetryCache(self.tello.get_current_state, subscribe=djitellopy_state_hook(self.tello))
+
         # RC（送信用の意味で固定）
         self.lr = 0
         self.fb = 0
@@ -59,14 +85,22 @@ class TelloController:
         self.fb_max = 35
         self.fb_min = 10
 
+        # 距離・向き（姿勢推定が有効な時。marker_info に distance_m / yaw_err_deg がある）
+        self.target_distance_m = 0.6
+        self.distance_dead_m = 0.05
+        self.k_dist_to_fb = 60.0    # 1m 遠いごとの fb
+        self.yaw_err_dead_deg = 4.0
+        self.k_yaw_err_to_yaw = 1.0  # skew 版（k_skew_to_yaw * skew）とほぼ同じ効き
+
         # 見失い停止
+        self.clock = time.time      # 再生時は記録上の時刻に差し替える（replay.py）
         self.last_marker_ts = 0.0
         self.lost_stop_sec = 0.4
 
         # 近距離ほど yaw を弱める
-        self.near_ratio = 0.85  # target_size_px * 0.85 以上で「近い」扱い
+        self.near_ratio = 0.85  # target_size_px * 0.85 以上（姿勢推定時は target_distance_m / 0.85 以内）で「近い」扱い
 
-        # smoothing（少しだけ）
+        # smoothing（少しだけ。MarkerTracker の推定を受けた時は使わない）
         self.smooth = 0.35
         self._yaw_f = 0.0
         self._fb_f = 0.0
@@ -77,20 +111,69 @@ class TelloController:
         self.approach_err_x = None
         self.approach_size_px = None
         self.approach_skew = None
+        self.approach_distance_m = None
+        self.approach_yaw_err = None
         self.approach_yaw = 0
         self.approach_fb = 0
         self.approach_lr = 0
 
+        # ---- RC送信スケジューラ（固定レート） ----
+        self.rc_rate_hz = 30
+        self.rc_keepalive_sec = 1.0   # 0指令が続いても最低この間隔で送る（Telloの自動着陸対策）
+        self._rc_lock = threading.Lock()
+        self._rc_thread = None
+        self._rc_stop = threading.Event()
+        self._rc_on_tick = None
+        self._last_sent = None
+        self._last_sent_ts = 0.0
+        self.rc_sent = 0
+        self.rc_skipped = 0
+        self.rc_missed = 0
+        self.rc_jitter_ms = 0.0       # 直近の |実行時刻 - 期限|
+        self.rc_jitter_max_ms = 0.0
+
     # -----------------------
     # connect / frame
     # -----------------------
     def connect_and_start_stream(self):
         self.tello.connect()
-        print(f"Battery: {self.tello.get_battery()}%")
+        self.telemetry.start()
+        events.info("connect", f"Battery: {self.tello.get_battery()}%")
         self.tello.streamon()
+        if self.video_reader is not None:
+            self.video_reader.remap = self.undistort
+            try:
+                self.frame_read = self.video_reader.start()
+                return
+            except ImportError as e:
+                events.warn("video", "PyAV not available; falling back to djitellopy get_frame_read()", error=str(e))
+                self.video_reader = None
         self.frame_read = self.tello.get_frame_read()
+        self._pump_stop.clear()
+        self._pump_thread = threading.Thread(target=self._frame_pump, daemon=True)
+        self._pump_thread.start()
+
+    def _frame_pump(self):
+        """djitellopy の新しいフレームを見つけたら RGB->BGR しながらリングへ1回コピー"""
+        last = None
+        while not self._pump_stop.is_set():
+            fr = self.frame_read
+            src = None if fr is None else fr.frame
+            if src is None or src is last:
+                time.sleep(0.002)
+                continue
+            last = src
+            try:
+                self.frame_ring.write(src, flip_rgb=True, remap=self.undistort)
+            except Exception as e:
+                events.warn("frame_pump", "frame pump failed", error=str(e))
+                time.sleep(0.05)
 
     def get_frame(self):
+        """最新フレーム（リングのビュー。書き換えないこと）"""
+        _, frame = self.frame_ring.latest()
+        if frame is not None:
+            return frame
         if self.frame_read is None or self.frame_read.frame is None:
             return np.zeros((480, 640, 3), dtype=np.uint8)
         return self.frame_read.frame[:, :, ::-1]  # RGB->BGR
@@ -106,32 +189,33 @@ class TelloController:
             try:
                 b = self.tello.get_battery()
                 if b < 20:
-                    print("Battery too low for takeoff.")
+                    events.warn("takeoff", "Battery too low for takeoff.", battery=b)
                 else:
                     self.tello.takeoff()
                     self.in_flight = True
                     self.stop_all()
             except Exception as e:
-                print("Takeoff failed:", e)
+                events.error("takeoff", "Takeoff failed", error=str(e))
 
         elif key == ord('g'):
             try:
                 self.tello.land()
             except Exception as e:
-                print("Land failed:", e)
+                events.error("land", "Land failed", error=str(e))
             self.in_flight = False
             self.stop_all()
 
         elif key == ord('p'):
             self.approach_enabled = not self.approach_enabled
-            print(f"[APPROACH] enabled={self.approach_enabled}")
+            events.info("approach", enabled=self.approach_enabled)
             self.stop_all()
             self.approach_state = "ON" if self.approach_enabled else "OFF"
 
         return False
 
     def stop_all(self):
-        self.lr = self.fb = self.ud = self.yaw = 0
+        with self._rc_lock:
+            self.lr = self.fb = self.ud = self.yaw = 0
         self._yaw_f = self._fb_f = self._lr_f = 0.0
         self.approach_yaw = 0
         self.approach_fb = 0
@@ -187,11 +271,13 @@ class TelloController:
         if self.kb.is_pressed('space'):
             lr = fb = ud = yw = 0
 
-        self.lr, self.fb, self.ud, self.yaw = lr, fb, ud, yw
+        with self._rc_lock:
+            self.lr, self.fb, self.ud, self.yaw = lr, fb, ud, yw
 
     # -----------------------
     # semi-auto（中心＋正面＋距離）
     # -----------------------
+    @profiling.profiled("control.approach")
     def update_approach_from_aruco(self, marker_info, frame_shape):
         if not self.in_flight:
             return
@@ -204,7 +290,7 @@ class TelloController:
             self.approach_state = "MANUAL"
             return
 
-        now = time.time()
+        now = self.clock()
 
         # 見失い
         if marker_info is None:
@@ -214,6 +300,8 @@ class TelloController:
             self.approach_err_x = None
             self.approach_size_px = None
             self.approach_skew = None
+            self.approach_distance_m = None
+            self.approach_yaw_err = None
             self.approach_yaw = 0
             self.approach_fb = 0
             self.approach_lr = 0
@@ -229,23 +317,31 @@ class TelloController:
         self.approach_err_x = err_x
         self.approach_size_px = size_px
 
-        # ---- skew（正面度） ----
-        skew = None
+        # 姿勢推定の結果があれば距離・向きはメートル/度で扱う（マーカーの大きさに依らない）
+        dist_m = marker_info.get("distance_m", None)
+        yaw_err = marker_info.get("yaw_err_deg", None)
+        metric = dist_m is not None and yaw_err is not None
+        self.approach_distance_m = dist_m
+        self.approach_yaw_err = yaw_err
+
+        # ---- skew（正面度）：get_marker_info が計算済み ----
+        skew = marker_info.get("skew", None)
         yaw_from_skew = 0.0
-        quad = marker_info.get("corners", None)
-        if quad is not None:
-            q = np.array(quad, dtype=np.float32).reshape(4, 2)
-            tl, tr, br, bl = q[0], q[1], q[2], q[3]
-            left_len = float(np.linalg.norm(bl - tl))
-            right_len = float(np.linalg.norm(br - tr))
-            denom = max(1e-6, left_len + right_len)
-            skew = (right_len - left_len) / denom
-            if abs(skew) > self.skew_dead:
+        if metric:
+            not_facing = abs(yaw_err) > self.yaw_err_dead_deg
+            if not_facing:
+                yaw_from_skew = self.k_yaw_err_to_yaw * yaw_err
+        else:
+            not_facing = skew is not None and abs(skew) > self.skew_dead
+            if not_facing:
                 yaw_from_skew = self.k_skew_to_yaw * skew
         self.approach_skew = skew
 
         # ---- 近距離スケール（yawを弱める） ----
-        ratio = min(1.5, max(0.0, size_px / float(self.target_size_px)))
+        if metric:
+            ratio = min(1.5, max(0.0, self.target_distance_m / max(1e-3, dist_m)))
+        else:
+            ratio = min(1.5, max(0.0, size_px / float(self.target_size_px)))
         yaw_scale = max(0.25, 1.0 - (ratio - 0.6))
 
         # ---- (1) 中心合わせ：lr主役 ----
@@ -256,7 +352,7 @@ class TelloController:
 
         # ---- (2) yaw：中心補助は遠い時だけ少し + skewは常に ----
         yaw_from_center = 0.0
-        if size_px < (self.target_size_px * self.near_ratio):
+        if ratio < self.near_ratio:
             if abs(err_x) > self.center_dead_px:
                 yaw_from_center = self.k_err_to_yaw * err_x
 
@@ -265,33 +361,47 @@ class TelloController:
         if self.inv_yaw:
             yaw_cmd = -yaw_cmd
 
-        # ---- (3) 前進：sizeで距離 ----
-        size_err = self.target_size_px - size_px  # +遠い
+        # ---- (3) 前進：size（姿勢推定があれば distance_m）で距離 ----
         fb_cmd = 0.0
-        if abs(size_err) > self.size_dead_px:
-            fb_cmd = self.k_size_to_fb * size_err
+        if metric:
+            dist_err = dist_m - self.target_distance_m  # +遠い
+            if abs(dist_err) > self.distance_dead_m:
+                fb_cmd = self.k_dist_to_fb * dist_err
+        else:
+            size_err = self.target_size_px - size_px  # +遠い
+            if abs(size_err) > self.size_dead_px:
+                fb_cmd = self.k_size_to_fb * size_err
+        if fb_cmd != 0.0:
             fb_cmd = clamp_int(fb_cmd, -self.fb_max, self.fb_max)
             if fb_cmd > 0:
                 fb_cmd = max(self.fb_min, fb_cmd)
 
         # ズレてる間は前進抑制
         not_centered = abs(err_x) > self.center_dead_px
-        not_facing = (skew is not None and abs(skew) > self.skew_dead)
         if (not_centered or not_facing) and fb_cmd > 0:
             fb_cmd = int(fb_cmd * 0.45)
 
         # smoothing
-        a = self.smooth
-        self._yaw_f = a * self._yaw_f + (1 - a) * yaw_cmd
-        self._fb_f  = a * self._fb_f  + (1 - a) * fb_cmd
-        self._lr_f  = a * self._lr_f  + (1 - a) * lr_cmd
+        conf = marker_info.get("confidence", None)
+        if conf is None:
+            a = self.smooth
+            self._yaw_f = a * self._yaw_f + (1 - a) * yaw_cmd
+            self._fb_f  = a * self._fb_f  + (1 - a) * fb_cmd
+            self._lr_f  = a * self._lr_f  + (1 - a) * lr_cmd
+        else:
+            # MarkerTracker の推定は平滑化済み：EMA は掛けず、確からしさ（見失い中は減衰）で弱める
+            self._yaw_f = conf * yaw_cmd
+            self._fb_f  = conf * fb_cmd
+            self._lr_f  = conf * lr_cmd
 
         yaw_cmd = int(round(self._yaw_f))
         fb_cmd  = int(round(self._fb_f))
         lr_cmd  = int(round(self._lr_f))
 
         # state
-        if skew is not None and abs(skew) > self.skew_dead:
+        if marker_info.get("coasting", False):
+            self.approach_state = "COAST"
+        elif not_facing:
             self.approach_state = "FACING"
         elif abs(err_x) > self.center_dead_px:
             self.approach_state = "CENTERING"
@@ -300,11 +410,18 @@ class TelloController:
         else:
             self.approach_state = "HOLD"
 
+        # 遅延計測：新しい検出から指令を作った時刻（送信は update_motion で）
+        stamps = marker_info.get("stamps", None)
+        if stamps is not None and stamps is not self._lat_last:
+            self._lat_last = stamps
+            self._lat_pending = (stamps, time.perf_counter())
+
         # ★セミオート適用
-        self.lr = lr_cmd
-        self.fb = fb_cmd
-        self.ud = 0
-        self.yaw = yaw_cmd
+        with self._rc_lock:
+            self.lr = lr_cmd
+            self.fb = fb_cmd
+            self.ud = 0
+            self.yaw = yaw_cmd
 
         # UI
         self.approach_yaw = yaw_cmd
@@ -314,29 +431,118 @@ class TelloController:
     # -----------------------
     # send rc
     # -----------------------
+    @profiling.profiled("control.send_rc")
     def update_motion(self):
         if not self.in_flight:
             return
-        lr = clamp_int(self.lr, -100, 100)
-        fb = clamp_int(self.fb, -100, 100)
-        ud = clamp_int(self.ud, -100, 100)
-        yw = clamp_int(self.yaw, -100, 100)
-
-        # debug（0.2秒に1回）
-        if not hasattr(self, "_dbg_t"):
-            self._dbg_t = 0.0
+        with self._rc_lock:
+            lr = clamp_int(self.lr, -100, 100)
+            fb = clamp_int(self.fb, -100, 100)
+            ud = clamp_int(self.ud, -100, 100)
+            yw = clamp_int(self.yaw, -100, 100)
+        cmd = (lr, fb, ud, yw)
+
+        # debug（毎周期。event_log のファイルへ。端末には出ない）
         now = time.time()
-        if now - self._dbg_t > 0.2:
-            self._dbg_t = now
-            print(f"[RC DBG] lr={lr} fb={fb} ud={ud} yaw={yw}  approach={self.approach_enabled} "
-                  f"state={self.approach_state} err_x={self.approach_err_x} size={self.approach_size_px} skew={self.approach_skew}")
+        events.debug("rc_cmd", lr=lr, fb=fb, ud=ud, yaw=yw, approach=self.approach_enabled,
+                     state=self.approach_state, err_x=self.approach_err_x, size=self.approach_size_px,
+                     skew=self.approach_skew)
+
+        # 停止指令の連送は省く（keepalive 間隔ごとには送る）
+        if cmd == (0, 0, 0, 0) and self._last_sent == cmd and (now - self._last_sent_ts) < self.rc_keepalive_sec:
+            self.rc_skipped += 1
+            if self.recorder is not None:
+                self.recorder.rc(cmd, t=self._take_tick_t(), sent=False)
+            if self._lat_pending is not None:
+                self._lat_pending = None
+                self.latency.unsent += 1
+            return
 
         try:
             self.tello.send_rc_control(lr, fb, ud, yw)
+            self._last_sent = cmd
+            self._last_sent_ts = now
+            self.rc_sent += 1
+            if self.recorder is not None:
+                self.recorder.rc(cmd, t=self._take_tick_t())
+            pending = self._lat_pending
+            if pending is not None:
+                self._lat_pending = None
+                self.latency.add(pending[0], pending[1], time.perf_counter())
         except Exception as e:
-            print("send_rc_control failed:", e)
+            events.error("rc", "send_rc_control failed", error=str(e))
+
+    def _take_tick_t(self):
+        t, self.rc_tick_t = self.rc_tick_t, None
+        return t
+
+    # -----------------------
+    # fixed-rate rc scheduler
+    # -----------------------
+    def start_rc_scheduler(self, rate_hz=None, on_tick=None):
+        """
+        send_rc_control を固定レートで送るスレッドを開始する。
+        on_tick があれば毎周期 update_motion() の直前に呼ぶ（手動/セミオートの指令更新用）。
+        """
+        if self._rc_thread is not None and self._rc_thread.is_alive():
+            return
+        if rate_hz is not None:
+            self.rc_rate_hz = rate_hz
+        self._rc_on_tick = on_tick
+        self._rc_stop.clear()
+        self._rc_thread = threading.Thread(target=self._rc_loop, daemon=True)
+        self._rc_thread.start()
+
+    def stop_rc_scheduler(self):
+        self._rc_stop.set()
+        if self._rc_thread is not None:
+            self._rc_thread.join(timeout=1.0)
+        self._rc_thread = None
+
+    @property
+    def rc_scheduler_running(self):
+        return self._rc_thread is not None and self._rc_thread.is_alive()
+
+    def _rc_loop(self):
+        period = 1.0 / float(self.rc_rate_hz)
+        deadline = time.monotonic() + period
+
+        while not self._rc_stop.is_set():
+            delay = deadline - time.monotonic()
+            if delay > 0 and self._rc_stop.wait(delay):
+                break
+
+            now = time.monotonic()
+            late = now - deadline
+            self.rc_jitter_ms = abs(late) * 1000.0
+            self.rc_jitter_max_ms = max(self.rc_jitter_max_ms, self.rc_jitter_ms)
+
+            # 期限は絶対時刻で進める（sleep誤差を溜めない）。
+            # 1周期以上遅れたら取りこぼしとして数え、まとめ送りはしない。
+            deadline += period
+            if late > period:
+                skipped = int(late // period)
+                self.rc_missed += skipped
+                deadline += skipped * period
+
+            try:
+                with profiling.span("control.tick"):
+                    if self._rc_on_tick is not None:
+                        self._rc_on_tick()
+                    self.update_motion()
+            except Exception as e:
+                events.error("rc", "rc scheduler tick failed", error=str(e))
+
+    def rc_report(self):
+        return (f"rc={self.rc_rate_hz}Hz sent={self.rc_sent} skipped={self.rc_skipped} "
+                f"missed={self.rc_missed} jitter={self.rc_jitter_ms:.1f}/{self.rc_jitter_max_ms:.1f}ms")
 
     def cleanup(self):
+        self.stop_rc_scheduler()
+        self._pump_stop.set()
+        if self.video_reader is not None:
+            self.video_reader.stop()
+        self.telemetry.stop()
         try:
             self.tello.streamoff()
         except Exception:
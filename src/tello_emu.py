@@ -0,0 +1,616 @@
+# tello_emu.py
+"""
+Tello SDK（UDP）のエミュレータ。実機無しで djitellopy / TelloController を繋ぎ、
+コマンドの往復遅延・RC の到達レート・パケットロス時の制御の振る舞いを測る。
+
+ポート（実機と同じ）:
+    8889  コマンド受信。応答は送り元（アドレス, ポート）へ。rc には応答しない
+    8890  状態パケット。"command" を送ってきた相手の 8890 へ state_hz で送る
+    11111 映像。streamon 後、相手の 11111 へ H.264（Annex-B）を 1460 byte ずつ送る（PyAV が必要）
+
+    python tello_emu.py                                  # 合成 ArUco 映像
+    python tello_emu.py --source logs/flight_xxx.tlog    # 録画したフレームを流す
+    python tello_emu.py --latency 40 --jitter 15 --loss 0.05 --state-hz 10
+    python tello_emu.py --probe 127.0.0.1 --rc-hz 50     # 別端末から：往復遅延と RC スループット
+
+djitellopy は手元の 8889 を 0.0.0.0 で bind し、同じ番号の (host, 8889) へ送るので、
+エミュレータと同じネットワーク名前空間には置けない。1台の Linux では netns に入れて実機の
+アドレス（192.168.10.1）を持たせれば、main.py はそのまま繋がる：
+
+    sudo ip netns add tello
+    sudo ip link add veth-host type veth peer name veth-tello
+    sudo ip link set veth-tello netns tello
+    sudo ip addr add 192.168.10.2/24 dev veth-host && sudo ip link set veth-host up
+    sudo ip netns exec tello ip addr add 192.168.10.1/24 dev veth-tello
+    sudo ip netns exec tello ip link set veth-tello up
+    sudo ip netns exec tello python tello_emu.py
+
+--probe は空いているポートから送るので、同じ名前空間でもそのまま使える。
+遅延・揺らぎ・ロスは受信（コマンド）と送信（応答・状態・映像）の両方向に掛かる。
+"""
+import argparse
+import heapq
+import json
+import math
+import random
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from fractions import Fraction
+
+
+CONTROL_PORT = 8889
+STATE_PORT = 8890
+VIDEO_PORT = 11111
+VIDEO_CHUNK = 1460
+
+
+class NetImpairment:
+    """片道ごとの遅延（ms）・揺らぎ（ms, 一様 ±jitter）・ロス率。delay() が None なら落とす"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, loss=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.latency_ms > 0 or self.jitter_ms > 0 or self.loss > 0
+
+    def delay(self):
+        with self._lock:
+            if self.loss > 0 and self._rng.random() < self.loss:
+                return None
+            j = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        return max(0.0, self.latency_ms + j) / 1000.0
+
+
+class _DelayLine:
+    """期限つきの呼び出しを1本のスレッドで順に実行する（揺らぎで順序が入れ替わるのも再現）"""
+
+    def __init__(self):
+        self._heap = []
+        self._n = 0
+        self._cv = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay, fn, *args):
+        with self._cv:
+            self._n += 1
+            heapq.heappush(self._heap, (time.perf_counter() + delay, self._n, fn, args))
+            self._cv.notify()
+
+    def stop(self):
+        with self._cv:
+            self._stop = True
+            self._cv.notify()
+        self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._stop and (not self._heap or self._heap[0][0] > time.perf_counter()):
+                    timeout = None if not self._heap else self._heap[0][0] - time.perf_counter()
+                    self._cv.wait(timeout)
+                if self._stop:
+                    return
+                _, _, fn, args = heapq.heappop(self._heap)
+            try:
+                fn(*args)
+            except OSError:
+                pass
+
+
+# -----------------------
+# 映像
+# -----------------------
+class LogFrameSource:
+    """フライトログ（.tlog）の FRAME レコードを RGB で巡回する（SyntheticArUcoSource と同じ口）"""
+
+    def __init__(self, path):
+        from flight_log import REC_FRAME, FlightLogReader
+        self.log = FlightLogReader(path)
+        self._frames = [i for i in range(len(self.log)) if self.log.header(i)[0] == REC_FRAME]
+        if not self._frames:
+            raise ValueError(f"no frames in {path}")
+        rtype, codec, _, _, body = self.log.header(self._frames[0])
+        h, w = self.log.decode_frame(codec, body).shape[:2]
+        self.width, self.height = w, h
+
+    def __len__(self):
+        return len(self._frames)
+
+    def frame(self, i):
+        import cv2
+        _, codec, _, _, body = self.log.header(self._frames[i % len(self._frames)])
+        return cv2.cvtColor(self.log.decode_frame(codec, body), cv2.COLOR_BGR2RGB)
+
+    def close(self):
+        self.log.close()
+
+
+class H264Encoder:
+    """RGB フレーム → H.264 Annex-B（libx264, 低遅延設定。キーフレームごとに SPS/PPS 付き）"""
+
+    def __init__(self, width, height, fps=30, bitrate=1_500_000, gop=30):
+        import av
+        self._av = av
+        ctx = av.CodecContext.create("libx264", "w")
+        ctx.width = width
+        ctx.height = height
+        ctx.pix_fmt = "yuv420p"
+        ctx.time_base = Fraction(1, int(fps))
+        ctx.framerate = Fraction(int(fps), 1)
+        ctx.bit_rate = bitrate
+        ctx.gop_size = gop
+        ctx.options = {"preset": "ultrafast", "tune": "zerolatency"}
+        self.ctx = ctx
+        self.pts = 0
+
+    def encode(self, rgb):
+        fr = self._av.VideoFrame.from_ndarray(rgb, format="rgb24")
+        fr.pts = self.pts
+        self.pts += 1
+        return b"".join(bytes(p) for p in self.ctx.encode(fr))
+
+
+# -----------------------
+# エミュレータ本体
+# -----------------------
+class TelloEmulator:
+    """
+    source: frame(i) で RGB を返すもの（SyntheticArUcoSource / LogFrameSource）。None なら映像無し。
+    機体の状態は rc 指令を積分した簡単なモデル（速度 cm/s ≒ 指令値、yaw 速度 deg/s ≒ 指令値）。
+    """
+
+    def __init__(self, bind="0.0.0.0", source=None, *, fps=30, state_hz=10.0, impair=None,
+                 battery=87, bitrate=1_500_000, ports=(CONTROL_PORT, STATE_PORT, VIDEO_PORT)):
+        self.bind = bind
+        self.source = source
+        self.fps = fps
+        self.state_hz = state_hz
+        self.impair = impair or NetImpairment()
+        self.bitrate = bitrate
+        self.control_port, self.state_port, self.video_port = ports
+
+        # 機体
+        self.battery = float(battery)
+        self.in_flight = False
+        self.rc = (0, 0, 0, 0)
+        self.h = 0.0
+        self.yaw = 0.0
+        self.vx = self.vy = self.vz = 0.0
+        self.t_takeoff = None
+        self._t_model = time.perf_counter()
+
+        # 相手
+        self.client_ip = None
+        self.streaming = False
+
+        # 計測
+        self.counts = {"cmd_rx": 0, "rc_rx": 0, "rx_dropped": 0, "tx_dropped": 0, "state_tx": 0,
+                       "video_frames": 0, "video_bytes": 0, "unknown": 0}
+        self.rc_gap_max_ms = 0.0
+        self._t_last_rc = None
+        self._rc_times = deque()
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._delay = None
+        self.sock = None
+        self.out = None
+
+    # ---- 起動 / 停止 ----
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.bind, self.control_port))
+        self.sock.settimeout(0.2)
+        self.out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.out.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        if self.impair.active:
+            self._delay = _DelayLine()
+        for fn in (self._rx_loop, self._state_loop, self._video_loop):
+            th = threading.Thread(target=fn, daemon=True)
+            th.start()
+            self._threads.append(th)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for th in self._threads:
+            th.join(timeout=1.0)
+        if self._delay is not None:
+            self._delay.stop()
+        for s in (self.sock, self.out):
+            if s is not None:
+                s.close()
+
+    # ---- 送受信（遅延・ロスを掛ける） ----
+    def _via_link(self, fn, *args):
+        """片道ぶんの遅延・ロスを掛けて fn(*args)。落としたら False"""
+        if not self.impair.active:
+            fn(*args)
+            return True
+        d = self.impair.delay()
+        if d is None:
+            return False
+        self._delay.call_later(d, fn, *args)
+        return True
+
+    def _send(self, sock, data, addr):
+        if not self._via_link(sock.sendto, data, addr):
+            with self._lock:
+                self.counts["tx_dropped"] += 1
+
+    def _rx_loop(self):
+        while not self._stop.is_set():
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._stop.is_set():
+                    return
+                continue
+            if not self._via_link(self._on_command, data, addr):
+                with self._lock:
+                    self.counts["rx_dropped"] += 1
+
+    def _on_command(self, data, addr):
+        text = data.decode("utf-8", errors="replace").strip()
+        reply = self.handle(text, addr)
+        if reply is not None:
+            self._send(self.sock, reply.encode("utf-8"), addr)
+
+    # ---- コマンド ----
+    def handle(self, text, addr):
+        """1コマンドを処理して応答文字列（応答しないものは None）"""
+        now = time.perf_counter()
+        parts = text.split()
+        if not parts:
+            return None
+        cmd = parts[0]
+
+        with self._lock:
+            self._advance(now)
+            if cmd == "rc":
+                self.counts["rc_rx"] += 1
+                if self._t_last_rc is not None:
+                    self.rc_gap_max_ms = max(self.rc_gap_max_ms, (now - self._t_last_rc) * 1000.0)
+                self._t_last_rc = now
+                self._rc_times.append(now)
+                while now - self._rc_times[0] > 1.0:
+                    self._rc_times.popleft()
+                try:
+                    vals = tuple(max(-100, min(100, int(v))) for v in parts[1:5])
+                except ValueError:
+                    return None
+                if len(vals) == 4 and self.in_flight:
+                    self.rc = vals
+                return None
+
+            self.counts["cmd_rx"] += 1
+            if cmd == "command":
+                self.client_ip = addr[0]
+                return "ok"
+            if cmd == "takeoff":
+                self.in_flight = True
+                self.h = 80.0
+                self.t_takeoff = now
+                return "ok"
+            if cmd in ("land", "emergency"):
+                self.in_flight = False
+                self.rc = (0, 0, 0, 0)
+                self.h = 0.0
+                return "ok"
+            if cmd == "streamon":
+                self.streaming = True
+                return "ok"
+            if cmd == "streamoff":
+                self.streaming = False
+                return "ok"
+            if cmd in ("up", "down", "left", "right", "forward", "back", "cw", "ccw", "speed",
+                       "go", "curve", "flip", "stop", "setfps", "setbitrate", "setresolution",
+                       "downvision", "wifi", "ap", "motoron", "motoroff"):
+                return "ok"
+            if cmd.endswith("?"):
+                return self._query(cmd, now)
+            self.counts["unknown"] += 1
+            return "error"
+
+    def _query(self, cmd, now):
+        if cmd == "battery?":
+            return str(int(self.battery))
+        if cmd == "height?":
+            return f"{int(self.h // 10)}dm"
+        if cmd == "time?":
+            return f"{self._flight_time(now)}s"
+        if cmd == "speed?":
+            return str(int(math.hypot(self.vx, self.vy)))
+        if cmd == "temp?":
+            return "58~61C"
+        if cmd == "attitude?":
+            st = self._state(now)
+            return f"pitch:{st['pitch']};roll:{st['roll']};yaw:{st['yaw']};"
+        if cmd == "baro?":
+            return f"{self.h / 100.0:.2f}"
+        if cmd == "tof?":
+            return f"{int(self.h * 10 + 100)}mm"
+        if cmd == "wifi?":
+            return "90"
+        if cmd == "sdk?":
+            return "20"
+        if cmd == "sn?":
+            return "0TQZEMU000001"
+        if cmd == "emu?":
+            return json.dumps(self.report_dict(now))
+        self.counts["unknown"] += 1
+        return "error"
+
+    # ---- 機体モデル ----
+    def _advance(self, now):
+        dt = now - self._t_model
+        self._t_model = now
+        if dt <= 0 or not self.in_flight:
+            self.vx = self.vy = self.vz = 0.0
+            return
+        lr, fb, ud, yw = self.rc
+        self.vx, self.vy, self.vz = float(fb), float(lr), float(ud)
+        self.h = max(20.0, self.h + ud * dt)
+        self.yaw = (self.yaw + yw * dt + 180.0) % 360.0 - 180.0
+        self.battery = max(0.0, self.battery - dt / 30.0)
+
+    def _flight_time(self, now):
+        return 0 if self.t_takeoff is None else int(now - self.t_takeoff)
+
+    def _state(self, now):
+        lr, fb, ud, _ = self.rc if self.in_flight else (0, 0, 0, 0)
+        return {
+            "pitch": int(round(-fb * 0.1)),
+            "roll": int(round(lr * 0.1)),
+            "yaw": int(round(self.yaw)),
+            "vgx": int(round(self.vx)),
+            "vgy": int(round(self.vy)),
+            "vgz": int(round(self.vz)),
+            "templ": 58,
+            "temph": 61,
+            "tof": int(self.h + 10),
+            "h": int(self.h),
+            "bat": int(self.battery),
+            "baro": self.h / 100.0,
+            "time": self._flight_time(now),
+            "agx": -fb * 0.2,
+            "agy": lr * 0.2,
+            "agz": -998.0,
+        }
+
+    @staticmethod
+    def state_packet(st):
+        return ("pitch:%d;roll:%d;yaw:%d;vgx:%d;vgy:%d;vgz:%d;templ:%d;temph:%d;tof:%d;h:%d;bat:%d;"
+                "baro:%.2f;time:%d;agx:%.2f;agy:%.2f;agz:%.2f;\r\n" % (
+                    st["pitch"], st["roll"], st["yaw"], st["vgx"], st["vgy"], st["vgz"],
+                    st["templ"], st["temph"], st["tof"], st["h"], st["bat"], st["baro"], st["time"],
+                    st["agx"], st["agy"], st["agz"])).encode("ascii")
+
+    def _state_loop(self):
+        period = 1.0 / float(self.state_hz)
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                deadline = time.perf_counter()
+            ip = self.client_ip
+            if ip is None:
+                continue
+            now = time.perf_counter()
+            with self._lock:
+                self._advance(now)
+                pkt = self.state_packet(self._state(now))
+                self.counts["state_tx"] += 1
+            self._send(self.out, pkt, (ip, self.state_port))
+
+    def _video_loop(self):
+        if self.source is None:
+            return
+        try:
+            first = self.source.frame(0)
+            enc = H264Encoder(first.shape[1], first.shape[0], fps=self.fps, bitrate=self.bitrate,
+                              gop=int(self.fps))
+        except ImportError:
+            print("[WARN] tello_emu: PyAV (av) not installed; video disabled")
+            return
+
+        period = 1.0 / float(self.fps)
+        deadline = time.perf_counter()
+        i = 0
+        while not self._stop.is_set():
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                deadline = time.perf_counter()
+            ip = self.client_ip
+            if ip is None or not self.streaming:
+                continue
+            data = enc.encode(self.source.frame(i))
+            i += 1
+            addr = (ip, self.video_port)
+            for k in range(0, len(data), VIDEO_CHUNK):
+                self._send(self.out, data[k:k + VIDEO_CHUNK], addr)
+            with self._lock:
+                self.counts["video_frames"] += 1
+                self.counts["video_bytes"] += len(data)
+
+    # ---- 計測 ----
+    def report_dict(self, now=None):
+        now = time.perf_counter() if now is None else now
+        out = dict(self.counts)
+        out["rc_hz"] = sum(1 for t in self._rc_times if now - t <= 1.0)
+        out["rc_gap_max_ms"] = round(self.rc_gap_max_ms, 1)
+        out["in_flight"] = self.in_flight
+        out["rc"] = list(self.rc)
+        return out
+
+    def report(self):
+        with self._lock:
+            d = self.report_dict()
+        return (f"cmd={d['cmd_rx']} rc={d['rc_rx']} ({d['rc_hz']}/s, gap_max={d['rc_gap_max_ms']:.0f}ms) "
+                f"state_tx={d['state_tx']} video={d['video_frames']}f/{d['video_bytes'] / 1e6:.1f}MB "
+                f"dropped rx/tx={d['rx_dropped']}/{d['tx_dropped']}")
+
+
+# -----------------------
+# プローブ（クライアント側の計測）
+# -----------------------
+def _ask(sock, addr, text, timeout):
+    """古い応答を捨ててから送り、応答を待つ。(応答, 往復秒) か (None, None)"""
+    sock.setblocking(False)
+    try:
+        while True:
+            sock.recvfrom(4096)
+    except OSError:
+        pass
+    sock.settimeout(timeout)
+    t0 = time.perf_counter()
+    sock.sendto(text.encode("utf-8"), addr)
+    try:
+        data, _ = sock.recvfrom(65536)
+    except socket.timeout:
+        return None, None
+    return data.decode("utf-8", errors="replace"), time.perf_counter() - t0
+
+
+def probe(host="127.0.0.1", n_cmd=50, rc_hz=30.0, rc_sec=5.0, timeout=0.5, port=CONTROL_PORT):
+    """
+    エミュレータ（か実機）へ：
+      - "battery?" を n_cmd 回投げて往復遅延（ms の p50/p95/max）と無応答数
+      - rc を rc_hz で rc_sec 秒送り、エミュレータ側で受け取れた数（emu? で数える）
+    """
+    addr = (host, port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("", 0))
+    try:
+        reply, _ = _ask(sock, addr, "command", timeout)
+        if reply is None:
+            raise TimeoutError(f"no reply from {host}:{port}")
+
+        rtts = []
+        lost = 0
+        for _ in range(n_cmd):
+            reply, rtt = _ask(sock, addr, "battery?", timeout)
+            if reply is None:
+                lost += 1
+            else:
+                rtts.append(rtt * 1000.0)
+        rtts.sort()
+
+        def pct(q):
+            return rtts[min(len(rtts) - 1, int(math.ceil(q / 100.0 * len(rtts))) - 1)] if rtts else None
+
+        before = _emu_stats(sock, addr, timeout)
+        n_rc = int(rc_hz * rc_sec)
+        period = 1.0 / rc_hz
+        t_start = deadline = time.perf_counter()
+        for k in range(n_rc):
+            sock.sendto(f"rc {k % 21 - 10} 0 0 0".encode("utf-8"), addr)
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sent_sec = time.perf_counter() - t_start
+        time.sleep(timeout)
+        after = _emu_stats(sock, addr, timeout)
+    finally:
+        sock.close()
+
+    out = {
+        "cmd_sent": n_cmd,
+        "cmd_lost": lost,
+        "rtt_ms_p50": pct(50),
+        "rtt_ms_p95": pct(95),
+        "rtt_ms_max": rtts[-1] if rtts else None,
+        "rc_sent": n_rc,
+        "rc_send_hz": n_rc / max(1e-6, sent_sec),
+    }
+    if before is not None and after is not None:
+        got = after["rc_rx"] - before["rc_rx"]
+        out["rc_received"] = got
+        out["rc_delivery"] = got / float(max(1, n_rc))
+        out["rc_gap_max_ms"] = after["rc_gap_max_ms"]
+    return out
+
+
+def _emu_stats(sock, addr, timeout, tries=5):
+    for _ in range(tries):
+        reply, _ = _ask(sock, addr, "emu?", timeout)
+        if reply is not None and reply.startswith("{"):
+            return json.loads(reply)
+    return None   # 実機か、ロスで取れなかった
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Tello SDK UDP emulator (command/state/video) with link impairment")
+    ap.add_argument("--bind", default="0.0.0.0")
+    ap.add_argument("--source", default="synthetic", help='"synthetic" / .tlog のパス / "none"（映像無し）')
+    ap.add_argument("--res", default="960x720", help="合成映像の解像度")
+    ap.add_argument("--frames", type=int, default=90, help="合成映像のフレーム数（巡回）")
+    ap.add_argument("--fps", type=int, default=30)
+    ap.add_argument("--bitrate", type=int, default=1_500_000)
+    ap.add_argument("--state-hz", type=float, default=10.0)
+    ap.add_argument("--battery", type=int, default=87)
+    ap.add_argument("--latency", type=float, default=0.0, help="片道の遅延 ms")
+    ap.add_argument("--jitter", type=float, default=0.0, help="片道の揺らぎ ±ms")
+    ap.add_argument("--loss", type=float, default=0.0, help="パケットロス率 0..1")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--report-sec", type=float, default=2.0)
+    ap.add_argument("--probe", metavar="HOST", default=None, help="エミュレータ（か実機）を計測して終了")
+    ap.add_argument("--cmds", type=int, default=50, help="--probe: battery? の回数")
+    ap.add_argument("--rc-hz", type=float, default=30.0, help="--probe: rc の送信レート")
+    ap.add_argument("--rc-sec", type=float, default=5.0, help="--probe: rc を送る秒数")
+    args = ap.parse_args(argv)
+
+    if args.probe:
+        r = probe(args.probe, n_cmd=args.cmds, rc_hz=args.rc_hz, rc_sec=args.rc_sec)
+        print("[PROBE] " + "  ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in r.items()))
+        return 0
+
+    source = None
+    if args.source == "synthetic":
+        from sim_tello import SyntheticArUcoSource
+        w, h = (int(v) for v in args.res.lower().split("x"))
+        source = SyntheticArUcoSource(w, h, n_frames=args.frames)
+    elif args.source != "none":
+        source = LogFrameSource(args.source)
+
+    emu = TelloEmulator(args.bind, source, fps=args.fps, state_hz=args.state_hz, battery=args.battery,
+                        bitrate=args.bitrate,
+                        impair=NetImpairment(args.latency, args.jitter, args.loss, seed=args.seed)).start()
+    print(f"[EMU] listening on {args.bind}:{emu.control_port}  latency={args.latency}ms "
+          f"jitter={args.jitter}ms loss={args.loss}  video={'on' if source is not None else 'off'}")
+    try:
+        while True:
+            time.sleep(args.report_sec)
+            print(f"[EMU] {emu.report()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emu.stop()
+        if isinstance(source, LogFrameSource):
+            source.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
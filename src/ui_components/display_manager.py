@@ -2,6 +2,8 @@
 import cv2
 import numpy as np
 
+import profiling
+
 
 class DisplayManager:
     def __init__(
@@ -27,6 +29,12 @@ class DisplayManager:
         self.h = init_h
         self.ui_w = ui_min
 
+        # サイズが変わった時に呼ぶ関数（UIキャッシュの破棄など）
+        self._resize_listeners = []
+
+        # ウィンドウと同じ大きさの出力バッファ（映像とUIはここへ直接描く）
+        self._canvas = None
+
         self._create_window()
 
     def _create_window(self):
@@ -57,13 +65,27 @@ class DisplayManager:
         ui_w = max(self.ui_min, min(ui_w, self.ui_max))
         return ui_w
 
+    def add_resize_listener(self, fn):
+        self._resize_listeners.append(fn)
+
     def update(self):
+        prev = (self.w, self.h, self.ui_w)
         wh = self._get_window_size()
         if wh is not None:
             self.w, self.h = wh
         self.ui_w = self._compute_ui_w(self.w)
+        if (self.w, self.h, self.ui_w) != prev:
+            for fn in self._resize_listeners:
+                fn()
         return self.w, self.h, self.ui_w
 
+    def canvas(self):
+        """ウィンドウサイズの出力バッファ（サイズが変わった時だけ確保し直す）"""
+        c = self._canvas
+        if c is None or c.shape[0] != self.h or c.shape[1] != self.w:
+            c = self._canvas = np.zeros((self.h, self.w, 3), dtype=np.uint8)
+        return c
+
     @staticmethod
     def fit_exact_black(img, W, H):
         canvas = np.zeros((H, W, 3), dtype=img.dtype)
@@ -72,7 +94,18 @@ class DisplayManager:
         canvas[:hh, :ww] = img[:hh, :ww]
         return canvas
 
+    @profiling.profiled("ui.fit")
     def fit(self, img):
         if img.shape[1] != self.w or img.shape[0] != self.h:
-            return self.fit_exact_black(img, self.w, self.h)
+            if img.dtype != np.uint8:
+                return self.fit_exact_black(img, self.w, self.h)
+            # 新しい黒キャンバスを作らず、出力バッファへ黒埋め＋コピー
+            c = self.canvas()
+            if np.shares_memory(img, c):
+                img = img.copy()
+            c[:] = 0
+            hh = min(self.h, img.shape[0])
+            ww = min(self.w, img.shape[1])
+            c[:hh, :ww] = img[:hh, :ww]
+            return c
         return img
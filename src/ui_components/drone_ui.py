@@ -2,6 +2,8 @@
 import cv2
 import numpy as np
 
+import profiling
+
 from .layout import compose_side
 from .style import TEXT
 from .config import (
@@ -22,15 +24,20 @@ from .config import (
     BAR_LABEL_SCALE, BAR_LABEL_Y_GAP, BAR_LABEL_PAD, BAR_LABEL_ALPHA,
 )
 from .widgets import (
+    _gauge_label_pos,
     blend_rect,
     boxed_text,
     boxed_center_multiline,
     put_right_outline,
     put_outline,
-    neon_gauge,
-    bar,
-    draw_position_map,
+    neon_gauge_static,
+    neon_gauge_dynamic,
+    bar_static,
+    bar_fill,
+    position_map_static,
+    position_map_dynamic,
 )
+from .layer_cache import AffineLayer
 
 
 def _calc_s(w: int) -> float:
@@ -48,6 +55,23 @@ class DroneUI:
         self.crosshair_size = 12      # 十字の半径（px）
         self.crosshair_thickness = 1  # 線の太さ
 
+        # 静的レイヤーのキャッシュ（サイズが変わったら invalidate_cache()）
+        self._hud_static_key = None
+        self._hud_static_layers = []
+        self._panel_cache = {}
+
+        # 出力キャンバス（毎フレーム使い回す）と、前フレームに描いたウィジェットの表示値
+        self._out = None
+        self._panel_state = None
+        self.widgets_redrawn = 0
+        self.widgets_total = 0
+
+    def invalidate_cache(self):
+        self._hud_static_key = None
+        self._hud_static_layers = []
+        self._panel_cache.clear()
+        self._panel_state = None
+
     def compose_side(
         self,
         frame,
@@ -56,6 +80,7 @@ class DroneUI:
         display_h: int,
         ui_w: int = 260,
         ui_bg=(0, 0, 0),
+        out=None,
         **telemetry,
     ):
         return compose_side(
@@ -65,6 +90,7 @@ class DroneUI:
             display_h,
             ui_w=ui_w,
             ui_bg=ui_bg,
+            out=out,
             **telemetry,
         )
     
@@ -90,6 +116,7 @@ class DroneUI:
         approach_yaw=None,
         approach_err_x=None,
         approach_size_px=None,
+        latency_text=None,
     ):
         h, w, _ = canvas.shape
         s = _calc_s(w)
@@ -132,6 +159,21 @@ class DroneUI:
             alpha=HUD_SN_ALPHA,
         )
 
+        # フレーム到着 → RC送信の遅延（区間ごとの p50/p95）
+        if latency_text:
+            boxed_text(
+                canvas,
+                latency_text,
+                int(HUD_SN_X * s),
+                int((HUD_SN_Y + 56) * s),
+                HUD_SN_SCALE * s * ts * 0.85,
+                TEXT,
+                pad=6,
+                thickness=1,
+                outline=2,
+                alpha=HUD_SN_ALPHA,
+            )
+
         # 右上 TEMP/time
         ttemp = "--" if temp is None else str(int(temp))
         ttime = "--" if flight_time is None else str(int(flight_time))
@@ -150,20 +192,45 @@ class DroneUI:
         blend_rect(canvas, x1, y1, x2, y2, alpha=HUD_TOP_ALPHA)
         put_right_outline(canvas, top_line, x_right, y_base, top_scale, TEXT, thickness=1, outline=2)
 
+        # 右下 wifi / 左下 コマンド / 中央クロスヘアは事前計算した層を重ねるだけ
+        for layer in self._hud_static_layers_for(w, h, wifi, commands):
+            layer.apply(canvas)
+
+        return canvas
+
+    def _hud_static_layers_for(self, w, h, wifi, commands):
+        key = (
+            w, h, self.text_scale, wifi, commands,
+            getattr(self, "crosshair_enabled", True),
+            int(getattr(self, "crosshair_y_offset", 0)),
+            int(getattr(self, "crosshair_size", 12)),
+            int(getattr(self, "crosshair_thickness", 1)),
+        )
+        if key != self._hud_static_key:
+            self._hud_static_layers = self._build_hud_static_layers(w, h, wifi, commands)
+            self._hud_static_key = key
+        return self._hud_static_layers
+
+    def _build_hud_static_layers(self, w, h, wifi, commands):
+        s = _calc_s(w)
+        ts = self.text_scale
+        layers = []
+
         # 右下 wifi
         wifi_txt = f"wifi:{wifi if wifi is not None else '--'}"
-        boxed_text(
-            canvas,
-            wifi_txt,
-            int(w - HUD_WIFI_RIGHT_INSET * s),
-            int(h - HUD_WIFI_BOTTOM_INSET * s),
-            HUD_WIFI_SCALE * s * ts,
-            TEXT,
-            pad=6,
-            thickness=1,
-            outline=2,
-            alpha=HUD_WIFI_ALPHA,
-        )
+        wx = int(w - HUD_WIFI_RIGHT_INSET * s)
+        wy = int(h - HUD_WIFI_BOTTOM_INSET * s)
+        wscale = HUD_WIFI_SCALE * s * ts
+        # 縁取り（太さ2）の文字列は太さ1より横に長いので、範囲は太さ2で測る
+        (tw, th), base = cv2.getTextSize(wifi_txt, cv2.FONT_HERSHEY_SIMPLEX, wscale, 2)
+        m = 6 + base + 4
+        layers.append(AffineLayer.render(
+            w, h, (wx - m, wy - th - m, wx + tw + m, wy + m),
+            lambda c, ox, oy: boxed_text(
+                c, wifi_txt, wx - ox, wy - oy, wscale, TEXT,
+                pad=6, thickness=1, outline=2, alpha=HUD_WIFI_ALPHA,
+            ),
+        ))
 
         # 左下 コマンド
         if commands is None:
@@ -173,12 +240,18 @@ class DroneUI:
         x = int(HUD_CMD_X * s)
         y = int(h - HUD_CMD_BOTTOM_INSET * s)
 
-        (tw2, th2), _ = cv2.getTextSize(commands, cv2.FONT_HERSHEY_SIMPLEX, cmd_scale, 1)
+        (tw2, th2), base2 = cv2.getTextSize(commands, cv2.FONT_HERSHEY_SIMPLEX, cmd_scale, 1)
+        (tw_out, _), _ = cv2.getTextSize(commands, cv2.FONT_HERSHEY_SIMPLEX, cmd_scale, 2)
         pad2 = int(HUD_CMD_PAD * s)
-        blend_rect(canvas, x - pad2, y - th2 - pad2, x + tw2 + pad2, y + pad2, alpha=HUD_CMD_ALPHA)
-        put_outline(canvas, commands, (x, y), cmd_scale, TEXT, thickness=1, outline=2)
+        m2 = pad2 + base2 + 4
+
+        def draw_cmd(c, ox, oy):
+            blend_rect(c, x - pad2 - ox, y - th2 - pad2 - oy, x + tw2 + pad2 - ox, y + pad2 - oy, alpha=HUD_CMD_ALPHA)
+            put_outline(c, commands, (x - ox, y - oy), cmd_scale, TEXT, thickness=1, outline=2)
 
-                # ===== Crosshair (center) =====
+        layers.append(AffineLayer.render(w, h, (x - m2, y - th2 - m2, x + max(tw2, tw_out) + m2, y + m2), draw_cmd))
+
+        # ===== Crosshair (center) =====
         if getattr(self, "crosshair_enabled", True):
             cx = w // 2
             cy = h // 2 + int(getattr(self, "crosshair_y_offset", 0))
@@ -186,43 +259,41 @@ class DroneUI:
             size = int(getattr(self, "crosshair_size", 12))
             thick = int(getattr(self, "crosshair_thickness", 1))
 
-            # 目立たせるために「縁取り → 本線」
-            # 中心点
-            cv2.circle(canvas, (cx, cy), max(2, thick + 2), (0, 0, 0), -1, cv2.LINE_AA)
-            cv2.circle(canvas, (cx, cy), max(1, thick), (255, 255, 120), -1, cv2.LINE_AA)  # CYANっぽい
+            def draw_cross(c, ox, oy):
+                px, py = cx - ox, cy - oy
+                # 目立たせるために「縁取り → 本線」
+                # 中心点
+                cv2.circle(c, (px, py), max(2, thick + 2), (0, 0, 0), -1, cv2.LINE_AA)
+                cv2.circle(c, (px, py), max(1, thick), (255, 255, 120), -1, cv2.LINE_AA)  # CYANっぽい
 
-            # 横線
-            cv2.line(canvas, (cx - size, cy), (cx + size, cy), (0, 0, 0), thick + 2, cv2.LINE_AA)
-            cv2.line(canvas, (cx - size, cy), (cx + size, cy), (255, 255, 120), thick, cv2.LINE_AA)
+                # 横線
+                cv2.line(c, (px - size, py), (px + size, py), (0, 0, 0), thick + 2, cv2.LINE_AA)
+                cv2.line(c, (px - size, py), (px + size, py), (255, 255, 120), thick, cv2.LINE_AA)
 
-            # 縦線
-            cv2.line(canvas, (cx, cy - size), (cx, cy + size), (0, 0, 0), thick + 2, cv2.LINE_AA)
-            cv2.line(canvas, (cx, cy - size), (cx, cy + size), (255, 255, 120), thick, cv2.LINE_AA)
+                # 縦線
+                cv2.line(c, (px, py - size), (px, py + size), (0, 0, 0), thick + 2, cv2.LINE_AA)
+                cv2.line(c, (px, py - size), (px, py + size), (255, 255, 120), thick, cv2.LINE_AA)
 
+            m3 = max(size, thick + 2) + thick + 4
+            layers.append(AffineLayer.render(w, h, (cx - m3, cy - m3, cx + m3 + 1, cy + m3 + 1), draw_cross))
 
-        return canvas
+        return [layer for layer in layers if layer is not None]
 
     # -----------------------------
     # 右（UIパネル）側：メーター/バーのみ
     # -----------------------------
-    def _render_ui_panel(
-        self,
-        canvas,
-        *,
-        battery=None,
-        roll=None,
-        pitch=None,
-        yaw=None,
-        height=None,
-        total_alt=None,
-        agx=None, agy=None, agz=None,
-        speed=None,
-        pos_xy=None,
-        pos_range=3.0,
-    ):
-        h, w, _ = canvas.shape
+    _GAUGE_SPECS = (
+        ("ROLL (X)",  "roll",  -90,  90),
+        ("PITCH (Y)", "pitch", -90,  90),
+        ("YAW (Z)",   "yaw",  -180, 180),
+        ("ACC (X)",   "agx",  -500, 500),
+        ("ACC (Y)",   "agy",  -500, 500),
+        ("ACC (Z)",   "agz",  -500, 500),
+    )
+
+    def _panel_geometry(self, w, h):
+        """パネル内の配置（サイズだけで決まるのでキャッシュに一緒に持つ）"""
         s = _calc_s(w)
-        ts = self.text_scale
 
         cols, rows = PANEL_COLS, PANEL_ROWS
 
@@ -243,31 +314,20 @@ class DroneUI:
         block_h = rows * (2 * r) + (rows - 1) * gap_y
         block_x0 = w - margin - block_w
 
-        blend_rect(
-            canvas,
+        gauge_bg = (
             block_x0 - int(GAUGE_BG_PAD_X * s),
             block_y0 - int(GAUGE_BG_PAD_TOP * s),
             w - margin + int(GAUGE_BG_PAD_X * s),
             block_y0 + block_h + int(GAUGE_BG_PAD_BOTTOM * s),
-            alpha=GAUGE_BG_ALPHA,
         )
 
-        gauge_specs = [
-            ("ROLL (X)",  roll,  -90,  90),
-            ("PITCH (Y)", pitch, -90,  90),
-            ("YAW (Z)",   yaw,  -180, 180),
-            ("ACC (X)",   agx,  -500, 500),
-            ("ACC (Y)",   agy,  -500, 500),
-            ("ACC (Z)",   agz,  -500, 500),
-        ]
-
+        gauges = []
         idx = 0
         for rr in range(rows):
             cy = block_y0 + rr * ((2 * r) + gap_y) + r
             for cc in range(cols):
                 cx = block_x0 + cc * ((2 * r) + gap_x) + r
-                label, val, vmin, vmax = gauge_specs[idx]
-                neon_gauge(canvas, (cx, cy), r, val, vmin, vmax, label, show_value=True, text_scale=ts)
+                gauges.append(((cx, cy),) + self._GAUGE_SPECS[idx])
                 idx += 1
 
         # ===== バー =====
@@ -288,21 +348,105 @@ class DroneUI:
         bx2 = bx1 + bar_w + bar_gap
         bx3 = bx2 + bar_w + bar_gap
 
-        alt_ratio = None if height is None else max(0.0, min(1.0, float(height) / 300.0))
-        spd_ratio = None if speed is None else max(0.0, min(1.0, float(speed) / 100.0))
-        bat_ratio = None if battery is None else max(0.0, min(1.0, float(battery) / 100.0))
-
-        bar(canvas, bx1, bar_top, bar_w, bar_h, alt_ratio)
-        bar(canvas, bx2, bar_top, bar_w, bar_h, spd_ratio)
-        bar(canvas, bx3, bar_top, bar_w, bar_h, bat_ratio)
-
         # ===== 位置インジケーター（バー右の空きスペース活用）=====
         map_x0 = bx3 + bar_w + bar_gap
         map_w = w - margin - map_x0
         if map_w < 50:
             map_w = max(50, int(bar_w * 1.1))
             map_x0 = w - margin - map_w
-        map_h = bar_h
+
+        label_y = bar_top + bar_h + int(BAR_LABEL_Y_GAP * s)
+
+        # ===== ウィジェットごとの描き直し範囲 =====
+        ts = self.text_scale
+        rects = {}
+        for center, label, key, _, _ in gauges:
+            cx, cy = center
+            _, ly, _, _, _ = _gauge_label_pos(center, r, label, ts)
+            (_, th2), base2 = cv2.getTextSize("-180", cv2.FONT_HERSHEY_SIMPLEX, 0.40 * ts, 1)
+            rects["gauge:" + key] = (cx - r - 4, cy - r - 4, cx + r + 5, ly + th2 + 3 + 4 + base2 + 3)
+        for name, bx in zip(("alt", "spd", "bat"), (bx1, bx2, bx3)):
+            rects["bar:" + name] = (bx, bar_top, bx + bar_w + 1, bar_top + bar_h + 1)
+        arrow = max(10, int(min(map_w, bar_h) * 0.08)) + 3
+        rects["map"] = (map_x0 - arrow, bar_top - arrow, map_x0 + map_w + arrow + 1, bar_top + bar_h + arrow + 1)
+
+        label_scale = BAR_LABEL_SCALE * s * ts
+        (_, lh), lbase = cv2.getTextSize("BAT100%", cv2.FONT_HERSHEY_SIMPLEX, label_scale, 2)
+        lpad = int(BAR_LABEL_PAD * s)
+        rects["labels"] = (0, label_y - lh - lpad - 3, w, label_y + int(lh * 1.55) + lpad + lbase + 3)
+
+        clipped = {}
+        for name, (x0, y0, x1, y1) in rects.items():
+            clipped[name] = (max(0, x0), max(0, y0), min(w, x1), min(h, y1))
+
+        # 範囲が重なるウィジェットは一緒に描き直す
+        def _hit(a, b):
+            return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+        overlaps = {
+            a: [b for b in clipped if b != a and _hit(clipped[a], clipped[b])]
+            for a in clipped
+        }
+
+        return {
+            "s": s,
+            "r": r,
+            "gauge_bg": gauge_bg,
+            "gauges": gauges,
+            "bar_top": bar_top,
+            "bar_w": bar_w,
+            "bar_h": bar_h,
+            "bars_x": (bx1, bx2, bx3),
+            "map": (map_x0, bar_top, map_w, bar_h),
+            "label_y": label_y,
+            "rects": clipped,
+            "overlaps": overlaps,
+        }
+
+    def _panel_static(self, w, h, ui_bg, dtype):
+        """背景色 + 円弧/目盛り/ラベル/バー枠/マップ枠 を描いた画像（サイズごとにキャッシュ）"""
+        key = (w, h, self.text_scale, tuple(ui_bg), dtype)
+        hit = self._panel_cache.get(key)
+        if hit is not None:
+            return hit
+
+        g = self._panel_geometry(w, h)
+        base = np.full((h, w, 3), ui_bg, dtype=dtype)
+        ts = self.text_scale
+
+        blend_rect(base, *g["gauge_bg"], alpha=GAUGE_BG_ALPHA)
+        for center, label, _, _, _ in g["gauges"]:
+            neon_gauge_static(base, center, g["r"], label, text_scale=ts)
+
+        for bx in g["bars_x"]:
+            bar_static(base, bx, g["bar_top"], g["bar_w"], g["bar_h"])
+
+        position_map_static(base, *g["map"])
+
+        self._panel_cache[key] = (base, g)
+        return base, g
+
+    @staticmethod
+    def _disp_int(v):
+        if v is None:
+            return None
+        try:
+            return int(round(float(v)))
+        except Exception:
+            return None
+
+    @staticmethod
+    def _ratio(v, full):
+        return None if v is None else max(0.0, min(1.0, float(v) / full))
+
+    def _panel_values(self, g, roll, pitch, yaw, agx, agy, agz, height, speed, battery, pos_xy, pos_range):
+        """
+        ウィジェットごとの「表示される値」（画面上の精度に丸めたもの）。
+        これが前フレームと同じウィジェットは描き直さない。
+        """
+        di = self._disp_int
+        bar_h = g["bar_h"]
+
         pos_label = None
         if pos_xy is not None:
             try:
@@ -311,51 +455,171 @@ class DroneUI:
                 pos_label = None
         try:
             if isinstance(pos_range, (list, tuple)) and len(pos_range) == 2:
-                pos_range_arg = pos_range
+                pos_range_arg = tuple(pos_range)
             else:
                 pos_range_arg = max(float(pos_range), 0.1)
         except Exception:
             pos_range_arg = 3.0
 
-        draw_position_map(
-            canvas,
-            map_x0,
-            bar_top,
-            map_w,
-            map_h,
-            pos_xy,
-            max_range=pos_range_arg,
-            yaw_deg=yaw,
-            label=pos_label,
-        )
+        alt_ratio = self._ratio(height, 300.0)
+        spd_ratio = self._ratio(speed, 100.0)
+        bat_ratio = self._ratio(battery, 100.0)
+
+        keys = {
+            "gauge:roll": di(roll),
+            "gauge:pitch": di(pitch),
+            "gauge:yaw": di(yaw),
+            "gauge:agx": di(agx),
+            "gauge:agy": di(agy),
+            "gauge:agz": di(agz),
+            "bar:alt": None if alt_ratio is None else int(bar_h * alt_ratio),
+            "bar:spd": None if spd_ratio is None else int(bar_h * spd_ratio),
+            "bar:bat": None if bat_ratio is None else int(bar_h * bat_ratio),
+            "map": (pos_label, di(yaw), pos_range_arg),
+            "labels": (None if height is None else int(height),
+                       None if speed is None else int(speed),
+                       None if battery is None else int(battery)),
+        }
+        values = {
+            "roll": roll, "pitch": pitch, "yaw": yaw, "agx": agx, "agy": agy, "agz": agz,
+            "height": height, "speed": speed, "battery": battery,
+            "alt_ratio": alt_ratio, "spd_ratio": spd_ratio, "bat_ratio": bat_ratio,
+            "pos_xy": pos_xy, "pos_label": pos_label, "pos_range": pos_range_arg,
+        }
+        return keys, values
+
+    # 全体描画と同じ重ね順
+    _PANEL_ORDER = (
+        "gauge:roll", "gauge:pitch", "gauge:yaw", "gauge:agx", "gauge:agy", "gauge:agz",
+        "bar:alt", "bar:spd", "bar:bat",
+        "map",
+        "labels",
+    )
+
+    def _draw_panel_widget(self, canvas, g, name, v):
+        ts = self.text_scale
+        if name.startswith("gauge:"):
+            key = name[6:]
+            for center, label, k, vmin, vmax in g["gauges"]:
+                if k == key:
+                    neon_gauge_dynamic(canvas, center, g["r"], v[key], vmin, vmax, label, show_value=True, text_scale=ts)
+                    return
 
-        # ===== バーラベル（改行）=====
-        label_scale = BAR_LABEL_SCALE * s * ts
-        alt_val = "--" if height is None else str(int(height))
-        spd_val = "--" if speed is None else str(int(speed))
-        bat_val = "--%" if battery is None else f"{int(battery)}%"
+        bar_top, bar_w, bar_h = g["bar_top"], g["bar_w"], g["bar_h"]
+        bx1, bx2, bx3 = g["bars_x"]
 
-        alt_txt = f"ALT\n{alt_val}"
-        spd_txt = f"SPD\n{spd_val}"
-        bat_txt = f"BAT\n{bat_val}"
+        # ===== バー =====
+        if name == "bar:alt":
+            bar_fill(canvas, bx1, bar_top, bar_w, bar_h, v["alt_ratio"])
+        elif name == "bar:spd":
+            bar_fill(canvas, bx2, bar_top, bar_w, bar_h, v["spd_ratio"])
+        elif name == "bar:bat":
+            bar_fill(canvas, bx3, bar_top, bar_w, bar_h, v["bat_ratio"])
+
+        # ===== 位置インジケーター =====
+        elif name == "map":
+            position_map_dynamic(
+                canvas,
+                *g["map"],
+                v["pos_xy"],
+                max_range=v["pos_range"],
+                yaw_deg=v["yaw"],
+                label=v["pos_label"],
+            )
 
-        label_y1 = bar_top + bar_h + int(BAR_LABEL_Y_GAP * s)
+        # ===== バーラベル（改行）=====
+        elif name == "labels":
+            s = g["s"]
+            height, speed, battery = v["height"], v["speed"], v["battery"]
+            label_scale = BAR_LABEL_SCALE * s * ts
+            alt_val = "--" if height is None else str(int(height))
+            spd_val = "--" if speed is None else str(int(speed))
+            bat_val = "--%" if battery is None else f"{int(battery)}%"
+
+            alt_txt = f"ALT\n{alt_val}"
+            spd_txt = f"SPD\n{spd_val}"
+            bat_txt = f"BAT\n{bat_val}"
+
+            label_y1 = g["label_y"]
+
+            boxed_center_multiline(
+                canvas, alt_txt, bx1 + bar_w // 2, label_y1, label_scale, TEXT,
+                pad=int(BAR_LABEL_PAD * s), alpha=BAR_LABEL_ALPHA
+            )
+            boxed_center_multiline(
+                canvas, spd_txt, bx2 + bar_w // 2, label_y1, label_scale, TEXT,
+                pad=int(BAR_LABEL_PAD * s), alpha=BAR_LABEL_ALPHA
+            )
+            boxed_center_multiline(
+                canvas, bat_txt, bx3 + bar_w // 2, label_y1, label_scale, TEXT,
+                pad=int(BAR_LABEL_PAD * s), alpha=BAR_LABEL_ALPHA
+            )
 
-        boxed_center_multiline(
-            canvas, alt_txt, bx1 + bar_w // 2, label_y1, label_scale, TEXT,
-            pad=int(BAR_LABEL_PAD * s), alpha=BAR_LABEL_ALPHA
-        )
-        boxed_center_multiline(
-            canvas, spd_txt, bx2 + bar_w // 2, label_y1, label_scale, TEXT,
-            pad=int(BAR_LABEL_PAD * s), alpha=BAR_LABEL_ALPHA
-        )
-        boxed_center_multiline(
-            canvas, bat_txt, bx3 + bar_w // 2, label_y1, label_scale, TEXT,
-            pad=int(BAR_LABEL_PAD * s), alpha=BAR_LABEL_ALPHA
+    def _render_ui_panel(
+        self,
+        canvas,
+        *,
+        battery=None,
+        roll=None,
+        pitch=None,
+        yaw=None,
+        height=None,
+        total_alt=None,
+        agx=None, agy=None, agz=None,
+        speed=None,
+        pos_xy=None,
+        pos_range=3.0,
+        ui_bg=(0, 0, 0),
+        dirty_only=False,
+    ):
+        """
+        右パネルを描く。
+        dirty_only=True なら、前回この canvas に描いた時から表示値が変わった
+        ウィジェットだけを（背景を戻してから）描き直す。
+        """
+        h, w, _ = canvas.shape
+
+        base, g = self._panel_static(w, h, ui_bg, canvas.dtype)
+        keys, values = self._panel_values(
+            g, roll, pitch, yaw, agx, agy, agz, height, speed, battery, pos_xy, pos_range
         )
 
+        state = self._panel_state
+        full = (not dirty_only) or state is None or state[0] is not base or state[1] is not canvas.base
+        if full:
+            np.copyto(canvas, base)
+            dirty = set(self._PANEL_ORDER)
+        else:
+            prev = state[2]
+            dirty = {name for name in self._PANEL_ORDER if prev.get(name) != keys[name]}
+            # 重なっている相手も描き直す（背景を戻すと消えるので）
+            stack = list(dirty)
+            while stack:
+                for other in g["overlaps"][stack.pop()]:
+                    if other not in dirty:
+                        dirty.add(other)
+                        stack.append(other)
+            for name in dirty:
+                x0, y0, x1, y1 = g["rects"][name]
+                np.copyto(canvas[y0:y1, x0:x1], base[y0:y1, x0:x1])
+
+        for name in self._PANEL_ORDER:
+            if name in dirty:
+                self._draw_panel_widget(canvas, g, name, values)
+
+        self._panel_state = (base, canvas.base if dirty_only else None, keys)
+        self.widgets_redrawn = len(dirty)
+        self.widgets_total = len(self._PANEL_ORDER)
         return canvas
 
+    def _output_canvas(self, h, w, dtype):
+        out = self._out
+        if out is None or out.shape[0] != h or out.shape[1] != w or out.dtype != dtype:
+            out = self._out = np.empty((h, w, 3), dtype=dtype)
+            self._panel_state = None
+        return out
+
+    @profiling.profiled("ui.draw")
     def draw(
         self,
         frame,
@@ -379,6 +643,7 @@ class DroneUI:
         layout="side",
         ui_bg=(245, 245, 245),
         ui_width=None,
+        out=None,
         **kwargs
     ):
         h, w, _ = frame.shape
@@ -396,7 +661,14 @@ class DroneUI:
         )
             return canvas
 
-        left = frame.copy()
+        # 出力は使い回しのキャンバス（out を渡されたらそれ）。映像はその左側へ直接コピーする
+        ui_w = w if ui_width is None else int(ui_width)
+        if out is None or out.shape[0] != h or out.shape[1] != w + ui_w or out.dtype != frame.dtype:
+            out = self._output_canvas(h, w + ui_w, frame.dtype)
+        left = out[:, :w]
+        # compose_side が既に左側へ resize 済みならコピー不要
+        if not (np.shares_memory(frame, left) and frame.strides == left.strides):
+            np.copyto(left, frame)
         self._render_hud_left(
             left,
             aruno=aruno,
@@ -412,13 +684,13 @@ class DroneUI:
             approach_yaw=kwargs.get("approach_yaw"),
             approach_err_x=kwargs.get("approach_err_x"),
             approach_size_px=kwargs.get("approach_size_px"),
+            latency_text=kwargs.get("latency_text"),
         )
 
-        ui_w = w if ui_width is None else int(ui_width)
-        panel = np.full((h, ui_w, 3), ui_bg, dtype=frame.dtype)
-
         self._render_ui_panel(
-            panel,
+            out[:, w:],
+            ui_bg=ui_bg,
+            dirty_only=True,
             battery=battery,
             roll=roll,
             pitch=pitch,
@@ -431,4 +703,5 @@ class DroneUI:
             pos_range=pos_range,
         )
 
-        return np.hstack([left, panel])
+        # 次フレームで書き換えられるので、保持するなら呼び出し側でコピーすること
+        return out
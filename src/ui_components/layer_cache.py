@@ -0,0 +1,54 @@
+# ui_components/layer_cache.py
+import numpy as np
+
+
+class AffineLayer:
+    """
+    映像の上に重ねる「変わらない」描画（半透明の箱・AA文字・AA線）を事前計算したもの。
+
+    これらの描画は背景 B に対して画素ごとに out = B * k + c と書ける。
+    黒(0)と白(255)の2枚に1回ずつ描けば k, c が求まるので、
+    以後は毎フレーム putText / addWeighted をやり直さずに掛け算と足し算だけで済む。
+    """
+
+    __slots__ = ("x0", "y0", "x1", "y1", "k", "c", "_tmp")
+
+    def __init__(self, x0, y0, x1, y1, k, c):
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.k = k
+        self.c = c
+        self._tmp = np.empty_like(k)
+
+    @classmethod
+    def render(cls, img_w, img_h, rect, draw):
+        """
+        rect=(x0, y0, x1, y1) の範囲だけを描いて層を作る。
+        draw(canvas, ox, oy) は「全体座標 - (ox, oy)」で canvas に描く関数。
+        rect は描画がはみ出さない大きさにしておくこと。
+        """
+        x0 = max(0, int(rect[0]))
+        y0 = max(0, int(rect[1]))
+        x1 = min(int(img_w), int(rect[2]))
+        y1 = min(int(img_h), int(rect[3]))
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        lo = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+        hi = np.full((y1 - y0, x1 - x0, 3), 255, dtype=np.uint8)
+        draw(lo, x0, y0)
+        draw(hi, x0, y0)
+
+        c = lo.astype(np.float32)
+        k = (hi.astype(np.float32) - c) / 255.0
+        c += 0.5  # apply() の切り捨てを四捨五入にする
+        return cls(x0, y0, x1, y1, k, c)
+
+    def apply(self, img):
+        roi = img[self.y0:self.y1, self.x0:self.x1]
+        if roi.shape != self.k.shape:
+            return
+        tmp = self._tmp
+        np.multiply(roi, self.k, out=tmp)
+        tmp += self.c
+        np.clip(tmp, 0, 255, out=tmp)
+        np.copyto(roi, tmp, casting="unsafe")
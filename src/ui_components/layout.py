@@ -12,11 +12,15 @@ def compose_side(
     ui_w: int = 260,
     ui_bg=(0, 0, 0),
     interpolation=cv2.INTER_LINEAR,
+    out=None,
     **telemetry,
 ):
     """
     ウィンドウ全体(display_w x display_h)に対して、
     左：映像、右：UI固定幅(ui_w) で合体した画像を返す。
+
+    out（display_h x display_w の BGR バッファ）を渡すと、映像はその左側へ
+    直接 resize され、UI も右側へ直接描かれる（新しい画像を作らない）。
     """
     if display_w <= 0 or display_h <= 0:
         raise ValueError("display_w/display_h must be positive")
@@ -27,6 +31,24 @@ def compose_side(
 
     left_w = display_w - ui_w
 
+    if out is not None and out.shape[0] == display_h and out.shape[1] == display_w:
+        left = out[:, :left_w]
+        if frame is None:
+            left[:] = 0
+        elif frame.shape[0] != display_h or frame.shape[1] != left_w:
+            cv2.resize(frame, (left_w, display_h), dst=left, interpolation=interpolation)
+        else:
+            np.copyto(left, frame)
+
+        return ui.draw(
+            left,
+            layout="side",
+            ui_width=ui_w,
+            ui_bg=ui_bg,
+            out=out,
+            **telemetry,
+        )
+
     if frame is None:
         frame = np.zeros((display_h, left_w, 3), dtype=np.uint8)
     else:
@@ -22,9 +22,10 @@ def blend_rect(img, x1, y1, x2, y2, alpha=0.32):
     if x2 <= x1 or y2 <= y1:
         return
     roi = img[y1:y2, x1:x2]
-    overlay = roi.copy()
-    overlay[:] = PANEL
-    cv2.addWeighted(overlay, alpha, roi, 1 - alpha, 0, roi)
+    # roi * (1 - alpha) + PANEL * alpha をその場で（一時配列なし）
+    cv2.addWeighted(roi, 1 - alpha, roi, 0, 0, roi)
+    if any(PANEL):
+        cv2.add(roi, tuple(float(c) * alpha for c in PANEL) + (0.0,), roi)
 
 
 def put_outline(img, text, org, scale, color, thickness=1, outline=2):
@@ -78,14 +79,26 @@ def boxed_center_multiline(
         put_outline(img, line, (x, yy), scale, color, thickness, outline)
 
 
-def neon_gauge(img, center, r, value, vmin, vmax, label_text, show_value=True, text_scale=1.0):
+_GAUGE_START_DEG = 210
+_GAUGE_END_DEG = -30
+
+
+def _gauge_label_pos(center, r, label_text, text_scale):
     cx, cy = center
+    label_scale = 0.44 * text_scale
+    (tw, th), _ = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, label_scale, 1)
+    lx = int(cx - tw // 2)
+    ly = int(cy + r + th + 3)
+    return lx, ly, tw, th, label_scale
 
-    arc_thick = 1
-    needle_thick = 1
 
-    start_deg = 210
-    end_deg = -30
+def neon_gauge_static(img, center, r, label_text, text_scale=1.0):
+    """メーターの変わらない部分（円弧・目盛り・ラベル）"""
+    cx, cy = center
+
+    arc_thick = 1
+    start_deg = _GAUGE_START_DEG
+    end_deg = _GAUGE_END_DEG
 
     # arc
     cv2.ellipse(img, (cx, cy), (r, r), 0, start_deg, end_deg, (110, 110, 60), arc_thick + 1, cv2.LINE_AA)
@@ -100,6 +113,20 @@ def neon_gauge(img, center, r, value, vmin, vmax, label_text, show_value=True, t
         y2 = int(cy - (r * 0.86) * np.sin(ang))
         cv2.line(img, (x1, y1), (x2, y2), TICK, 1, cv2.LINE_AA)
 
+    # label
+    lx, ly, tw, th, label_scale = _gauge_label_pos(center, r, label_text, text_scale)
+    blend_rect(img, lx - 4, ly - th - 4, lx + tw + 4, ly + 4, alpha=0.16)
+    put_outline(img, label_text, (lx, ly), label_scale, CYAN, thickness=1, outline=2)
+
+
+def neon_gauge_dynamic(img, center, r, value, vmin, vmax, label_text, show_value=True, text_scale=1.0):
+    """メーターの値で変わる部分（針・中心点・数値）"""
+    cx, cy = center
+
+    needle_thick = 1
+    start_deg = _GAUGE_START_DEG
+    end_deg = _GAUGE_END_DEG
+
     # needle
     if value is not None:
         try:
@@ -116,16 +143,9 @@ def neon_gauge(img, center, r, value, vmin, vmax, label_text, show_value=True, t
 
     cv2.circle(img, (cx, cy), 2, PURPLE, -1, cv2.LINE_AA)
 
-    # label
-    label_scale = 0.44 * text_scale
-    (tw, th), _ = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, label_scale, 1)
-    lx = int(cx - tw // 2)
-    ly = int(cy + r + th + 3)
-    blend_rect(img, lx - 4, ly - th - 4, lx + tw + 4, ly + 4, alpha=0.16)
-    put_outline(img, label_text, (lx, ly), label_scale, CYAN, thickness=1, outline=2)
-
     # value
     if show_value:
+        _, ly, _, _, _ = _gauge_label_pos(center, r, label_text, text_scale)
         val_scale = 0.40 * text_scale
         if value is None:
             vtxt = "--"
@@ -141,11 +161,18 @@ def neon_gauge(img, center, r, value, vmin, vmax, label_text, show_value=True, t
         put_outline(img, vtxt, (vx, vy), val_scale, TEXT, thickness=1, outline=2)
 
 
-def bar(img, x, y, w, h, ratio):
+def neon_gauge(img, center, r, value, vmin, vmax, label_text, show_value=True, text_scale=1.0):
+    neon_gauge_static(img, center, r, label_text, text_scale=text_scale)
+    neon_gauge_dynamic(img, center, r, value, vmin, vmax, label_text, show_value=show_value, text_scale=text_scale)
+
+
+def bar_static(img, x, y, w, h):
     # ベースと枠をグレーで塗り、充填部分もグレー系に寄せる
     cv2.rectangle(img, (x, y), (x + w, y + h), BAR_BASE, -1)
     cv2.rectangle(img, (x, y), (x + w, y + h), BAR_BORDER, 1)
 
+
+def bar_fill(img, x, y, w, h, ratio):
     if ratio is None:
         return
     r = float(ratio)
@@ -155,7 +182,26 @@ def bar(img, x, y, w, h, ratio):
         cv2.rectangle(img, (x, y + (h - fh)), (x + w, y + h), BAR_FILL, -1)
 
 
-def draw_position_map(
+def bar(img, x, y, w, h, ratio):
+    bar_static(img, x, y, w, h)
+    bar_fill(img, x, y, w, h, ratio)
+
+
+def position_map_static(img, x, y, w, h, *, alpha=0.16):
+    """位置インジケーターの枠とガイドライン"""
+    blend_rect(img, x, y, x + w, y + h, alpha=alpha)
+    cv2.rectangle(img, (x, y), (x + w, y + h), BAR_BORDER, 1, cv2.LINE_AA)
+
+    cx = x + w // 2
+    top = y + 8
+    bot = y + h - 8
+
+    # ガイドライン（縦線とスタートライン）
+    cv2.line(img, (cx, top), (cx, bot), TICK, 1, cv2.LINE_AA)
+    cv2.line(img, (x + 6, top), (x + w - 6, top), TICK, 1, cv2.LINE_AA)
+
+
+def position_map_dynamic(
     img,
     x,
     y,
@@ -165,21 +211,11 @@ def draw_position_map(
     *,
     max_range=3.0,
     yaw_deg=None,
-    alpha=0.16,
     label=None,
 ):
-    """シンプルな位置インジケーター。Xは左右、Yは上から下方向に進む。"""
-    blend_rect(img, x, y, x + w, y + h, alpha=alpha)
-    cv2.rectangle(img, (x, y), (x + w, y + h), BAR_BORDER, 1, cv2.LINE_AA)
-
+    """位置インジケーターの点・向き・ラベル"""
     cx = x + w // 2
     top = y + 8
-    bot = y + h - 8
-
-    # ガイドライン（縦線とスタートライン）
-    cv2.line(img, (cx, top), (cx, bot), TICK, 1, cv2.LINE_AA)
-    cv2.line(img, (x + 6, top), (x + w - 6, top), TICK, 1, cv2.LINE_AA)
-
     # 位置をスケールしてプロット（Yは上が初期位置）
     px, py = pos_xy if pos_xy is not None else (0.0, 0.0)
     try:
@@ -234,3 +270,21 @@ def draw_position_map(
 
     if label:
         put_outline(img, label, (x + 6, y + h - 6), 0.42, TEXT, thickness=1, outline=2)
+
+
+def draw_position_map(
+    img,
+    x,
+    y,
+    w,
+    h,
+    pos_xy,
+    *,
+    max_range=3.0,
+    yaw_deg=None,
+    alpha=0.16,
+    label=None,
+):
+    """シンプルな位置インジケーター。Xは左右、Yは上から下方向に進む。"""
+    position_map_static(img, x, y, w, h, alpha=alpha)
+    position_map_dynamic(img, x, y, w, h, pos_xy, max_range=max_range, yaw_deg=yaw_deg, label=label)
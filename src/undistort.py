@@ -0,0 +1,54 @@
+# undistort.py
+import cv2
+import numpy as np
+
+from marker_pose import load_intrinsics, scale_intrinsics
+
+
+class Undistorter:
+    """
+    歪み補正マップを事前計算しておき、毎フレームは remap 1回だけで補正する
+    （cv2.undistort はフレームごとにマップを作り直すので重い）。
+
+    補正後の画像のカメラ行列は new_K、歪みは 0。
+    補正済みフレームで姿勢推定するなら MarkerPoseEstimator(new_K, zeros) を使う。
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, image_size, alpha=0.0):
+        self.K = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist = np.asarray(dist_coeffs, dtype=np.float64).reshape(1, -1)
+        self.image_size = tuple(int(v) for v in image_size)
+        self.alpha = alpha
+        self._maps = {}   # (w, h) -> (map1, map2, new_K)
+        self.new_K = self._maps_for(*self.image_size)[2]
+
+    @classmethod
+    def from_file(cls, path, frame_size=None, alpha=0.0):
+        K, dist, size = load_intrinsics(path)
+        if size is None:
+            if frame_size is None:
+                raise ValueError(f"image_size not found in {path}")
+            size = frame_size
+        und = cls(K, dist, size, alpha=alpha)
+        if frame_size is not None and tuple(frame_size) != tuple(size):
+            und.new_K = und._maps_for(*frame_size)[2]
+        return und
+
+    def _maps_for(self, w, h):
+        m = self._maps.get((w, h))
+        if m is None:
+            K = self.K if (w, h) == self.image_size else scale_intrinsics(self.K, self.image_size, (w, h))
+            new_K, _ = cv2.getOptimalNewCameraMatrix(K, self.dist, (w, h), self.alpha, (w, h))
+            # CV_16SC2 の固定小数点マップが remap で一番速い
+            map1, map2 = cv2.initUndistortRectifyMap(K, self.dist, None, new_K, (w, h), cv2.CV_16SC2)
+            m = self._maps[(w, h)] = (map1, map2, new_K)
+        return m
+
+    def apply(self, src, dst=None):
+        """src を補正する。dst（同じ大きさ）を渡すとそこへ直接書く"""
+        h, w = src.shape[:2]
+        map1, map2, _ = self._maps_for(w, h)
+        if dst is None:
+            return cv2.remap(src, map1, map2, cv2.INTER_LINEAR)
+        cv2.remap(src, map1, map2, cv2.INTER_LINEAR, dst=dst)
+        return dst
@@ -0,0 +1,229 @@
+# vision_worker.py
+import math
+import threading
+import time
+from collections import deque
+
+import event_log as events
+
+
+class LatestSlot:
+    """
+    1枠だけのメールボックス（latest wins）。
+    書き手は上書きするだけ、読み手はロック無しで (seq, value) を読む。
+    タプルの代入は1命令なので、読んだ seq と value が食い違うことはない。
+    """
+
+    def __init__(self):
+        self._item = (0, None)
+
+    def put(self, value):
+        seq = self._item[0] + 1
+        self._item = (seq, value)
+        return seq
+
+    def get(self):
+        return self._item
+
+
+class StageTimes:
+    """
+    ステージ別の処理時間（ms）を直近 window 件だけ保持して集計する。
+    report() で "detect=3.1/7.9ms" のような1行を返す（平均/最大）。
+    """
+
+    def __init__(self, window=120):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, name, ms):
+        with self._lock:
+            d = self._stages.get(name)
+            if d is None:
+                d = self._stages[name] = deque(maxlen=self.window)
+            d.append(float(ms))
+
+    def summary(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._stages.items()]
+        out = {}
+        for name, vals in items:
+            if not vals:
+                continue
+            out[name] = (sum(vals) / len(vals), max(vals))
+        return out
+
+    def percentiles(self, qs=(50, 95, 99)):
+        """{stage: (p50, p95, p99, 件数)}（最近傍順位法）"""
+        with self._lock:
+            items = [(k, sorted(v)) for k, v in self._stages.items()]
+        out = {}
+        for name, vals in items:
+            n = len(vals)
+            if n == 0:
+                continue
+            ps = tuple(vals[min(n - 1, max(0, math.ceil(q / 100.0 * n) - 1))] for q in qs)
+            out[name] = ps + (n,)
+        return out
+
+    def report(self):
+        parts = [f"{k}={m:.1f}/{mx:.1f}ms" for k, (m, mx) in self.summary().items()]
+        return "  ".join(parts)
+
+
+class VisionWorker(threading.Thread):
+    """
+    検出専用スレッド。
+    get_frame() の最新フレームを取り、ArUcoDetector で検出して
+    結果を LatestSlot に置く。制御/UIループは latest() を読むだけでブロックしない。
+    pool（ArUcoPool）を渡すと検出はワーカープロセスに投げ、このスレッドは投入と回収だけ行う。
+    ring のスロットはコピーせずに検出するので、検出（pool なら共有メモリへのコピー）が終わった時点で
+    スロットが上書きされていたら（検出がリング1周より遅い）結果は捨てて overrun に数える。
+    """
+
+    def __init__(self, get_frame, detector, *, target_id_fn=None, ready_fn=None, stats=None, idle_sleep=0.005,
+                 pool=None, ring=None):
+        super().__init__(daemon=True)
+        self.get_frame = get_frame
+        self.detector = detector
+        self.target_id_fn = target_id_fn
+        self.ready_fn = ready_fn
+        self.stats = stats if stats is not None else StageTimes()
+        self.idle_sleep = idle_sleep
+        self.pool = pool
+        self.ring = ring
+        self._last_seq = 0
+        self._last_decode_t = 0.0   # 直近に取ったフレームがリングに入った時刻
+        self._pool_frames = {}      # pool の seq → (frame_seq, decode 時刻)
+
+        self.slot = LatestSlot()
+        self.errors = 0
+        self.overrun = 0            # 検出中にリングのスロットが上書きされて捨てた結果
+        self._stop_evt = threading.Event()
+        self._last_src = None
+
+    def stop(self, timeout=1.0):
+        # 検出中（OpenCV 内）のまま終了するとインタプリタ終了時に落ちるので待つ
+        self._stop_evt.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    def latest(self):
+        """最新の検出結果（dict）か None。"""
+        return self.slot.get()[1]
+
+    @property
+    def last_seq(self):
+        """最後に取ったリングの seq（ring 無しなら 0）"""
+        return self._last_seq
+
+    def _grab(self):
+        if self.ring is not None:
+            # リングがあれば seq で新旧を判定（最新だけ取る＝latest wins）
+            if self.ring.head <= self._last_seq:
+                self.ring.wait_newer(self._last_seq, self.idle_sleep)
+            seq, frame = self.ring.latest()
+            if frame is None or seq == self._last_seq:
+                return None
+            self._last_seq = seq
+            self._last_decode_t = self.ring.stamp(seq)
+            return frame
+
+        if self.ready_fn is not None and not self.ready_fn():
+            return None
+        frame = self.get_frame()
+        if frame is None or frame.size == 0:
+            return None
+        # 同じデコード結果を二度検出しない（get_frame はビューを返すので base で比較）
+        src = frame.base if frame.base is not None else frame
+        if src is self._last_src:
+            return None
+        self._last_src = src
+        self._last_decode_t = time.perf_counter()
+        return frame
+
+    def _frame_valid(self, seq):
+        return self.ring is None or self.ring.is_valid(seq)
+
+    def _publish_pool_results(self):
+        results = self.pool.poll()
+        # poll() は seq 順なので最後が最新。_pool_frames に無いものはコピー中に上書きされたフレーム
+        results = [r for r in results if r["seq"] in self._pool_frames]
+        if not results:
+            return False
+        res = results[-1]
+        frame_seq, t_decode = self._pool_frames.get(res["seq"], (0, res["t_frame"]))
+        for seq in [s for s in self._pool_frames if s <= res["seq"]]:
+            del self._pool_frames[seq]
+        res["frame_seq"] = frame_seq
+        res["stamps"] = {"decode": t_decode, "det_start": res["t_start"], "det_end": res["t_done"]}
+        target_id = self.target_id_fn() if self.target_id_fn is not None else None
+        res["marker_info"] = self.pool.get_marker_info(res["ids"], res["corners"], target_id=target_id)
+        res["shape"] = res.pop("frame_shape")
+        res["roi"] = None
+        if res["marker_info"] is not None:
+            res["marker_info"]["stamps"] = res["stamps"]
+        self.stats.add("detect", (res["t_done"] - res["t_start"]) * 1000.0)
+        self.stats.add("pool_wait", (res["t_start"] - res["t_frame"]) * 1000.0)
+        self.slot.put(res)
+        return True
+
+    def _run_pool(self):
+        while not self._stop_evt.is_set():
+            frame = self._grab()
+            if frame is not None:
+                seq = self.pool.submit(frame)
+                if seq is not None:
+                    if self._frame_valid(self._last_seq):
+                        self._pool_frames[seq] = (self._last_seq, self._last_decode_t)
+                    else:
+                        self.overrun += 1
+            if not self._publish_pool_results() and frame is None and self.ring is None:
+                time.sleep(self.idle_sleep)
+        self.pool.close()
+
+    def run(self):
+        if self.pool is not None:
+            self._run_pool()
+            return
+        while not self._stop_evt.is_set():
+            frame = self._grab()
+            if frame is None:
+                if self.ring is None:
+                    time.sleep(self.idle_sleep)
+                continue
+
+            seq = self._last_seq
+            t0 = time.perf_counter()
+            try:
+                target_id = self.target_id_fn() if self.target_id_fn is not None else None
+                self.detector.track_id = target_id
+                _, ids, corners = self.detector.process(frame, draw=False)
+                if not self._frame_valid(seq):
+                    self.overrun += 1
+                    continue
+                marker_info = self.detector.get_marker_info(ids, corners, target_id=target_id)
+            except Exception as e:
+                self.errors += 1
+                events.warn("detect_failed", "vision worker detect failed", error=str(e), errors=self.errors)
+                continue
+            t1 = time.perf_counter()
+
+            self.stats.add("detect", (t1 - t0) * 1000.0)
+            # 遅延計測用の時刻（latency.py）。marker_info に載せて制御まで運ぶ
+            stamps = {"decode": self._last_decode_t, "det_start": t0, "det_end": t1}
+            if marker_info is not None:
+                marker_info["stamps"] = stamps
+            self.slot.put({
+                "ids": ids,
+                "corners": corners,
+                "marker_info": marker_info,
+                "shape": frame.shape,
+                "frame_seq": seq,
+                "stage": getattr(self.detector, "last_stage", None),
+                "roi": getattr(self.detector, "last_roi", None),
+                "t_frame": t0,
+                "t_done": t1,
+                "stamps": stamps,
+            })
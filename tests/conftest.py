@@ -0,0 +1,88 @@
+# conftest.py
+import time
+
+import numpy as np
+import pytest
+
+from aruco_detector import ArUcoDetector
+from flight_log import FlightRecorder
+from marker_track import MarkerTracker
+from pipeline import FlightPipeline
+from sim_tello import FakeTello, MarkerPose, NullKeyboard, SyntheticArUcoSource
+from tello_controller import TelloController
+
+FLIGHT_FRAMES = 24
+
+
+def _script(i):
+    # 左から右へ流れつつ近づく（lr / yaw / fb が毎フレーム変わる）
+    return [MarkerPose(0, 0.25 + 0.02 * i, 0.5, 0.15 + 0.005 * i, yaw=10.0 - i)]
+
+
+def record_flight(path, tracker=False):
+    """合成フレームで ID 0 へのセミオートを FlightPipeline で回し .tlog に記録する（直列検出・RCスケジューラなし）"""
+    src = SyntheticArUcoSource(960, 720, n_frames=FLIGHT_FRAMES, script=_script)
+    fake = FakeTello(src, fps=0)
+    controller = TelloController(NullKeyboard(), tello=fake)
+    controller.in_flight = True
+    controller.approach_enabled = True
+    controller.target_aruco_id = 0
+
+    rec = FlightRecorder(str(path), jpeg_quality=None, frame_fps=None).start()
+    controller.recorder = rec
+    pipe = FlightPipeline(controller, ArUcoDetector(), vision=False, recorder=rec,
+                          tracker=MarkerTracker() if tracker else None)
+    rec.attach_ring(controller.frame_ring)
+    try:
+        for i in range(FLIGHT_FRAMES):
+            fake.step()
+            frame = np.ascontiguousarray(src.frame(i)[:, :, ::-1])
+            det = pipe.detect_step(frame)
+            assert det["marker_info"] is not None
+            pipe.control_step()
+    finally:
+        rec.stop()
+    return fake
+
+
+def record_live_flight(path, seconds=1.5):
+    """
+    main.py の既定と同じ構成（VisionWorker + MarkerTracker + 30Hz の RCスケジューラ）で
+    30fps の FakeTello を追わせて .tlog に記録する
+    """
+    src = SyntheticArUcoSource(960, 720, n_frames=FLIGHT_FRAMES, script=_script)
+    fake = FakeTello(src, fps=30)
+    controller = TelloController(NullKeyboard(), tello=fake)
+    rec = FlightRecorder(str(path), frame_fps=15.0).start()
+    controller.recorder = rec
+    controller.connect_and_start_stream()
+    rec.attach_ring(controller.frame_ring)
+    controller.in_flight = True
+    controller.approach_enabled = True
+    controller.target_aruco_id = 0
+
+    pipe = FlightPipeline(controller, ArUcoDetector(), vision=True, tracker=MarkerTracker(), recorder=rec)
+    pipe.start(rc_rate_hz=30)
+    try:
+        # UI ループ（検出結果を読んで描くだけ。制御は RC スレッド）
+        ring = controller.frame_ring
+        t_end = time.perf_counter() + seconds
+        seq = 0
+        while time.perf_counter() < t_end:
+            ring.wait_newer(seq, 0.1)
+            seq, view = ring.latest()
+            if view is not None:
+                pipe.detect_step(view.copy())
+    finally:
+        controller.stop_rc_scheduler()
+        pipe.stop()
+        controller.cleanup()
+        rec.stop()
+    return controller
+
+
+@pytest.fixture(scope="session")
+def flight_log(tmp_path_factory):
+    path = tmp_path_factory.mktemp("tlog") / "flight.tlog"
+    record_flight(path)
+    return str(path)
@@ -0,0 +1,90 @@
+# test_aruco_pool.py
+import time
+
+import numpy as np
+import pytest
+
+from aruco_pool import ArUcoPool
+from sim_tello import MarkerPose, SyntheticArUcoSource
+
+W, H = 960, 720
+
+
+@pytest.fixture(scope="module")
+def big_marker():
+    """近い（大きい）マーカー1枚。pyramid は 0.25 から探せば足りる"""
+    src = SyntheticArUcoSource(W, H, n_frames=1, script=lambda i: [MarkerPose(0, 0.5, 0.5, 0.5)])
+    return np.ascontiguousarray(src.frame(0)[:, :, ::-1])
+
+
+def _detect_one(pool, frame):
+    assert pool.submit(frame, block=True, timeout=30.0) is not None
+    t_end = time.perf_counter() + 30.0
+    while time.perf_counter() < t_end:
+        out = pool.poll(timeout=0.5)
+        if out:
+            return out[-1]
+    raise AssertionError("no result from pool")
+
+
+def test_pyramid_starts_at_default_without_hint(big_marker):
+    pool = ArUcoPool(workers=1, max_age_ms=None)
+    try:
+        res = _detect_one(pool, big_marker)
+        assert res["stage"] == "pyr@0.50"
+        assert res["ids"].flatten().tolist() == [0]
+    finally:
+        pool.close()
+
+
+def test_workers_use_parent_size_hint(big_marker):
+    pool = ArUcoPool(workers=1, max_age_ms=None)
+    try:
+        # 親の get_marker_info が大きなマーカーを見た直後（ワーカーはまだ何も検出していない）
+        pool.local.last_size_px = 360.0
+        res = _detect_one(pool, big_marker)
+        assert res["stage"] == "pyr@0.25"
+        assert res["ids"].flatten().tolist() == [0]
+    finally:
+        pool.close()
+
+
+def test_detect_all_raises_when_workers_die(big_marker):
+    pool = ArUcoPool(workers=1, max_age_ms=None)
+    try:
+        for p in pool._procs:
+            p.terminate()
+            p.join(5.0)
+        t0 = time.perf_counter()
+        with pytest.raises(RuntimeError):
+            list(pool.detect_all([big_marker] * 4))
+        assert time.perf_counter() - t0 < 10.0
+    finally:
+        pool.close()
+
+
+def test_detect_all_after_earlier_oversize_frame(big_marker):
+    pool = ArUcoPool(workers=1, n_slots=2, max_age_ms=None)
+    try:
+        assert pool.submit(np.zeros((H + 8, W, 3), dtype=np.uint8)) is None
+        assert pool.oversize == 1
+        # 空きスロット待ちが時間切れになって submit が None を返しても（前の oversize で）ValueError にしない
+        wait_free = pool._wait_free
+        timeouts = [3]
+
+        def slow_wait(timeout):
+            if timeouts[0] > 0:
+                timeouts[0] -= 1
+                return
+            wait_free(timeout)
+
+        pool._wait_free = slow_wait
+        out = list(pool.detect_all([big_marker] * 6))
+        assert timeouts[0] == 0
+        assert len(out) == 6
+        assert all(r["ids"].flatten().tolist() == [0] for r in out)
+
+        with pytest.raises(ValueError):
+            list(pool.detect_all([big_marker, np.zeros((H + 8, W, 3), dtype=np.uint8)]))
+    finally:
+        pool.close()
@@ -0,0 +1,75 @@
+# test_aruco_track.py
+import numpy as np
+import pytest
+
+from aruco_detector import ArUcoDetector
+from sim_tello import MarkerPose, SyntheticArUcoSource
+
+W, H = 960, 720
+
+
+@pytest.fixture(scope="module")
+def two_markers():
+    """ID 0（左）と ID 7（右）が並んだ BGR フレーム"""
+    src = SyntheticArUcoSource(W, H, n_frames=1,
+                               script=lambda i: [MarkerPose(0, 0.3, 0.5, 0.2), MarkerPose(7, 0.75, 0.5, 0.2)])
+    return np.ascontiguousarray(src.frame(0)[:, :, ::-1])
+
+
+def _ids(ids):
+    return sorted(ids.flatten().tolist()) if ids is not None else []
+
+
+def _inside(roi, xy):
+    x0, y0, x1, y1 = roi
+    return x0 <= xy[0] < x1 and y0 <= xy[1] < y1
+
+
+def test_roi_follows_requested_target(two_markers):
+    det = ArUcoDetector()
+    det.track_id = 0
+    _, ids, _ = det.process(two_markers.copy(), draw=False)
+    assert _ids(ids) == [0, 7]
+    _, ids, _ = det.process(two_markers.copy(), draw=False)
+    assert det.roi_hits == 1 and 0 in _ids(ids)
+
+    # 追う ID を切り替えたらその場で全画面探索して 7 に ROI を合わせ直す
+    det.track_id = 7
+    full = det.full_searches
+    _, ids, corners = det.process(two_markers.copy(), draw=False)
+    assert det.full_searches == full + 1
+    assert 7 in _ids(ids)
+    info = det.get_marker_info(ids, corners, target_id=7)
+    assert info["id"] == 7
+
+    _, ids, corners = det.process(two_markers.copy(), draw=False)
+    assert det.last_roi is not None and _inside(det.last_roi, (0.75 * W, 0.5 * H))
+    assert det.get_marker_info(ids, corners, target_id=7)["id"] == 7
+
+
+def test_missing_target_is_not_replaced_by_first_marker(two_markers):
+    det = ArUcoDetector()
+    det.track_id = 3
+    for _ in range(3):
+        _, ids, corners = det.process(two_markers.copy(), draw=False)
+        assert _ids(ids) == [0, 7]
+        # 3 が見えないので ROI は張らず、毎回全画面で探す
+        assert det.last_roi is None
+        assert det.get_marker_info(ids, corners, target_id=3) is None
+    assert det.full_searches == 3 and det.roi_hits == 0
+
+
+def test_roi_hit_without_target_counts_as_miss(two_markers):
+    det = ArUcoDetector()
+    det.track_id = 7
+    det.process(two_markers.copy(), draw=False)
+    # 7 の ROI に別の ID（5）だけが写る
+    swapped = SyntheticArUcoSource(W, H, n_frames=1,
+                                   script=lambda i: [MarkerPose(0, 0.3, 0.5, 0.2), MarkerPose(5, 0.75, 0.5, 0.2)])
+    frame = np.ascontiguousarray(swapped.frame(0)[:, :, ::-1])
+    misses, full = det.roi_misses, det.full_searches
+    _, ids, corners = det.process(frame, draw=False)
+    assert det.roi_misses == misses + 1
+    assert det.full_searches == full + 1
+    assert _ids(ids) == [0, 5]
+    assert det.get_marker_info(ids, corners, target_id=7) is None
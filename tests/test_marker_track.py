@@ -0,0 +1,47 @@
+# test_marker_track.py
+import numpy as np
+
+from aruco_detector import ArUcoDetector, marker_geometry
+from marker_track import MarkerTracker
+from sim_tello import MarkerPose, SyntheticArUcoSource
+
+FPS = 30.0
+
+
+def _frame():
+    src = SyntheticArUcoSource(960, 720, n_frames=1,
+                               script=lambda i: [MarkerPose(0, 0.3, 0.5, 0.2), MarkerPose(7, 0.75, 0.5, 0.2)])
+    return np.ascontiguousarray(src.frame(0)[:, :, ::-1])
+
+
+def _run(full_every, n=40):
+    """ID 0 を ROI 追跡しながら検出結果を追跡表へ入れ、各フレームの visible_ids を返す"""
+    frame = _frame()
+    det = ArUcoDetector()
+    det.track_id = 0
+    det.track_full_every = full_every
+    tracker = MarkerTracker()
+    seen = []
+    for i in range(n):
+        t = i / FPS
+        _, ids, corners = det.process(frame, draw=False)
+        tracker.observe(marker_geometry(ids, corners), t)
+        seen.append(tracker.visible_ids(t))
+    return det, tracker, seen, t
+
+
+def test_both_ids_stay_visible_while_tracking():
+    det, tracker, seen, t = _run(full_every=10)
+    assert det.roi_hits > 0
+    assert all(v == [0, 7] for v in seen), seen
+
+    # "n" で ROI の外のマーカーへ切り替えられて、一周すると自動選択に戻る
+    assert tracker.cycle_target(0, t) == 7
+    assert tracker.cycle_target(7, t) is None
+
+
+def test_roi_only_loses_other_ids():
+    det, tracker, seen, t = _run(full_every=0)
+    assert seen[0] == [0, 7]
+    assert seen[-1] == [0]
+    assert tracker.cycle_target(0, t) is None
@@ -0,0 +1,43 @@
+# test_pipeline.py
+import numpy as np
+
+from aruco_detector import ArUcoDetector
+from pipeline import FlightPipeline
+from sim_tello import FakeTello, MarkerPose, NullKeyboard, SyntheticArUcoSource
+from tello_controller import TelloController
+
+
+def _controller():
+    src = SyntheticArUcoSource(640, 480, n_frames=1,
+                               script=lambda i: [MarkerPose(0, 0.3, 0.5, 0.25), MarkerPose(7, 0.7, 0.5, 0.25)])
+    fake = FakeTello(src, fps=0)
+    controller = TelloController(NullKeyboard(), tello=fake)
+    fake.step()
+    frame = np.ascontiguousarray(src.frame(0)[:, :, ::-1])
+    return controller, fake, frame
+
+
+def test_serial_step_detects_target_and_sends():
+    controller, fake, frame = _controller()
+    controller.in_flight = True
+    controller.approach_enabled = True
+    controller.target_aruco_id = 7
+    pipe = FlightPipeline(controller, ArUcoDetector(), vision=False)
+
+    det = pipe.detect_step(frame)
+    assert det["marker_info"] is not None and det["marker_info"]["id"] == 7
+    assert det["aruno"] is not None
+
+    # RCスケジューラの無い時は control_step が毎フレーム送る
+    seq, res = pipe.latest_marker()
+    assert seq == 1 and res["marker_info"]["id"] == 7
+    pipe.control_step()
+    assert fake.rc_count == 1
+
+
+def test_control_step_is_idle_on_ground():
+    controller, fake, frame = _controller()
+    pipe = FlightPipeline(controller, ArUcoDetector(), vision=False)
+    pipe.detect_step(frame)
+    pipe.control_step()
+    assert fake.rc_count == 0
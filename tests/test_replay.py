@@ -0,0 +1,80 @@
+# test_replay.py
+from conftest import FLIGHT_FRAMES as N, record_flight, record_live_flight
+from flight_log import REC_DETECT, REC_RC, FlightLogReader
+from replay import Replayer
+
+
+def test_record_then_replay_matches(tmp_path):
+    path = tmp_path / "flight.tlog"
+    fake = record_flight(path)
+    assert fake.rc_count > 0
+
+    with FlightLogReader(str(path)) as log:
+        assert log.count(REC_RC) == N
+        assert log.count(REC_DETECT) == N
+        r = Replayer(log, detections="recorded", target_id=0, tracker=None).run()
+
+    assert r["rc"] == N
+    assert r["mismatches"] == 0, r["first"]
+
+
+def test_replay_detects_gain_change(flight_log):
+    with FlightLogReader(flight_log) as log:
+        rp = Replayer(log, detections="recorded", target_id=0, tracker=None)
+        rp.controller.k_err_to_lr *= 1.5
+        r = rp.run()
+    assert r["mismatches"] > 0
+
+
+def test_record_then_replay_matches_main_config(tmp_path):
+    path = tmp_path / "live.tlog"
+    controller = record_live_flight(path)
+
+    with FlightLogReader(str(path)) as log:
+        n_rc = log.count(REC_RC)
+        assert n_rc >= 20 and log.count(REC_DETECT) > 10
+        r = Replayer(log, detections="recorded", target_id=0).run()   # 既定は main と同じく追跡表あり
+
+    assert r["rc"] == n_rc == controller.rc_sent + controller.rc_skipped
+    assert r["mismatches"] == 0, r["first"]
+
+
+def test_per_frame_control_uses_tracker(tmp_path):
+    # RCスケジューラ無し（control_step）でも追跡表の予測で制御する：既定の Replayer（追跡表あり）と一致
+    path = tmp_path / "tracked.tlog"
+    record_flight(path, tracker=True)
+    with FlightLogReader(str(path)) as log:
+        r = Replayer(log, detections="recorded", target_id=0).run()
+        r_ema = Replayer(log, detections="recorded", target_id=0, tracker=None).run()
+    assert r["rc"] == N
+    assert r["mismatches"] == 0, r["first"]
+    assert r_ema["mismatches"] > 0
+
+
+def test_live_replay_detects_on_pool(tmp_path):
+    from aruco_detector import ArUcoDetector
+    from aruco_pool import ArUcoPool
+    from flight_log import REC_FRAME
+
+    path = tmp_path / "live.tlog"
+    record_live_flight(path, seconds=1.0)
+
+    def seen_ids(pool):
+        ids_per_frame = []
+        rp = Replayer(log, detector=ArUcoDetector(track=False), target_id=0, pool=pool)
+        r = rp.run(on_frame=lambda t, frame, ids, corners, info: ids_per_frame.append(
+            [] if ids is None else sorted(ids.flatten().tolist())))
+        return r, ids_per_frame
+
+    with FlightLogReader(str(path)) as log:
+        n_frames = log.count(REC_FRAME)
+        assert n_frames > 5
+        r_serial, serial = seen_ids(None)
+        pool = ArUcoPool(workers=2, max_age_ms=None)
+        try:
+            r_pool, pooled = seen_ids(pool)
+        finally:
+            pool.close()
+
+    assert r_pool["frames"] == r_serial["frames"] == n_frames
+    assert pooled == serial
@@ -0,0 +1,130 @@
+# test_stream_reader.py
+import sys
+import time
+import types
+
+import numpy as np
+import pytest
+
+import stream_reader
+from frame_ring import FrameRing
+from sim_tello import FakeTello, NullKeyboard
+from stream_reader import H264StreamReader
+from tello_controller import TelloController
+
+
+class _Packet:
+    size = 100
+    is_corrupt = False
+
+    def __init__(self, key=False):
+        self.is_keyframe = key
+
+
+class _Frame:
+    width = 8
+    height = 8
+
+    def to_ndarray(self, format=None):
+        return np.zeros((8, 8, 3), dtype=np.uint8)
+
+
+class _Codec:
+    """decode() の時点の skip_frame を残す。NONKEY の間はキーフレーム以外を出さない"""
+
+    def __init__(self):
+        self.skip_frame = "DEFAULT"
+        self.modes = []
+
+    def decode(self, packet):
+        self.modes.append(self.skip_frame)
+        if self.skip_frame == "NONKEY" and not packet.is_keyframe:
+            return []
+        return [_Frame()]
+
+
+class _Container:
+    def __init__(self, plan):
+        self.plan = plan     # [(待ち秒, packet)]
+
+    def demux(self, stream):
+        for wait, packet in self.plan:
+            if wait:
+                time.sleep(wait)
+            yield packet
+
+    def close(self):
+        pass
+
+
+def _reader(monkeypatch, plan, **kw):
+    monkeypatch.setitem(sys.modules, "av", types.SimpleNamespace(
+        error=types.SimpleNamespace(InvalidDataError=ValueError)))
+    cc = _Codec()
+    stream = types.SimpleNamespace(codec_context=cc)
+    reader = H264StreamReader(FrameRing(n_slots=4), **kw)
+    monkeypatch.setattr(reader, "_open", lambda: (_Container(plan), stream))
+    return reader, cc
+
+
+def _transitions(modes):
+    out = []
+    for m in modes:
+        if not out or out[-1] != m:
+            out.append(m)
+    return out
+
+
+SLOW = 0.005   # backlog_wait_ms（1ms）より長く待ってから届く＝溜まっていない
+
+
+def test_backlog_skips_nonref_then_resyncs_at_keyframe(monkeypatch):
+    plan = ([(SLOW, _Packet())] * 5            # 追いついている
+            + [(0, _Packet())] * 20            # 溜まり続ける → NONREF → 15回で NONKEY
+            + [(0, _Packet(key=True))]         # キーフレームで戻る（まだ溜まっているので NONREF）
+            + [(SLOW, _Packet())] * 3)         # 追いついた
+    reader, cc = _reader(monkeypatch, plan, backlog_packets=3, resync_packets=15)
+    reader._read_stream()
+
+    assert _transitions(cc.modes) == ["DEFAULT", "NONREF", "NONKEY", "NONREF", "DEFAULT"]
+    assert reader.resyncs == 1
+    assert reader.skipped == cc.modes.count("NONKEY")
+    assert reader.decoded == len(plan) - reader.skipped
+
+
+def test_slow_consumer_only_skips_nonref(monkeypatch):
+    plan = [(SLOW, _Packet())] * 10
+    reader, cc = _reader(monkeypatch, plan, consumer_seq=lambda: 1, max_lag=2)
+    reader._read_stream()
+
+    assert _transitions(cc.modes) == ["DEFAULT", "NONREF"]
+    assert reader.resyncs == 0
+
+
+def test_missing_pyav_stops_instead_of_retrying(monkeypatch):
+    reader = H264StreamReader(FrameRing(n_slots=4))
+
+    def fail():
+        raise ImportError("No module named 'av'")
+
+    monkeypatch.setattr(reader, "_read_stream", fail)
+    reader._run()   # 開き直しのループに入らずに返る
+    assert reader.failed and reader.errors == 0
+
+    monkeypatch.setattr(stream_reader.importlib.util, "find_spec", lambda name: None)
+    with pytest.raises(ImportError):
+        reader.start()
+    assert not reader.running
+
+
+def test_controller_falls_back_to_djitellopy_without_pyav(monkeypatch):
+    monkeypatch.setattr(stream_reader.importlib.util, "find_spec", lambda name: None)
+    fake = FakeTello(None, fps=0)
+    controller = TelloController(NullKeyboard(), tello=fake)
+    controller.video_reader = H264StreamReader(controller.frame_ring)
+    controller.connect_and_start_stream()
+    try:
+        assert controller.video_reader is None
+        assert controller.frame_read is fake.frame_read
+    finally:
+        controller.cleanup()
@@ -0,0 +1,25 @@
+# test_sweep.py
+import sweep
+
+
+def test_smooth_is_not_swept_with_tracker():
+    assert "smooth" not in sweep.parse_ranges(None, tracker=True)
+    assert "smooth" in sweep.parse_ranges(None, tracker=False)
+    # 明示すれば範囲には入る（main() が警告して外す）
+    assert "smooth" in sweep.parse_ranges(["smooth=0.1:0.5"], tracker=True)
+
+
+def test_evaluate_uses_tracker_by_default(flight_log):
+    a = sweep.evaluate(flight_log, {"smooth": 0.0}, cache_dir=None)
+    b = sweep.evaluate(flight_log, {"smooth": 0.6}, cache_dir=None)
+    assert a == b   # 追跡表の確からしさで弱めるので EMA は効かない
+
+    a = sweep.evaluate(flight_log, {"smooth": 0.0}, cache_dir=None, tracker=False)
+    b = sweep.evaluate(flight_log, {"smooth": 0.6}, cache_dir=None, tracker=False)
+    assert a["ticks"] == b["ticks"] and a != b
+
+
+def test_cache_is_split_by_tracker(tmp_path, flight_log):
+    on = sweep._cache_path(str(tmp_path), flight_log, {}, tracker=True)
+    off = sweep._cache_path(str(tmp_path), flight_log, {}, tracker=False)
+    assert on != off
@@ -0,0 +1,68 @@
+# test_telemetry.py
+import sys
+import time
+import types
+
+from telemetry import TelemetryCache, djitellopy_state_hook
+
+
+def _fake_djitellopy(monkeypatch, host):
+    """djitellopy.tello と同じ形の drones 表（受信スレッドは drones[host]["state"] = ... と代入する）"""
+    tello_mod = types.ModuleType("djitellopy.tello")
+    tello_mod.drones = {host: {"responses": [], "state": {}}}
+    pkg = types.ModuleType("djitellopy")
+    pkg.tello = tello_mod
+    monkeypatch.setitem(sys.modules, "djitellopy", pkg)
+    monkeypatch.setitem(sys.modules, "djitellopy.tello", tello_mod)
+    return tello_mod.drones
+
+
+def test_push_mode_parses_each_packet_without_a_thread(monkeypatch):
+    host = "192.168.10.1"
+    drones = _fake_djitellopy(monkeypatch, host)
+    tello = types.SimpleNamespace(address=(host, 8889))
+    cache = TelemetryCache(lambda: drones[host]["state"], subscribe=djitellopy_state_hook(tello))
+    seen = []
+    cache.on_packet = lambda st, t: seen.append(st["h"])
+    cache.start()
+    try:
+        assert cache.mode == "push" and cache._thread is None
+        for h in (10, 20, 30):
+            drones[host]["state"] = {"h": h, "bat": 80, "yaw": 5}
+        assert cache.packets == 3 and seen == [10, 20, 30]
+        assert cache.latest.height == 30 and cache.latest.battery == 80
+    finally:
+        cache.stop()
+    # 外したら元の dict に戻る
+    assert type(drones[host]) is dict
+    drones[host]["state"] = {"h": 40}
+    assert cache.packets == 3
+
+
+def test_callback_errors_do_not_reach_the_receiver(monkeypatch):
+    host = "192.168.10.1"
+    drones = _fake_djitellopy(monkeypatch, host)
+    tello = types.SimpleNamespace(address=(host, 8889))
+    cache = TelemetryCache(lambda: None, subscribe=djitellopy_state_hook(tello))
+    cache.on_packet = lambda st, t: 1 / 0
+    cache.start()
+    try:
+        drones[host]["state"] = {"h": 1}   # 例外が出ると djitellopy の受信ループが止まる
+        assert cache.packets == 1
+    finally:
+        cache.stop()
+
+
+def test_falls_back_to_polling_without_djitellopy_internals():
+    states = [{"h": 1}]
+    cache = TelemetryCache(lambda: states[-1], poll_sec=0.001,
+                           subscribe=djitellopy_state_hook(types.SimpleNamespace()))
+    cache.start()
+    try:
+        assert cache.mode == "poll"
+        t_end = time.perf_counter() + 1.0
+        while cache.packets == 0 and time.perf_counter() < t_end:
+            time.sleep(0.005)
+        assert cache.latest.height == 1
+    finally:
+        cache.stop()
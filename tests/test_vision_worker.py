@@ -0,0 +1,52 @@
+# test_vision_worker.py
+import time
+
+import numpy as np
+
+from frame_ring import FrameRing
+from vision_worker import VisionWorker
+
+
+class _SlowDetector:
+    """process() の間に writes 枚のフレームがリングに書かれる（遅い検出の再現）"""
+
+    def __init__(self, ring, writes):
+        self.ring = ring
+        self.writes = writes
+        self.track_id = None
+        self.calls = 0
+
+    def process(self, frame, draw=False):
+        self.calls += 1
+        for _ in range(self.writes):
+            self.ring.write(np.full((8, 8, 3), 200, dtype=np.uint8))
+        return frame, np.array([[3]]), [np.zeros((1, 4, 2), dtype=np.float32)]
+
+    def get_marker_info(self, ids, corners, target_id=None):
+        return {"id": 3, "center": (0.0, 0.0), "size_px": 1.0, "skew": 0.0}
+
+
+def _run_once(writes):
+    ring = FrameRing(n_slots=4)
+    det = _SlowDetector(ring, writes)
+    vw = VisionWorker(None, det, ring=ring)
+    ring.write(np.zeros((8, 8, 3), dtype=np.uint8))
+    vw.start()
+    t_end = time.perf_counter() + 2.0
+    while det.calls == 0 and time.perf_counter() < t_end:
+        time.sleep(0.01)
+    vw.stop()
+    return vw
+
+
+def test_result_published_when_slot_survives():
+    vw = _run_once(writes=1)
+    seq, res = vw.slot.get()
+    assert seq >= 1 and res["frame_seq"] >= 1
+    assert vw.overrun == 0
+
+
+def test_result_dropped_when_slot_overwritten():
+    vw = _run_once(writes=4)   # n_slots 周したのでスロットは上書き済み
+    assert vw.overrun >= 1 and vw.overrun == vw.detector.calls
+    assert vw.slot.get() == (0, None)